@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ai_webgen.settings')
 
 application = get_wsgi_application()
+
+# Periodic retention sweep inside the web process (SWEEP_INTERVAL_SECONDS, off by default)
+from generator.retention import start_scheduler  # noqa: E402
+
+start_scheduler()
+
+# Webhook deliveries and their retries (WEBHOOK_POLL_SECONDS)
+from generator.webhooks import start_dispatcher  # noqa: E402
+
+start_dispatcher()
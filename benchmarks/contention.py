@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Measure database write contention under parallel generate_api load.
+
+Runs the in-process load test once per SQLite configuration, each in its own
+subprocess so the settings are read fresh: "tuned" (WAL, synchronous=NORMAL,
+busy timeout, mmap, IMMEDIATE transactions) and "default" (SQLITE_TUNING=False,
+rollback journal). Every virtual user generates a site against an instant stub
+LLM and then downloads it several times, so the run is dominated by site
+inserts/updates and download counter increments. Reports committed writes
+per second and "database is locked" failures per variant.
+
+Usage:
+    python -m benchmarks.contention --users 16 --iterations 10
+    python -m benchmarks.contention --variants tuned --output contention.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from .loadtest import BENCH_PROMPTS, REPORT_SCHEMA, InProcessTarget, Recorder
+from .stub_llm import StubConfig, start_stub_server
+
+VARIANTS = {
+    'tuned': {'SQLITE_TUNING': 'True'},
+    'default': {'SQLITE_TUNING': 'False'},
+}
+
+# Database writes issued by one successful scenario call
+WRITES_PER_CALL = {
+    'generate_api': 4,   # insert, usage/status update, archive path, stage timings
+    'download_site': 1,  # downloads_count increment
+}
+
+
+def run_worker(users, iterations, downloads):
+    """Run one variant in this process and return its measurements"""
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    stub = start_stub_server(StubConfig(ttfb=0, tokens_per_second=0, completion_tokens=1500, jitter=0))
+    target = InProcessTarget(stub.base_url)
+    recorder = Recorder()
+    try:
+        clients = target.setup(users)
+        from django.db import connection, connections
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+
+        def virtual_user(index, client):
+            for iteration in range(iterations):
+                prompt = BENCH_PROMPTS[(index + iteration) % len(BENCH_PROMPTS)]
+                site_id = recorder.timed('generate_api', target.generate, client, prompt)
+                if site_id is None:
+                    continue
+                for _ in range(downloads):
+                    recorder.timed('download_site', target.download, client, site_id)
+            connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=users, thread_name_prefix='writer') as pool:
+            for future in [pool.submit(virtual_user, index, client) for index, client in enumerate(clients)]:
+                future.result()
+        elapsed = time.perf_counter() - started
+    finally:
+        target.teardown()
+        stub.shutdown()
+
+    scenarios, overall = recorder.summary(elapsed)
+    writes = sum(
+        (stats['requests'] - stats['errors']) * WRITES_PER_CALL.get(name, 0)
+        for name, stats in scenarios.items()
+    )
+    locked = sum(
+        count for stats in scenarios.values()
+        for detail, count in stats.get('error_details', {}).items() if 'locked' in detail.lower()
+    )
+    return {
+        'journal_mode': journal_mode,
+        'elapsed_s': round(elapsed, 3),
+        'writes': writes,
+        'writes_per_second': round(writes / elapsed, 1) if elapsed else None,
+        'lock_errors': locked,
+        'scenarios': scenarios,
+        'overall': overall,
+    }
+
+
+def run_variant(name, args):
+    """Run one variant in a fresh interpreter with its environment applied"""
+    env = dict(os.environ, **VARIANTS[name])
+    # The app logs to stdout, so results come back through a file
+    with tempfile.NamedTemporaryFile('r', suffix='.json') as results:
+        command = [
+            sys.executable, '-m', 'benchmarks.contention', '--worker', results.name,
+            '--users', str(args.users), '--iterations', str(args.iterations), '--downloads', str(args.downloads),
+        ]
+        completed = subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"{name} variant failed:\n{completed.stderr}")
+        return json.load(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare SQLite write throughput with and without WAL tuning')
+    parser.add_argument('--users', type=int, default=16, help='concurrent writers')
+    parser.add_argument('--iterations', type=int, default=10, help='generations per writer')
+    parser.add_argument('--downloads', type=int, default=3, help='downloads of each generated site')
+    parser.add_argument('--variants', default='tuned,default', help='comma-separated: ' + ', '.join(VARIANTS))
+    parser.add_argument('--output', help='write the JSON report here (default: stdout)')
+    parser.add_argument('--worker', metavar='RESULTS_FILE', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        result = run_worker(args.users, args.iterations, args.downloads)
+        with open(args.worker, 'w') as f:
+            json.dump(result, f)
+        return 0
+
+    names = [name.strip() for name in args.variants.split(',') if name.strip()]
+    unknown = [name for name in names if name not in VARIANTS]
+    if unknown:
+        parser.error(f"unknown variant(s): {', '.join(unknown)}")
+
+    results = {}
+    for name in names:
+        print(f"⏱️ Running {name} variant...", file=sys.stderr)
+        results[name] = run_variant(name, args)
+
+    report = {
+        'schema': REPORT_SCHEMA,
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'config': {'users': args.users, 'iterations': args.iterations, 'downloads': args.downloads},
+        'variants': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f"📊 Report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    print(f"{'variant':<10}{'journal':>10}{'writes/s':>11}{'p95 gen':>10}{'lock errs':>11}", file=sys.stderr)
+    for name, result in results.items():
+        p95 = result['scenarios'].get('generate_api', {}).get('p95_s')
+        print(f"{name:<10}{result['journal_mode']:>10}{result['writes_per_second'] or 0:>11}"
+              f"{p95 if p95 is not None else '-':>10}{result['lock_errors']:>11}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
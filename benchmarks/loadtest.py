@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Load test the generator without calling OpenAI.
+
+In-process mode (the default) boots Django against a throwaway test
+database, points ai_service at a local stub LLM server and drives
+generate_api, dashboard and download_site through django.test.Client from
+concurrent virtual users. With --url it drives a running server over HTTP
+instead; start that server with OPENAI_BASE_URL pointing at
+`python -m benchmarks.stub_llm`.
+
+The JSON report (throughput, p50/p95/p99 and error rate per scenario) is
+meant to be kept per release and compared with --baseline.
+
+Usage:
+    python -m benchmarks.loadtest --users 8 --iterations 5 --output report.json
+    python -m benchmarks.loadtest --users 8 --duration 60 --baseline report.json
+    python -m benchmarks.loadtest --url http://localhost:8000 --sessionid <cookie>
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from datetime import datetime, timezone
+
+from .stub_llm import add_stub_arguments, start_stub_server, stub_config_from_args
+
+REPORT_SCHEMA = 1
+
+BENCH_PROMPTS = [
+    "Create a landing page for a coffee shop called Bean There with a menu and opening hours",
+    "Build a portfolio website for a wedding photographer with a gallery and contact form",
+    "Make a website for a family restaurant named Casa Verde with reservations",
+    "Create a site for a boutique fitness gym with class schedules and trainer bios",
+    "Build a landing page for a software consulting firm with services and case studies",
+    "Create a website for a hair salon called Glow with prices and booking",
+]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class Recorder:
+    """Thread-safe latency and error log per scenario"""
+
+    def __init__(self):
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, scenario, seconds, ok, detail=None):
+        with self._lock:
+            entry = self._samples.setdefault(scenario, {'latencies': [], 'errors': 0, 'error_details': {}})
+            entry['latencies'].append(seconds)
+            if not ok:
+                entry['errors'] += 1
+                key = str(detail)[:120]
+                entry['error_details'][key] = entry['error_details'].get(key, 0) + 1
+
+    def timed(self, scenario, func, *args):
+        started = time.perf_counter()
+        try:
+            ok, detail, result = func(*args)
+        except Exception as exc:
+            ok, detail, result = False, f"{type(exc).__name__}: {exc}", None
+        self.record(scenario, time.perf_counter() - started, ok, detail)
+        return result if ok else None
+
+    def summary(self, elapsed):
+        scenarios = {}
+        total_requests = total_errors = 0
+        for name, entry in sorted(self._samples.items()):
+            latencies = entry['latencies']
+            count = len(latencies)
+            total_requests += count
+            total_errors += entry['errors']
+            scenarios[name] = {
+                'requests': count,
+                'errors': entry['errors'],
+                'error_rate': round(entry['errors'] / count, 4) if count else 0.0,
+                'throughput_rps': round(count / elapsed, 3) if elapsed else 0.0,
+                'mean_s': round(sum(latencies) / count, 4) if count else None,
+                'p50_s': _rounded(percentile(latencies, 50)),
+                'p95_s': _rounded(percentile(latencies, 95)),
+                'p99_s': _rounded(percentile(latencies, 99)),
+                'max_s': _rounded(max(latencies) if latencies else None),
+                'error_details': entry['error_details'],
+            }
+        return scenarios, {
+            'requests': total_requests,
+            'errors': total_errors,
+            'error_rate': round(total_errors / total_requests, 4) if total_requests else 0.0,
+            'throughput_rps': round(total_requests / elapsed, 3) if elapsed else 0.0,
+            'elapsed_s': round(elapsed, 3),
+        }
+
+
+def _rounded(value):
+    return round(value, 4) if value is not None else None
+
+
+class InProcessTarget:
+    """Runs the Django app in this process against a throwaway test database"""
+
+    def __init__(self, stub_base_url, db_file=None):
+        self.stub_base_url = stub_base_url
+        self.db_file = db_file
+        self._teardown = []
+
+    def setup(self, users):
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ai_webgen.settings')
+        import django
+        django.setup()
+
+        from django.conf import settings
+        from django.db import connection
+        from django.test.utils import setup_test_environment, teardown_test_environment, override_settings
+
+        setup_test_environment()
+        self._teardown.append(teardown_test_environment)
+
+        # A file database: SQLite's in-memory shared cache uses table-level locks
+        # that would show up as errors no real deployment has.
+        db_file = self.db_file or os.path.join(tempfile.mkdtemp(prefix='aiwebgen-bench-db-'), 'bench.sqlite3')
+        settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = db_file
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        self._teardown.append(lambda: connection.creation.destroy_test_db(old_name, verbosity=0))
+
+        media_root = tempfile.mkdtemp(prefix='aiwebgen-bench-media-')
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        self._teardown.append(media_override.disable)
+
+        from generator import ai_service
+        ai_service.configure_client('stub-key', self.stub_base_url)
+
+        return [self._make_client(index) for index in range(users)]
+
+    def _make_client(self, index):
+        from django.contrib.auth.models import User
+        from django.test import Client
+        from django.utils import timezone as dj_timezone
+        from generator.models import UserProfile
+
+        user = User.objects.create_user(username=f'bench_user_{index}', password='bench-password')
+        UserProfile.objects.update_or_create(user=user, defaults={
+            'subscription_plan': 'enterprise',
+            'subscription_expires': dj_timezone.now() + dj_timezone.timedelta(days=30),
+            'free_websites_remaining': 1_000_000,
+            'email_verified': True,
+        })
+        client = Client(raise_request_exception=False)
+        client.force_login(user)
+        return client
+
+    def generate(self, client, prompt):
+        response = client.post('/generator/generate/', {'prompt': prompt}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        if response.status_code != 200:
+            return False, f"HTTP {response.status_code}", None
+        return True, None, response.json()['site_id']
+
+    def dashboard(self, client):
+        response = client.get('/dashboard/')
+        return response.status_code == 200, f"HTTP {response.status_code}", None
+
+    def download(self, client, site_id):
+        response = client.get(f'/download/{site_id}/')
+        if response.status_code != 200:
+            return False, f"HTTP {response.status_code}", None
+        # Drain streamed responses so the full transfer is timed
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        else:
+            response.content
+        return True, None, None
+
+    def teardown(self):
+        while self._teardown:
+            self._teardown.pop()()
+
+
+class HttpTarget:
+    """Drives an already running server over HTTP"""
+
+    def __init__(self, base_url, sessionid=None):
+        self.base_url = base_url.rstrip('/')
+        self.sessionid = sessionid
+
+    def setup(self, users):
+        import requests
+        sessions = []
+        for _ in range(users):
+            session = requests.Session()
+            if self.sessionid:
+                session.cookies.set('sessionid', self.sessionid)
+            sessions.append(session)
+        return sessions
+
+    def generate(self, session, prompt):
+        response = session.post(f'{self.base_url}/generator/generate/', data={'prompt': prompt},
+                                headers={'X-Requested-With': 'XMLHttpRequest'}, timeout=300)
+        if response.status_code != 200:
+            return False, f"HTTP {response.status_code}", None
+        return True, None, response.json()['site_id']
+
+    def dashboard(self, session):
+        if not self.sessionid:
+            return True, None, None
+        response = session.get(f'{self.base_url}/dashboard/', allow_redirects=False, timeout=60)
+        return response.status_code == 200, f"HTTP {response.status_code}", None
+
+    def download(self, session, site_id):
+        response = session.get(f'{self.base_url}/download/{site_id}/', stream=True, timeout=60)
+        for _ in response.iter_content(64 * 1024):
+            pass
+        return response.status_code == 200, f"HTTP {response.status_code}", None
+
+    def teardown(self):
+        pass
+
+
+def run_virtual_user(target, client, index, recorder, iterations, deadline, think_time):
+    iteration = 0
+    while True:
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+        if deadline is None and iteration >= iterations:
+            break
+        prompt = BENCH_PROMPTS[(index + iteration) % len(BENCH_PROMPTS)]
+        site_id = recorder.timed('generate_api', target.generate, client, prompt)
+        recorder.timed('dashboard', target.dashboard, client)
+        if site_id is not None:
+            recorder.timed('download_site', target.download, client, site_id)
+        iteration += 1
+        if think_time:
+            time.sleep(think_time)
+    if isinstance(target, InProcessTarget):
+        from django.db import connections
+        connections.close_all()
+
+
+def run_load(target, users, iterations, duration, think_time):
+    clients = target.setup(users)
+    recorder = Recorder()
+    deadline = time.monotonic() + duration if duration else None
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users, thread_name_prefix='vu') as pool:
+        futures = [
+            pool.submit(run_virtual_user, target, client, index, recorder, iterations, deadline, think_time)
+            for index, client in enumerate(clients)
+        ]
+        for future in futures:
+            future.result()
+    return recorder, time.perf_counter() - started
+
+
+def compare_reports(baseline, current):
+    """Human-readable p95/throughput/error deltas between two reports"""
+    lines = [f"{'scenario':<16}{'p95 before':>12}{'p95 after':>12}{'Δp95':>9}{'rps before':>12}{'rps after':>12}{'err after':>11}"]
+    for name, after in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        delta = ''
+        if before.get('p95_s') and after.get('p95_s'):
+            delta = f"{(after['p95_s'] - before['p95_s']) / before['p95_s'] * 100:+.1f}%"
+        lines.append(
+            f"{name:<16}{before.get('p95_s') or 0:>12.4f}{after.get('p95_s') or 0:>12.4f}{delta:>9}"
+            f"{before.get('throughput_rps', 0):>12.3f}{after.get('throughput_rps', 0):>12.3f}{after.get('error_rate', 0):>11.2%}"
+        )
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the AI website generator against a stub LLM')
+    parser.add_argument('--users', type=int, default=4, help='concurrent virtual users')
+    parser.add_argument('--iterations', type=int, default=3, help='generate/dashboard/download loops per user')
+    parser.add_argument('--duration', type=float, default=0, help='run for N seconds instead of a fixed iteration count')
+    parser.add_argument('--think-time', type=float, default=0, help='pause between loops of one user')
+    parser.add_argument('--url', help='drive a running server instead of an in-process app')
+    parser.add_argument('--sessionid', help='session cookie for --url mode (enables the dashboard scenario)')
+    parser.add_argument('--db-file', help='file path for the in-process test database (default: a temp file)')
+    parser.add_argument('--output', help='write the JSON report here (default: stdout)')
+    parser.add_argument('--baseline', help='previous JSON report to compare against')
+    add_stub_arguments(parser)
+    args = parser.parse_args(argv)
+
+    # Failed requests are counted in the report; keep their tracebacks out of the output
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+    stub_config = stub_config_from_args(args)
+    stub = None
+    if args.url:
+        target = HttpTarget(args.url, args.sessionid)
+    else:
+        stub = start_stub_server(stub_config)
+        target = InProcessTarget(stub.base_url, args.db_file)
+
+    try:
+        recorder, elapsed = run_load(target, args.users, args.iterations, args.duration, args.think_time)
+    finally:
+        target.teardown()
+        if stub:
+            stub.shutdown()
+
+    scenarios, overall = recorder.summary(elapsed)
+    report = {
+        'schema': REPORT_SCHEMA,
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'config': {
+            'mode': 'http' if args.url else 'in-process',
+            'users': args.users,
+            'iterations': None if args.duration else args.iterations,
+            'duration_s': args.duration or None,
+            'think_time_s': args.think_time,
+            'stub': asdict(stub_config) if stub else None,
+        },
+        'scenarios': scenarios,
+        'overall': overall,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f"📊 Report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            print(compare_reports(json.load(f), report), file=sys.stderr)
+
+    return 0 if overall['requests'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Measure site packaging throughput with and without the packaging pool.
+
+Packages the same generated site (minify, precompress, zip) from many
+concurrent request threads, first inline on those threads and then through
+ProcessPoolExecutors of increasing size. Inline throughput is capped by the
+GIL; the pool should scale with the number of cores.
+
+Usage:
+    python -m benchmarks.packaging --concurrency 16 --sites 64
+    python -m benchmarks.packaging --workers 0,2,4,8
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .loadtest import BENCH_PROMPTS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare inline and pooled site packaging throughput')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent request threads')
+    parser.add_argument('--sites', type=int, default=64, help='sites packaged per variant')
+    parser.add_argument('--workers', help='comma-separated pool sizes, 0 = inline (default: 0 and 1..cpu count)')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ai_webgen.settings')
+    import django
+    django.setup()
+    from django.test import override_settings
+    from generator.ai_service import extract_embedded_assets, generate_fallback_website
+    from generator.packaging import _reset_pool, package_site
+
+    cpus = os.cpu_count() or 1
+    sizes = [int(w) for w in args.workers.split(',')] if args.workers else sorted({0, 1, cpus // 2 or 1, cpus})
+    html, css, js = extract_embedded_assets(generate_fallback_website(BENCH_PROMPTS[0]))
+    files = {'index.html': html * 8, 'styles.css': css * 8, 'script.js': js * 8}
+
+    print(f"{'workers':<10}{'archives/s':>12}{'speedup':>10}", file=sys.stderr)
+    baseline = None
+    for workers in sizes:
+        with override_settings(PACKAGING_WORKERS=workers):
+            package_site(files, '# README', True, False, True)  # Warm up the pool
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as threads:
+                list(threads.map(lambda _: package_site(files, '# README', True, False, True), range(args.sites)))
+            rate = args.sites / (time.perf_counter() - started)
+            _reset_pool()
+        baseline = baseline or rate
+        print(f"{workers or 'inline':<10}{rate:>12.1f}{rate / baseline:>9.2f}x", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Replay captured generation traffic against the stub LLM.
+
+Reads the "request" events written by generator.capture (including rotated
+files), scripts the stub server with each prompt's recorded completion
+size, time to first token and finish reason, and re-issues the requests to
+generate_api at their original inter-arrival times divided by --speed.
+
+Usage:
+    python -m benchmarks.replay capture/traffic.jsonl --speed 1
+    python -m benchmarks.replay capture/traffic.jsonl --speed 10 --users 16 --output replay.json
+"""
+
+import argparse
+import glob
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from datetime import datetime, timezone
+
+from .loadtest import REPORT_SCHEMA, HttpTarget, InProcessTarget, Recorder, compare_reports, percentile
+from .stub_llm import add_stub_arguments, start_stub_server, stub_config_from_args
+
+
+def load_capture(path):
+    """Request events from a capture log and its rotated backups, oldest first"""
+    # RotatingFileHandler keeps traffic.jsonl.1 (newest backup) .. .N (oldest)
+    backups = [name for name in glob.glob(f'{path}.*') if name.rsplit('.', 1)[-1].isdigit()]
+    backups.sort(key=lambda name: int(name.rsplit('.', 1)[-1]), reverse=True)
+    events = []
+    for filename in backups + [path]:
+        with open(filename, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('event') == 'request' and record.get('prompt'):
+                    events.append(record)
+    events.sort(key=lambda record: record['ts'])
+    return events
+
+
+def build_stub_script(events):
+    """Per-prompt stub overrides reproducing the recorded upstream behaviour"""
+    script = {}
+    for record in events:
+        timings = record.get('stage_timings') or {}
+        ttfb = timings.get('upstream_ttfb')
+        tokens = record.get('completion_tokens')
+        streaming = (timings.get('upstream_total') or 0) - (ttfb or 0)
+        script.setdefault(record['prompt'], []).append({
+            'completion_tokens': tokens,
+            'finish_reason': record.get('finish_reason') or None,
+            'ttfb': ttfb,
+            'tokens_per_second': tokens / streaming if tokens and streaming > 0 else None,
+            'error': record.get('status_code', 200) >= 500,
+        })
+    return script
+
+
+def replay(target, events, users, speed, recorder):
+    """Issue every event at its scheduled offset; returns schedule lag samples"""
+    clients = queue.Queue()
+    for client in target.setup(users):
+        clients.put(client)
+
+    lags = []
+    lags_lock = threading.Lock()
+    origin = events[0]['ts']
+    started = time.monotonic()
+
+    def fire(record, due):
+        client = clients.get()
+        try:
+            with lags_lock:
+                lags.append(max(0.0, time.monotonic() - due))
+            recorder.timed('generate_api', target.generate, client, record['prompt'])
+        finally:
+            clients.put(client)
+
+    with ThreadPoolExecutor(max_workers=users, thread_name_prefix='replay') as pool:
+        for record in events:
+            due = started + (record['ts'] - origin) / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, record, due)
+    return lags, time.monotonic() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay captured generation traffic against a stub LLM')
+    parser.add_argument('capture', help='capture log written with TRAFFIC_CAPTURE_ENABLED=true')
+    parser.add_argument('--speed', type=float, default=1.0, help='time compression factor (1 = real time)')
+    parser.add_argument('--users', type=int, default=8, help='maximum requests in flight')
+    parser.add_argument('--limit', type=int, help='replay only the first N requests')
+    parser.add_argument('--url', help='drive a running server instead of an in-process app')
+    parser.add_argument('--db-file', help='file path for the in-process test database (default: a temp file)')
+    parser.add_argument('--output', help='write the JSON report here (default: stdout)')
+    parser.add_argument('--baseline', help='previous JSON report to compare against')
+    add_stub_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.speed <= 0:
+        parser.error('--speed must be positive')
+    events = load_capture(args.capture)[:args.limit]
+    if not events:
+        print(f"❌ No request events found in {args.capture}", file=sys.stderr)
+        return 1
+
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    stub_config = stub_config_from_args(args)
+    stub = None
+    if args.url:
+        # The running server's upstream must be a stub started with this script
+        target = HttpTarget(args.url)
+    else:
+        stub = start_stub_server(stub_config, script=build_stub_script(events))
+        target = InProcessTarget(stub.base_url, args.db_file)
+
+    recorder = Recorder()
+    try:
+        lags, elapsed = replay(target, events, args.users, args.speed, recorder)
+    finally:
+        target.teardown()
+        if stub:
+            stub.shutdown()
+
+    scenarios, overall = recorder.summary(elapsed)
+    captured_span = events[-1]['ts'] - events[0]['ts']
+    report = {
+        'schema': REPORT_SCHEMA,
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'config': {
+            'mode': 'replay-http' if args.url else 'replay-in-process',
+            'capture': args.capture,
+            'requests': len(events),
+            'captured_span_s': round(captured_span, 3),
+            'speed': args.speed,
+            'users': args.users,
+            'stub': asdict(stub_config) if stub else None,
+        },
+        'scenarios': scenarios,
+        'overall': overall,
+        'schedule_lag': {
+            'p50_s': round(percentile(lags, 50) or 0, 4),
+            'p95_s': round(percentile(lags, 95) or 0, 4),
+            'max_s': round(max(lags) if lags else 0, 4),
+        },
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f"📊 Replay report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+    if args.baseline:
+        with open(args.baseline) as f:
+            print(compare_reports(json.load(f), report), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Compare single-completion and section-parallel generation latency.
+
+Calls generate_website_code() directly against the stub LLM, first with
+GENERATION_MODE='single' and then 'sections'. The stub streams at a fixed
+per-stream token rate and splits a page evenly over the parts of a
+sectioned request, so the sections mode should approach
+ttfb + outline + page_tokens / (parts * rate) per site.
+
+Usage:
+    python -m benchmarks.sections --sites 5 --ttfb 0.4 --tokens-per-second 250
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from .loadtest import BENCH_PROMPTS
+from .stub_llm import add_stub_arguments, start_stub_server, stub_config_from_args
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare single and section-parallel generation latency')
+    parser.add_argument('--sites', type=int, default=5, help='sites generated per mode')
+    parser.add_argument('--workers', type=int, default=6, help='SECTION_WORKERS for the sections mode')
+    add_stub_arguments(parser)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ai_webgen.settings')
+    import django
+    django.setup()
+    from django.test import override_settings
+    from generator import ai_service
+    from generator.metrics import StageTimer
+
+    stub = start_stub_server(stub_config_from_args(args))
+    ai_service.configure_client('stub', stub.base_url)
+
+    print(f"{'mode':<10}{'median s':>10}{'plan s':>9}{'tokens':>9}{'speedup':>10}", file=sys.stderr)
+    baseline = None
+    for mode in ('single', 'sections'):
+        durations, plans, tokens = [], [], []
+        with override_settings(GENERATION_MODE=mode, SECTION_WORKERS=args.workers):
+            for index in range(args.sites):
+                usage, timings = {}, StageTimer()
+                started = time.perf_counter()
+                code = ai_service.generate_website_code(BENCH_PROMPTS[index % len(BENCH_PROMPTS)],
+                                                        usage=usage, timings=timings)
+                durations.append(time.perf_counter() - started)
+                if code.startswith('Error:'):
+                    print(f"❌ {mode}: {code}", file=sys.stderr)
+                    return 1
+                plans.append(timings.stages.get('upstream_plan', 0.0))
+                tokens.append(usage.get('completion_tokens', 0))
+        median = statistics.median(durations)
+        baseline = baseline or median
+        print(f"{mode:<10}{median:>10.2f}{statistics.median(plans):>9.2f}{statistics.median(tokens):>9.0f}"
+              f"{baseline / median:>9.2f}x", file=sys.stderr)
+    stub.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Count the database work sessions add to the request path.
+
+Runs the same authenticated requests once per SESSION_BACKEND, each in its
+own subprocess so the settings are read fresh:
+
+- page_view: GET /dashboard/ as a logged-in user
+- flash: POST /contact/, which sets a flash message, and the redirected GET
+  that shows it
+
+For each scenario it reports the queries per HTTP request, how many of them
+read or write django_session, and latency. With `db` every authenticated
+request reads the session row. `cached_db` serves those reads from the cache
+(this run uses the in-process cache, production uses Redis), and
+`signed_cookies` never touches the database.
+
+Usage:
+    python -m benchmarks.sessions --requests 200
+    python -m benchmarks.sessions --variants db,signed_cookies --output sessions.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from .loadtest import REPORT_SCHEMA, InProcessTarget
+
+VARIANTS = {
+    'db': {'SESSION_BACKEND': 'db'},
+    'cached_db': {'SESSION_BACKEND': 'cached_db'},
+    'cache': {'SESSION_BACKEND': 'cache'},
+    'signed_cookies': {'SESSION_BACKEND': 'signed_cookies'},
+}
+
+# Never called: these scenarios make no LLM requests
+UNUSED_LLM_URL = 'http://127.0.0.1:9/v1'
+
+
+def page_view(client):
+    """One authenticated page view; returns the number of HTTP requests made"""
+    response = client.get('/dashboard/')
+    if response.status_code != 200:
+        raise RuntimeError(f"/dashboard/ answered HTTP {response.status_code}")
+    return 1
+
+
+def flash(client):
+    """Set a flash message and show it on the redirected page"""
+    response = client.post('/contact/', {'name': 'Bench', 'email': 'bench@example.com', 'subject': 'Hello',
+                                         'message': 'Just measuring.'}, follow=True)
+    if response.status_code != 200 or not list(response.context['messages']):
+        raise RuntimeError("The flash message did not survive the redirect")
+    return 2
+
+
+SCENARIOS = {'page_view': page_view, 'flash': flash}
+
+
+def measure(client, scenario, iterations):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    scenario(client)  # Warm-up: the first request may fill the session cache
+    latencies = []
+    http_requests = queries = session_reads = session_writes = 0
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            http_requests += scenario(client)
+            latencies.append(time.perf_counter() - started)
+        for query in captured:
+            queries += 1
+            if 'django_session' in query['sql']:
+                if query['sql'].lstrip().upper().startswith('SELECT'):
+                    session_reads += 1
+                else:
+                    session_writes += 1
+    return {
+        'http_requests': http_requests,
+        'queries_per_request': round(queries / http_requests, 2),
+        'session_reads_per_request': round(session_reads / http_requests, 2),
+        'session_writes_per_request': round(session_writes / http_requests, 2),
+        'p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+    }
+
+
+def run_worker(iterations):
+    """Run one variant in this process and return its measurements"""
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    target = InProcessTarget(UNUSED_LLM_URL)
+    try:
+        client, = target.setup(1)
+        from django.conf import settings
+        scenarios = {name: measure(client, scenario, iterations) for name, scenario in SCENARIOS.items()}
+        return {'session_engine': settings.SESSION_ENGINE, 'scenarios': scenarios}
+    finally:
+        target.teardown()
+
+
+def run_variant(name, args):
+    """Run one variant in a fresh interpreter with its environment applied"""
+    env = dict(os.environ, **VARIANTS[name])
+    # The app logs to stdout, so results come back through a file
+    with tempfile.NamedTemporaryFile('r', suffix='.json') as results:
+        command = [sys.executable, '-m', 'benchmarks.sessions', '--worker', results.name,
+                   '--requests', str(args.requests)]
+        completed = subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"{name} variant failed:\n{completed.stderr}")
+        return json.load(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the database queries of each session backend')
+    parser.add_argument('--requests', type=int, default=200, help='iterations of each scenario')
+    parser.add_argument('--variants', default=','.join(VARIANTS), help='comma-separated: ' + ', '.join(VARIANTS))
+    parser.add_argument('--output', help='write the JSON report here (default: stdout)')
+    parser.add_argument('--worker', metavar='RESULTS_FILE', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        result = run_worker(args.requests)
+        with open(args.worker, 'w') as f:
+            json.dump(result, f)
+        return 0
+
+    names = [name.strip() for name in args.variants.split(',') if name.strip()]
+    unknown = [name for name in names if name not in VARIANTS]
+    if unknown:
+        parser.error(f"unknown variant(s): {', '.join(unknown)}")
+
+    results = {}
+    for name in names:
+        print(f"⏱️ Running {name} variant...", file=sys.stderr)
+        results[name] = run_variant(name, args)
+
+    report = {
+        'schema': REPORT_SCHEMA,
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'config': {'requests': args.requests},
+        'variants': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f"📊 Report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    print(f"{'variant':<16}{'scenario':<11}{'queries/req':>12}{'session r/w':>13}{'p50 ms':>9}", file=sys.stderr)
+    for name, result in results.items():
+        for scenario, stats in result['scenarios'].items():
+            session = f"{stats['session_reads_per_request']}/{stats['session_writes_per_request']}"
+            print(f"{name:<16}{scenario:<11}{stats['queries_per_request']:>12}{session:>13}{stats['p50_ms']:>9}",
+                  file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+OpenAI-compatible stub server for offline benchmarking.
+
+Serves POST /v1/chat/completions (streaming and non-streaming) with a
+synthetic HTML page, so the generator can be load tested without spending
+API credits. Latency, output token rate, page size, truncation and error
+rates are configurable.
+
+Usage:
+    python -m benchmarks.stub_llm --port 8765 --ttfb 0.4 --tokens-per-second 250
+    OPENAI_API_KEY=stub OPENAI_BASE_URL=http://127.0.0.1:8765/v1 gunicorn ai_webgen.wsgi
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Rough size of one token of HTML, used to turn token counts into text
+CHARS_PER_TOKEN = 4
+
+
+@dataclass
+class StubConfig:
+    ttfb: float = 0.3                 # Seconds before the first token
+    tokens_per_second: float = 300.0  # Output rate once streaming; 0 means instant
+    completion_tokens: int = 3000     # Size of the generated page
+    jitter: float = 0.1               # +/- fraction applied to ttfb and completion size
+    truncate_rate: float = 0.0        # Share of responses cut off with finish_reason=length
+    error_rate: float = 0.0           # Share of requests answered with HTTP 500
+    chunk_tokens: int = 16            # Tokens per streamed chunk
+
+
+def synthetic_page(tokens: int) -> str:
+    """A complete HTML document of roughly `tokens` tokens"""
+    head = (
+        "<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n<meta charset=\"UTF-8\">\n"
+        "<title>Stub Site</title>\n<style>\nbody { font-family: sans-serif; margin: 0; }\n"
+        ".section { padding: 40px 20px; }\n.card { border-radius: 8px; padding: 16px; }\n</style>\n"
+        "</head>\n<body>\n"
+    )
+    tail = "<script>\ndocument.querySelectorAll('.card').forEach(c => c.classList.add('ready'));\n</script>\n</body>\n</html>"
+    section = (
+        "<section class=\"section\" id=\"s{index}\">\n  <h2>Section {index}</h2>\n"
+        "  <div class=\"card\"><p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, "
+        "sed do eiusmod tempor incididunt ut labore et dolore magna aliqua.</p></div>\n</section>\n"
+    )
+    body = []
+    budget = tokens * CHARS_PER_TOKEN - len(head) - len(tail)
+    index = 0
+    while budget > 0:
+        block = section.format(index=index)
+        body.append(block)
+        budget -= len(block)
+        index += 1
+    return head + ''.join(body) + tail
+
+
+def synthetic_fragment(tokens: int, index: int = 0) -> str:
+    """One section of a page (as generated in the 'sections' mode) of roughly `tokens` tokens"""
+    block = (
+        "<section class=\"part-{index}\" id=\"part-{index}\">\n  <div class=\"container\"><h2>Part {index}</h2>\n"
+        "  <p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor "
+        "incididunt ut labore et dolore magna aliqua.</p></div>\n</section>\n"
+    ).format(index=index)
+    style = f"<style>\n.part-{index} {{ padding: var(--space); }}\n</style>\n"
+    return style + block * max(1, (tokens * CHARS_PER_TOKEN - len(style)) // len(block))
+
+
+SYNTHETIC_OUTLINE = json.dumps({
+    'title': 'Stub Site',
+    'tokens': {'--color-primary': '#336699', '--font-body': 'sans-serif'},
+    'sections': [{'id': name, 'brief': f'The {name} section'} for name in ('header', 'hero', 'services', 'contact', 'footer')],
+})
+
+
+SYNTHETIC_SITE_MAP = json.dumps({
+    'title': 'Stub Site',
+    'tokens': {'--color-primary': '#336699'},
+    'pages': [{'slug': slug, 'title': title, 'brief': f'The {title} page'}
+              for slug, title in (('index', 'Home'), ('about', 'About'), ('services', 'Services'), ('contact', 'Contact'))],
+})
+
+# Reply to an edit request: one SEARCH/REPLACE block that fits any complete page
+SYNTHETIC_EDIT = (
+    "<<<<<<< SEARCH\n</body>\n=======\n<footer class=\"edited\">Edited by the stub</footer>\n</body>\n"
+    ">>>>>>> REPLACE"
+)
+
+
+def _split_tokens(text: str, tokens: int):
+    """Cut text into `tokens` roughly equal pieces"""
+    if tokens <= 0:
+        return []
+    size = max(1, len(text) // tokens)
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: StubConfig, script: dict = None):
+        super().__init__(address, StubHandler)
+        self.config = config
+        # Optional per-prompt overrides used by the replay tool:
+        # {prompt_text: [{"completion_tokens": .., "finish_reason": .., "ttfb": ..}, ...]}
+        # Repeated prompts cycle through their overrides in order.
+        self.script = {prompt: deque(overrides) for prompt, overrides in (script or {}).items() if overrides}
+        self.requests_served = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def plan_response(self, body: dict) -> dict:
+        """Decide size, latency and finish reason for one request"""
+        config = self.config
+        with self._lock:
+            self.requests_served += 1
+
+        plan = {
+            'error': random.random() < config.error_rate,
+            'ttfb': max(0.0, config.ttfb * random.uniform(1 - config.jitter, 1 + config.jitter)),
+            'completion_tokens': max(1, int(config.completion_tokens * random.uniform(1 - config.jitter, 1 + config.jitter))),
+            'finish_reason': 'length' if random.random() < config.truncate_rate else 'stop',
+            'tokens_per_second': config.tokens_per_second,
+        }
+        # Section-parallel generation: a short outline call, then each part is a share of the page
+        user_message = next((m.get('content') or '' for m in body.get('messages', []) if m.get('role') == 'user'), '')
+        part = re.search(r'\bpart (\d+) of (\d+)\b', user_message)
+        if 'JSON outline' in user_message:
+            plan['kind'] = 'outline'
+            plan['completion_tokens'] = len(SYNTHETIC_OUTLINE) // CHARS_PER_TOKEN
+        elif 'JSON site map' in user_message:
+            plan['kind'] = 'site_map'
+            plan['completion_tokens'] = len(SYNTHETIC_SITE_MAP) // CHARS_PER_TOKEN
+        elif 'Edit request:' in user_message:
+            plan['kind'] = 'edit'
+            plan['completion_tokens'] = len(SYNTHETIC_EDIT) // CHARS_PER_TOKEN
+        elif part:
+            plan['kind'] = 'part'
+            plan['part'] = int(part.group(1))
+            plan['completion_tokens'] = max(1, plan['completion_tokens'] // int(part.group(2)))
+
+        override = self._scripted_override(body) if self.script else None
+        if override:
+            plan.update({key: value for key, value in override.items() if key in plan and value is not None})
+
+        max_tokens = body.get('max_tokens') or body.get('max_completion_tokens')
+        if max_tokens and plan['completion_tokens'] > max_tokens:
+            plan['completion_tokens'] = max_tokens
+            plan['finish_reason'] = 'length'
+        prompt_chars = sum(len(m.get('content') or '') for m in body.get('messages', []))
+        plan['prompt_tokens'] = max(1, prompt_chars // CHARS_PER_TOKEN)
+        return plan
+
+    def _scripted_override(self, body: dict):
+        user_message = next((m.get('content') or '' for m in body.get('messages', []) if m.get('role') == 'user'), '')
+        # generate_website_code() embeds the prompt as "...website for: <prompt>\n"
+        match = re.search(r'website for: (.*)', user_message)
+        prompt = match.group(1).strip() if match else None
+        if prompt not in self.script:
+            prompt = next((key for key in self.script if key and key in user_message), None)
+        if prompt is None:
+            return None
+        with self._lock:
+            overrides = self.script[prompt]
+            override = overrides[0]
+            overrides.rotate(-1)
+        return override
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        plan = self.server.plan_response(body)
+
+        time.sleep(plan['ttfb'])
+        if plan['error']:
+            self._send_json(500, {'error': {'message': 'Stub upstream error', 'type': 'server_error'}})
+            return
+
+        if plan.get('kind') == 'outline':
+            text = SYNTHETIC_OUTLINE
+        elif plan.get('kind') == 'site_map':
+            text = SYNTHETIC_SITE_MAP
+        elif plan.get('kind') == 'edit':
+            text = SYNTHETIC_EDIT
+        elif plan.get('kind') == 'part':
+            text = synthetic_fragment(plan['completion_tokens'], plan['part'])
+        else:
+            text = synthetic_page(plan['completion_tokens'])
+        if plan['finish_reason'] == 'length':
+            text = text[:len(text) * 9 // 10]
+        usage = {
+            'prompt_tokens': plan['prompt_tokens'],
+            'completion_tokens': plan['completion_tokens'],
+            'total_tokens': plan['prompt_tokens'] + plan['completion_tokens'],
+        }
+        if body.get('stream'):
+            include_usage = (body.get('stream_options') or {}).get('include_usage')
+            self._stream(body, text, plan, usage if include_usage else None)
+        else:
+            self._pace(plan['completion_tokens'], plan['tokens_per_second'])
+            self._send_json(200, {
+                'id': f"chatcmpl-{uuid.uuid4().hex}",
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': body.get('model', 'stub'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': text},
+                    'finish_reason': plan['finish_reason'],
+                }],
+                'usage': usage,
+            })
+
+    def _pace(self, tokens: int, rate: float):
+        if rate > 0:
+            time.sleep(tokens / rate)
+
+    def _stream(self, body, text, plan, usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get('model', 'stub')
+
+        def chunk(choices, chunk_usage=None):
+            return {
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': created,
+                'model': model, 'choices': choices, 'usage': chunk_usage,
+            }
+
+        chunk_tokens = max(1, self.server.config.chunk_tokens)
+        pieces = _split_tokens(text, plan['completion_tokens'])
+        for start in range(0, len(pieces), chunk_tokens):
+            group = pieces[start:start + chunk_tokens]
+            self._pace(len(group), plan['tokens_per_second'])
+            self._write_event(chunk([{'index': 0, 'delta': {'content': ''.join(group)}, 'finish_reason': None}]))
+        self._write_event(chunk([{'index': 0, 'delta': {}, 'finish_reason': plan['finish_reason']}]))
+        if usage:
+            self._write_event(chunk([], usage))
+        self._write_raw(b'data: [DONE]\n\n')
+        self._write_raw(b'')
+
+    def _write_event(self, payload: dict):
+        self._write_raw(b'data: ' + json.dumps(payload).encode() + b'\n\n')
+
+    def _write_raw(self, data: bytes):
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_stub_server(config: StubConfig = None, host: str = '127.0.0.1', port: int = 0, script: dict = None) -> StubLLMServer:
+    """Start a stub server on a background thread; port 0 picks a free port"""
+    server = StubLLMServer((host, port), config or StubConfig(), script=script)
+    thread = threading.Thread(target=server.serve_forever, name='stub-llm', daemon=True)
+    thread.start()
+    return server
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser):
+    defaults = StubConfig()
+    parser.add_argument('--ttfb', type=float, default=defaults.ttfb, help='seconds before the first token')
+    parser.add_argument('--tokens-per-second', type=float, default=defaults.tokens_per_second)
+    parser.add_argument('--completion-tokens', type=int, default=defaults.completion_tokens)
+    parser.add_argument('--jitter', type=float, default=defaults.jitter)
+    parser.add_argument('--truncate-rate', type=float, default=defaults.truncate_rate)
+    parser.add_argument('--error-rate', type=float, default=defaults.error_rate)
+
+
+def stub_config_from_args(args) -> StubConfig:
+    return StubConfig(
+        ttfb=args.ttfb,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        jitter=args.jitter,
+        truncate_rate=args.truncate_rate,
+        error_rate=args.error_rate,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenAI-compatible stub server for benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    config = stub_config_from_args(args)
+    server = StubLLMServer((args.host, args.port), config)
+    print(f"🧪 Stub LLM listening on {server.base_url} with {asdict(config)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
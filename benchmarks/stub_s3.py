@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Minimal S3-compatible object store for local runs and tests.
+
+Implements the subset boto3 uses for archive storage with path-style
+addressing: PUT/GET/HEAD/DELETE of objects (buckets are created on first
+write), including presigned GETs with response-content-disposition.
+Signatures are not verified. Objects live in memory, or in --root.
+
+Usage:
+    python -m benchmarks.stub_s3 --port 9000
+    ARCHIVE_STORAGE=s3 ARCHIVE_S3_ENDPOINT_URL=http://127.0.0.1:9000 \\
+        ARCHIVE_S3_ACCESS_KEY_ID=stub ARCHIVE_S3_SECRET_ACCESS_KEY=stub python manage.py runserver
+"""
+
+import argparse
+import hashlib
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+class StubS3Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, root=None):
+        super().__init__(address, StubS3Handler)
+        self.root = Path(root) if root else None
+        self.objects = {}  # (bucket, key) -> bytes, when root is not set
+        self.requests_served = 0
+        self._lock = threading.Lock()
+
+    @property
+    def endpoint_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def put(self, bucket, key, data):
+        with self._lock:
+            if self.root:
+                path = self.root / bucket / key
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(data)
+            else:
+                self.objects[(bucket, key)] = data
+
+    def get(self, bucket, key):
+        with self._lock:
+            if self.root:
+                path = self.root / bucket / key
+                return path.read_bytes() if path.is_file() else None
+            return self.objects.get((bucket, key))
+
+    def delete(self, bucket, key):
+        with self._lock:
+            if self.root:
+                (self.root / bucket / key).unlink(missing_ok=True)
+            else:
+                self.objects.pop((bucket, key), None)
+
+
+class StubS3Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _target(self):
+        parts = urlsplit(self.path)
+        bucket, _, key = unquote(parts.path).lstrip('/').partition('/')
+        return bucket, key, parse_qs(parts.query)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        if 'aws-chunked' in (self.headers.get('Content-Encoding') or ''):
+            body = self._decode_aws_chunked(body)
+        return body
+
+    @staticmethod
+    def _decode_aws_chunked(body):
+        # <hex size>[;chunk-signature=..]\r\n<data>\r\n ... 0\r\n<trailers>
+        data, offset = bytearray(), 0
+        while True:
+            line_end = body.index(b'\r\n', offset)
+            size = int(body[offset:line_end].split(b';')[0], 16)
+            if size == 0:
+                return bytes(data)
+            data += body[line_end + 2:line_end + 2 + size]
+            offset = line_end + 2 + size + 2
+
+    def _send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _not_found(self, key):
+        body = f'<?xml version="1.0"?><Error><Code>NoSuchKey</Code><Key>{key}</Key></Error>'.encode()
+        self._send(404, body, {'Content-Type': 'application/xml'})
+
+    def do_PUT(self):
+        bucket, key, _ = self._target()
+        body = self._read_body()
+        self.server.requests_served += 1
+        if key:
+            self.server.put(bucket, key, body)
+        self._send(200, headers={'ETag': f'"{hashlib.md5(body).hexdigest()}"'})
+
+    def do_GET(self):
+        bucket, key, query = self._target()
+        self.server.requests_served += 1
+        data = self.server.get(bucket, key)
+        if data is None:
+            self._not_found(key)
+            return
+        headers = {
+            'Content-Type': 'application/zip',
+            'ETag': f'"{hashlib.md5(data).hexdigest()}"',
+            'Last-Modified': formatdate(usegmt=True),
+        }
+        if 'response-content-disposition' in query:
+            headers['Content-Disposition'] = query['response-content-disposition'][0]
+        self._send(200, data, headers)
+
+    do_HEAD = do_GET
+
+    def do_DELETE(self):
+        bucket, key, _ = self._target()
+        self.server.requests_served += 1
+        self.server.delete(bucket, key)
+        self._send(204)
+
+
+def start_stub_s3(host='127.0.0.1', port=0, root=None) -> StubS3Server:
+    """Start a stub object store on a background thread; port 0 picks a free port"""
+    server = StubS3Server((host, port), root=root)
+    threading.Thread(target=server.serve_forever, name='stub-s3', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Minimal S3-compatible object store')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--root', help='store objects in this directory instead of memory')
+    args = parser.parse_args()
+
+    server = StubS3Server((args.host, args.port), root=args.root)
+    print(f"🪣 Stub S3 listening on {server.endpoint_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,86 +1,256 @@
 #!/usr/bin/env python3
 """
 Python script to generate websites using your AI Website Generator API
+
+Single prompt:
+    python generate_website.py 'Build a landing page for a coffee shop'
+
+Batch mode (one prompt per line, or JSONL with {"prompt": ..., "keep_sources": true}):
+    python generate_website.py --batch prompts.txt --parallel 8 --output sites/
 """
 
-import requests
-import sys
+import argparse
+import hashlib
+import json
 import os
+import sys
+import threading
+import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+SERVER_URL = os.getenv("AIWEBGEN_URL", "http://localhost:8000")
+API_PATH = "/generator/generate/"
+CHUNK_SIZE = 64 * 1024
+# Generation is not idempotent, so it is only retried when the server says it never started
+RETRYABLE_GENERATE_STATUSES = {429, 503}
+
+_print_lock = threading.Lock()
+
 
-API_URL = "http://localhost:8000/generator/generate/"
+def log(message):
+    with _print_lock:
+        print(message, flush=True)
 
-def generate_website(prompt):
+
+def make_session(parallel):
+    """One pooled session shared by all workers, with a connection per worker"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=parallel, pool_maxsize=parallel)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # Ask generate_api for JSON instead of the browser redirect
+    session.headers["X-Requested-With"] = "XMLHttpRequest"
+    return session
+
+
+def generate_website(session, server, prompt, keep_sources=None, retries=3, timeout=300):
     """Generate a website using the AI API"""
     data = {"prompt": prompt}
-    
-    try:
-        response = requests.post(API_URL, data=data)
+    if keep_sources is not None:
+        data["keep_sources"] = "true" if keep_sources else "false"
+
+    for attempt in range(retries + 1):
+        try:
+            response = session.post(server + API_PATH, data=data, timeout=timeout)
+        except requests.exceptions.ConnectTimeout:
+            response = None  # Never reached the server
+        else:
+            if response.status_code not in RETRYABLE_GENERATE_STATUSES:
+                break
+        if attempt == retries:
+            raise RuntimeError("Server busy" if response is not None else "Server unreachable")
+        time.sleep(_backoff(attempt, response.headers.get("Retry-After") if response is not None else None))
+
+    if response.status_code >= 400:
+        try:
+            message = response.json().get("error", response.text)
+        except ValueError:
+            message = response.text[:200]
+        raise RuntimeError(f"HTTP {response.status_code}: {message}")
+    return response.json()
+
+
+def wait_for_site(session, server, result, poll_interval=2.0, timeout=600):
+    """Poll the status endpoint until the final site is ready (past any pending or draft state)"""
+    status_url = server + result.get("status_url", f"/status/{result['site_id']}/")
+    status = result
+    deadline = time.monotonic() + timeout
+    delay = poll_interval
+    while status.get("status", "completed") in ("pending", "draft"):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Site {result['site_id']} still pending after {timeout}s")
+        time.sleep(delay)
+        delay = min(delay * 1.5, 15)
+        response = session.get(status_url, timeout=30)
         response.raise_for_status()
-        
-        result = response.json()
-        print(f"✅ Website generated successfully!")
-        print(f"📁 Site ID: {result['site_id']}")
-        print(f"📥 Download URL: {result['download_url']}")
-        
-        return result
-        
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Error generating website: {e}")
-        return None
-
-def download_and_extract(site_id, download_url):
+        status = response.json()
+    if status["status"] != "completed":
+        raise RuntimeError(f"Generation {status['status']}")
+    if "archive_sha256" not in status:
+        # The generate response has no checksum; the status endpoint does
+        response = session.get(status_url, timeout=30)
+        if response.ok:
+            status = dict(result, **response.json())
+    return status
+
+
+def download_file(session, url, path, expected_sha256=None, retries=5):
+    """
+    Stream a download to `path` in chunks. Interrupted transfers resume from
+    the bytes already on disk (Range + If-Range), and the finished file is
+    checked against the archive's SHA-256 before it is moved into place.
+    """
+    partial = path + ".part"
+    etag = None
+    for attempt in range(retries + 1):
+        offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+        headers = {}
+        if offset and etag:
+            headers = {"Range": f"bytes={offset}-", "If-Range": etag}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=(10, 60)) as response:
+                if response.status_code == 416:
+                    # The partial file no longer fits the archive: start over
+                    if os.path.exists(partial):
+                        os.remove(partial)
+                    continue
+                response.raise_for_status()
+                etag = response.headers.get("ETag", etag)
+                # 206 appends to what we have; a full 200 (no Range support, or the file changed) starts over
+                mode = "ab" if response.status_code == 206 else "wb"
+                with open(partial, mode) as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+            break
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == retries:
+                raise
+            log(f"🔁 Download interrupted ({e.__class__.__name__}), resuming...")
+            time.sleep(_backoff(attempt))
+    else:
+        raise RuntimeError(f"Download failed: the server rejected the requested range {retries + 1} times")
+
+    if expected_sha256:
+        digest = hashlib.sha256()
+        with open(partial, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        if digest.hexdigest() != expected_sha256:
+            os.remove(partial)
+            raise RuntimeError("Checksum mismatch, download discarded")
+    os.replace(partial, path)
+    return path
+
+
+def download_and_extract(session, server, status, output_dir=".", extract=True):
     """Download and extract the generated website"""
-    # Download the ZIP file
-    zip_url = f"http://localhost:8000{download_url}"
-    
-    try:
-        response = requests.get(zip_url)
-        response.raise_for_status()
-        
-        # Save ZIP file
-        zip_filename = f"generated_site_{site_id}.zip"
-        with open(zip_filename, 'wb') as f:
-            f.write(response.content)
-        
-        # Extract ZIP file
-        extract_dir = f"generated_site_{site_id}"
-        os.makedirs(extract_dir, exist_ok=True)
-        
-        with zipfile.ZipFile(zip_filename, 'r') as zip_ref:
-            zip_ref.extractall(extract_dir)
-        
-        print(f"📂 Website extracted to: {extract_dir}/")
-        print(f"🌐 Open {extract_dir}/index.html in your browser")
-        
-        return extract_dir
-        
-    except Exception as e:
-        print(f"❌ Error downloading website: {e}")
-        return None
-
-def main():
-    if len(sys.argv) < 2:
+    site_id = status["site_id"]
+    zip_filename = os.path.join(output_dir, f"generated_site_{site_id}.zip")
+    download_file(session, server + status["download_url"], zip_filename, status.get("archive_sha256"))
+
+    if not extract:
+        return zip_filename
+    extract_dir = os.path.join(output_dir, f"generated_site_{site_id}")
+    os.makedirs(extract_dir, exist_ok=True)
+    with zipfile.ZipFile(zip_filename, 'r') as zip_ref:
+        zip_ref.extractall(extract_dir)
+    return extract_dir
+
+
+def run_job(session, server, job, args):
+    """Generate, wait for and download one site"""
+    started = time.perf_counter()
+    result = generate_website(session, server, job["prompt"], job.get("keep_sources"),
+                              retries=args.retries, timeout=args.timeout)
+    status = wait_for_site(session, server, result, poll_interval=args.poll_interval, timeout=args.timeout)
+    location = download_and_extract(session, server, status, args.output, extract=not args.no_extract)
+    return result["site_id"], location, time.perf_counter() - started
+
+
+def read_jobs(path):
+    """Prompts from a text file (one per line) or JSONL ({"prompt": ..., "keep_sources": ...})"""
+    jobs = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                try:
+                    job = json.loads(line)
+                except ValueError as e:
+                    raise SystemExit(f"❌ {path}:{line_number}: invalid JSON ({e})")
+                if not job.get("prompt"):
+                    raise SystemExit(f"❌ {path}:{line_number}: missing \"prompt\"")
+                jobs.append(job)
+            else:
+                jobs.append({"prompt": line})
+    return jobs
+
+
+def _backoff(attempt, retry_after=None):
+    if retry_after and str(retry_after).isdigit():
+        return int(retry_after)
+    return min(2 ** attempt, 30)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate websites with the AI Website Generator API")
+    parser.add_argument("prompt", nargs="*", help="website prompt (single mode)")
+    parser.add_argument("--batch", metavar="FILE", help="file with one prompt per line, or JSONL")
+    parser.add_argument("--parallel", type=int, default=4, help="concurrent generations in batch mode")
+    parser.add_argument("--server", default=SERVER_URL, help=f"server base URL (default {SERVER_URL})")
+    parser.add_argument("--output", default=".", help="directory for the ZIPs and extracted sites")
+    parser.add_argument("--no-extract", action="store_true", help="keep the ZIPs without extracting them")
+    parser.add_argument("--retries", type=int, default=3, help="retries for busy servers and broken downloads")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds to wait for one generation")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="initial status polling interval")
+    args = parser.parse_args(argv)
+
+    if args.batch:
+        jobs = read_jobs(args.batch)
+    elif args.prompt:
+        jobs = [{"prompt": " ".join(args.prompt)}]
+    else:
         print("Usage: python generate_website.py 'Your website prompt here'")
+        print("       python generate_website.py --batch prompts.txt --parallel 8")
         print("\nExample prompts:")
         print("  'Create a portfolio website for a photographer'")
         print("  'Build a landing page for a coffee shop'")
         print("  'Make a simple blog layout with sidebar'")
-        sys.exit(1)
-    
-    prompt = " ".join(sys.argv[1:])
-    print(f"🤖 Generating website with prompt: '{prompt}'")
-    
-    # Generate website
-    result = generate_website(prompt)
-    if not result:
-        sys.exit(1)
-    
-    # Download and extract
-    extract_dir = download_and_extract(result['site_id'], result['download_url'])
-    if extract_dir:
-        print(f"\n🎉 Website generation complete!")
-        print(f"📁 Files saved in: {extract_dir}/")
+        return 1
+
+    os.makedirs(args.output, exist_ok=True)
+    server = args.server.rstrip("/")
+    parallel = max(1, min(args.parallel, len(jobs)))
+    session = make_session(parallel)
+    log(f"🤖 Generating {len(jobs)} website(s) with up to {parallel} in parallel")
+
+    failures = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        futures = {pool.submit(run_job, session, server, job, args): job for job in jobs}
+        for future in as_completed(futures):
+            prompt = futures[future]["prompt"]
+            try:
+                site_id, location, elapsed = future.result()
+            except Exception as e:
+                failures += 1
+                log(f"❌ '{prompt[:60]}': {e}")
+            else:
+                log(f"✅ Site {site_id} in {elapsed:.1f}s -> {location}")
+
+    elapsed = time.perf_counter() - started
+    log(f"\n🎉 {len(jobs) - failures}/{len(jobs)} websites generated in {elapsed:.1f}s")
+    if len(jobs) == 1 and not failures and not args.no_extract:
+        log("🌐 Open index.html in the extracted folder in your browser")
+    return 1 if failures else 0
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
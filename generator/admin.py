@@ -1,24 +1,177 @@
-from django.contrib import admin
-from .models import GeneratedSite, UserProfile, Suggestion, Payment
+"""
+Admin for tables that grow to millions of rows.
+
+LargeTableAdminMixin keeps a changelist page at a fixed number of cheap
+queries however big the table gets:
+
+- `list_select_related` joins the users shown in each row;
+- `list_defer` leaves heavy columns (generated_code, payloads) out of the
+  changelist query, and the change form still loads them;
+- EstimatedCountPaginator counts exactly up to ADMIN_EXACT_COUNT_LIMIT rows.
+  Beyond that an unfiltered PostgreSQL table reports the planner's estimate,
+  and a filtered list stops counting at the limit. show_full_result_count is
+  off, so there is no second unfiltered COUNT;
+- date_hierarchy and the default ordering run on created_at indexes;
+- raw_id_fields replaces <select>s that would list every user.
+
+Bulk actions on sites (rebuild archives, re-run failed generations) only
+queue background tasks, see background.py, so the admin request returns
+at once.
+"""
+
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from . import background
+from .ai_service import complete_generation, rebuild_archives
+from .models import GeneratedSite, UserProfile, Suggestion, Payment, Webhook, WebhookDelivery
+from .routers import ReplicaReadsAdminMixin
+from .usage import token_usage_by_plan, token_usage_for_user
+from .webhooks import redeliver
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Exact counts up to ADMIN_EXACT_COUNT_LIMIT; past it, the table estimate of
+    an unfiltered list. Without an estimate (filtered lists, other databases)
+    the full count is run, so every page stays reachable.
+    """
+
+    @cached_property
+    def count(self):
+        limit = settings.ADMIN_EXACT_COUNT_LIMIT
+        # COUNT(*) over a LIMITed subquery stops scanning at the limit
+        count = self.object_list.order_by()[:limit + 1].count()
+        if count <= limit:
+            return count
+        estimate = 0 if self.object_list.query.where else _estimated_rows(self.object_list)
+        return estimate if estimate > count else self.object_list.count()
+
+
+def _estimated_rows(queryset) -> int:
+    """The planner's row estimate for the queryset's table (PostgreSQL), else 0"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                       [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    return max(row[0], 0) if row else 0  # -1 until the table is first analyzed
+
+
+class LargeTableAdminMixin(ReplicaReadsAdminMixin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_defer = ()
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        match = request.resolver_match
+        if self.list_defer and match and match.url_name and match.url_name.endswith('_changelist'):
+            queryset = queryset.defer(*self.list_defer)
+        return queryset
+
+
+class FinishReasonFilter(admin.SimpleListFilter):
+    """Fixed choices: listing the distinct values would scan the whole table"""
+    title = 'finish reason'
+    parameter_name = 'finish_reason'
+
+    def lookups(self, request, model_admin):
+        return [('stop', 'stop'), ('length', 'length'), ('content_filter', 'content_filter'),
+                ('fallback', 'fallback (template page)')]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(finish_reason=self.value())
+        return queryset
 
 
 @admin.register(GeneratedSite)
-class GeneratedSiteAdmin(admin.ModelAdmin):
-    list_display = ['user', 'status', 'created_at', 'generation_time']
-    list_filter = ['status', 'created_at']
+class GeneratedSiteAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['user', 'status', 'business_type', 'created_at', 'generation_time', 'total_tokens']
+    list_filter = ['status', 'business_type', FinishReasonFilter, 'created_at']
+    list_select_related = ['user']
+    list_defer = ['generated_code', 'pages', 'stage_timings']
+    date_hierarchy = 'created_at'
     search_fields = ['user__username', 'prompt']
-    readonly_fields = ['created_at', 'generation_time']
+    raw_id_fields = ['user']
+    readonly_fields = ['created_at', 'generation_time', 'max_tokens', 'prompt_tokens',
+                       'completion_tokens', 'total_tokens', 'finish_reason']
+    actions = ['rebuild_selected_archives', 'rerun_failed_generations']
+
+    @admin.action(description="Rebuild archives of selected sites (background)")
+    def rebuild_selected_archives(self, request, queryset):
+        site_ids = list(queryset.filter(status__in=('draft', 'completed')).values_list('id', flat=True))
+        batch_size = settings.ADMIN_ACTION_BATCH_SIZE
+        for start in range(0, len(site_ids), batch_size):
+            background.submit(rebuild_archives, site_ids[start:start + batch_size])
+        self.message_user(request, f"Rebuilding {len(site_ids)} archives in the background.")
+
+    @admin.action(description="Re-run selected failed generations (background)")
+    def rerun_failed_generations(self, request, queryset):
+        rows = list(queryset.filter(status='failed').values_list('id', 'is_premium'))
+        GeneratedSite.objects.filter(id__in=[site_id for site_id, _ in rows], status='failed').update(status='pending')
+        for site_id, multipage in rows:
+            background.submit(complete_generation, site_id, multipage=multipage)
+        if rows:
+            self.message_user(request, f"Re-running {len(rows)} failed generations in the background.")
+        else:
+            self.message_user(request, "No failed generations selected.", level=messages.WARNING)
 
 
 @admin.register(UserProfile)
-class UserProfileAdmin(admin.ModelAdmin):
+class UserProfileAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['user', 'subscription_plan', 'websites_generated', 'free_websites_remaining']
     list_filter = ['subscription_plan', 'email_verified']
+    list_select_related = ['user']
     search_fields = ['user__username', 'user__email']
+    raw_id_fields = ['user']
+    readonly_fields = ['token_usage']
+
+    def changelist_view(self, request, extra_context=None):
+        # Token cost per plan above the list, see usage.token_usage_by_plan (cached)
+        extra_context = {'token_usage_by_plan': sorted(token_usage_by_plan().items()), **(extra_context or {})}
+        return super().changelist_view(request, extra_context)
+
+    @admin.display(description='Token usage')
+    def token_usage(self, profile):
+        usage = token_usage_for_user(profile.user_id)
+        return (f"{usage['total_tokens']:,} tokens over {usage['sites']:,} sites "
+                f"({usage['prompt_tokens']:,} prompt, {usage['completion_tokens']:,} completion)")
+
+
+@admin.register(Webhook)
+class WebhookAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['user', 'url', 'is_active', 'created_at']
+    list_filter = ['is_active']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+    search_fields = ['user__username', 'url']
+    readonly_fields = ['created_at']
+
+
+@admin.register(WebhookDelivery)
+class WebhookDeliveryAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['event', 'site_id', 'webhook', 'status', 'attempts', 'last_status_code', 'next_attempt_at']
+    list_filter = ['status', 'event']
+    list_select_related = ['webhook']
+    list_defer = ['payload', 'last_error']
+    readonly_fields = ['webhook', 'site', 'event', 'payload', 'attempts', 'last_status_code', 'last_error',
+                       'created_at', 'delivered_at']
+    actions = ['redeliver_selected']
+
+    @admin.action(description="Redeliver selected deliveries")
+    def redeliver_selected(self, request, queryset):
+        self.message_user(request, f"{redeliver(queryset)} deliveries queued again.")
 
 
 @admin.register(Suggestion)
-class SuggestionAdmin(admin.ModelAdmin):
+class SuggestionAdmin(ReplicaReadsAdminMixin, admin.ModelAdmin):
     list_display = ['title', 'name', 'suggestion_type', 'priority', 'status', 'created_at']
     list_filter = ['suggestion_type', 'priority', 'status', 'created_at']
     search_fields = ['title', 'name', 'email', 'description']
@@ -39,9 +192,13 @@ class SuggestionAdmin(admin.ModelAdmin):
 
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['user', 'amount', 'payment_method', 'status', 'transaction_id', 'created_at']
     list_filter = ['payment_method', 'status', 'subscription_plan', 'created_at']
+    list_select_related = ['user']
+    list_defer = ['qr_code_data']
+    date_hierarchy = 'created_at'
+    raw_id_fields = ['user']
     search_fields = ['user__username', 'transaction_id', 'payment_reference']
     readonly_fields = ['created_at', 'updated_at', 'qr_code_data']
     
@@ -1,7 +1,19 @@
-import os, zipfile
+import time
 from openai import OpenAI
 from django.conf import settings
-from pathlib import Path
+from django.db import transaction
+from django.db.models import Case, F, When
+from .archives import store_archive
+from .metrics import StageTimer, record_generation, upstream_fallbacks_total
+from .models import GeneratedSite, UserProfile
+from .usage import apply_usage, predict_max_tokens
+from .packaging import package_site
+from .capture import capture_upstream
+from .resilience import TRANSIENT_ERRORS, CircuitOpenError, call_upstream
+from .sections import generate_in_sections
+from .multipage import SHARED_SCRIPT, generate_multipage
+from .edits import EditError, edit_website_code
+from .webhooks import enqueue_event
 
 # Initialize OpenAI client with error handling
 try:
@@ -9,19 +21,48 @@ try:
         print("⚠️  Warning: OPENAI_API_KEY not found in settings. Website generation will use fallback.")
         client = None
     else:
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        # OPENAI_BASE_URL lets benchmarks point generation at a local stub server
+        # Retries are done by resilience.call_upstream, behind the circuit breaker
+        client = OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL,
+                        timeout=settings.UPSTREAM_TIMEOUT, max_retries=0)
         print("✅ OpenAI client initialized successfully")
 except Exception as e:
     print(f"❌ Error initializing OpenAI client: {e}")
     client = None
 
-def generate_website_code(prompt: str) -> str:
-  
+
+def configure_client(api_key: str, base_url: str = None):
+    """Re-point generation at another OpenAI-compatible endpoint (used by the benchmark suite)"""
+    global client
+    client = OpenAI(api_key=api_key, base_url=base_url, timeout=settings.UPSTREAM_TIMEOUT, max_retries=0)
+    return client
+
+
+@capture_upstream
+def generate_website_code(prompt: str, max_tokens: int = None, usage: dict = None, timings: StageTimer = None) -> str:
+    """
+    Generate a complete HTML page for the prompt.
+    If a `usage` dict is passed it is filled with the token accounting of the
+    call (max_tokens, prompt/completion/total tokens and finish_reason).
+    If a StageTimer is passed it receives the upstream_ttfb/upstream_total stages.
+    With GENERATION_MODE 'sections' the page is planned and its sections are
+    generated concurrently, see sections.py.
+    """
+    if usage is None:
+        usage = {}
+    if timings is None:
+        timings = StageTimer()
+    if max_tokens is None:
+        max_tokens = settings.MAX_COMPLETION_TOKENS
+
     # Check if OpenAI client is available
     if not client:
         return generate_fallback_website(prompt)
     
     try:
+        if settings.GENERATION_MODE == 'sections':
+            return generate_in_sections(prompt, _create_completion, max_tokens, usage, timings)
+
         # Enhanced system prompt for better website generation
         system_prompt = """You are an expert web developer that creates complete, professional websites. 
         Generate a full HTML page with embedded CSS and JavaScript that includes:
@@ -47,20 +88,19 @@ def generate_website_code(prompt: str) -> str:
         
         Generate the COMPLETE website code:"""
         
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": enhanced_prompt}
-            ],
-            temperature=0.7,
-            max_tokens=16384  # Increased from 1000 to 8000 for complete websites
-        )
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": enhanced_prompt}
+        ]
+        code, finish_reason = _create_completion(messages, max_tokens, usage, timings)
 
-        code = response.choices[0].message.content
+        # A predicted budget that turned out too small: retry once with the full budget
+        if finish_reason == 'length' and max_tokens < settings.MAX_COMPLETION_TOKENS:
+            print(f"Warning: Response truncated at predicted budget of {max_tokens} tokens, retrying with full budget")
+            code, finish_reason = _create_completion(messages, settings.MAX_COMPLETION_TOKENS, usage, timings)
         
         # Check if response was truncated and handle it
-        if response.choices[0].finish_reason == 'length':
+        if finish_reason == 'length':
             print("Warning: Response was truncated due to token limit")
             # Try to ensure we have at least a closing html tag
             if not code.strip().endswith('</html>'):
@@ -72,73 +112,339 @@ def generate_website_code(prompt: str) -> str:
         
         return code
 
+    except CircuitOpenError:
+        return _degraded_website(prompt, usage, 'circuit_open')
+    except TRANSIENT_ERRORS as e:
+        print(f"⚠️  Upstream failed after retries ({e.__class__.__name__}), serving the template fallback")
+        return _degraded_website(prompt, usage, 'upstream_error')
     except Exception as e:
         return f"Error: {str(e)}"
 
 
+def generate_site_pages(prompt: str, usage: dict = None, timings: StageTimer = None) -> dict:
+    """
+    Generate a multi-page site, see multipage.py. Returns {file name: HTML};
+    index.html carries the shared stylesheet and script. Without the AI
+    service, or while it is unavailable, the single template page is returned
+    as index.html; a failed call returns {'index.html': "Error: ..."}.
+    """
+    if usage is None:
+        usage = {}
+    if timings is None:
+        timings = StageTimer()
+    if not client:
+        return {'index.html': generate_fallback_website(prompt)}
+    try:
+        return generate_multipage(prompt, _create_completion, usage, timings)
+    except CircuitOpenError:
+        return {'index.html': _degraded_website(prompt, usage, 'circuit_open')}
+    except TRANSIENT_ERRORS as e:
+        print(f"⚠️  Upstream failed after retries ({e.__class__.__name__}), serving the template fallback")
+        return {'index.html': _degraded_website(prompt, usage, 'upstream_error')}
+    except Exception as e:
+        return {'index.html': f"Error: {str(e)}"}
+
+
+def edit_website(code: str, instruction: str, usage: dict = None, timings: StageTimer = None) -> str:
+    """
+    Apply an edit instruction to generated code with targeted patches instead
+    of a full regeneration, see edits.py. Raises EditError when the edit cannot
+    be applied, and the upstream errors of call_upstream when it is unavailable.
+    """
+    if not client:
+        raise EditError("Editing needs the AI service, which is not configured")
+    return edit_website_code(code, instruction, _create_completion, {} if usage is None else usage, timings)
 
-def save_website_as_zip(site_obj, code: str):
+
+def _degraded_website(prompt: str, usage: dict, reason: str) -> str:
+    """The template page, served while the upstream is unavailable; marked by finish_reason 'fallback'"""
+    upstream_fallbacks_total.inc(reason=reason)
+    usage['finish_reason'] = 'fallback'
+    return generate_fallback_website(prompt)
+
+
+def _create_completion(messages: list, max_tokens: int, usage: dict, timings: StageTimer):
     """
-    Save the generated HTML/CSS/JS code into a zip file and attach to GeneratedSite.
-    Creates a professional folder structure with separate files when possible.
+    Run one streamed chat completion, with retries behind the upstream circuit breaker.
+    Adds its token usage to `usage` and its time-to-first-token and total
+    time to `timings`. Returns (content, finish_reason).
     """
-    site_dir = Path(settings.MEDIA_ROOT) / "sites"
-    site_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Create a temporary directory for this site
-    temp_dir = site_dir / f"temp_{site_obj.id}"
-    temp_dir.mkdir(exist_ok=True)
+    return call_upstream(_stream_completion, messages, max_tokens, usage, timings)
+
+
+def _stream_completion(messages: list, max_tokens: int, usage: dict, timings: StageTimer):
+    started = time.perf_counter()
+    stream = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=messages,
+        temperature=0.7,
+        max_tokens=max_tokens,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+
+    parts = []
+    finish_reason = None
+    first_token_at = None
+    for chunk in stream:
+        if chunk.choices:
+            choice = chunk.choices[0]
+            if choice.delta and choice.delta.content:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(choice.delta.content)
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+        # The usage block arrives on the final chunk, which has no choices
+        if chunk.usage:
+            # Tokens are accumulated so a retried call is charged for both attempts
+            usage['prompt_tokens'] = usage.get('prompt_tokens', 0) + chunk.usage.prompt_tokens
+            usage['completion_tokens'] = usage.get('completion_tokens', 0) + chunk.usage.completion_tokens
+            usage['total_tokens'] = usage.get('total_tokens', 0) + chunk.usage.total_tokens
+
+    finished = time.perf_counter()
+    if 'upstream_ttfb' not in timings.stages:
+        timings.add('upstream_ttfb', (first_token_at or finished) - started)
+    timings.add('upstream_total', finished - started)
+
+    usage['max_tokens'] = max_tokens
+    usage['finish_reason'] = finish_reason or ''
+    return ''.join(parts), finish_reason
+
+
+def finish_generation(site_obj, timings: StageTimer, keep_sources: bool = None, started: float = None,
+                      multipage: bool = False):
+    """
+    Generate the LLM page for a site and store it as the site's final archive.
+    The completion budget is sized from past sites of the same business type;
+    token usage and stage timings are recorded and the owner's quota charged.
+    With `multipage` the site gets several pages, see generate_site_pages().
+    `started` is the time.time() the generation began. Returns the "Error: ..."
+    message when the upstream call failed: the site is then marked failed, or
+    kept on its draft, see keep_draft().
+    """
+    started = time.time() if started is None else started
+    usage = {}
+    pages = {}
+    if multipage:
+        pages = generate_site_pages(site_obj.prompt, usage=usage, timings=timings)
+        code = pages.pop('index.html')
+    else:
+        code = generate_website_code(site_obj.prompt, max_tokens=predict_max_tokens(site_obj.business_type),
+                                     usage=usage, timings=timings)
+    apply_usage(site_obj, usage)
+
+    if code.startswith("Error:"):
+        if site_obj.status == "draft" and site_obj.generated_file:
+            keep_draft(site_obj, timings)
+        else:
+            mark_failed(site_obj, timings)
+        record_generation(site_obj, timings)
+        return code
+
+    site_obj.generation_time = time.time() - started
+    save_website_as_zip(site_obj, code, timings=timings, keep_sources=keep_sources, pages=pages)
+    record_generation(site_obj, timings)
+
+    if site_obj.user_id and not site_obj.quota_charged:
+        # Sites queued by a request were charged then, see UserProfile.reserve_generation()
+        profile, created = UserProfile.objects.get_or_create(user_id=site_obj.user_id)
+        profile.decrement_usage()
+    return None
+
+
+def refund_generation(site_obj):
+    """Give the owner back the generation charged when the site was queued, at most once"""
+    if not GeneratedSite.objects.filter(id=site_obj.id, quota_charged=True).update(quota_charged=False):
+        return
+    site_obj.quota_charged = False
+    UserProfile.objects.filter(user_id=site_obj.user_id).update(
+        websites_generated=F('websites_generated') - 1,
+        free_websites_remaining=Case(When(subscription_plan='free', then=F('free_websites_remaining') + 1),
+                                     default=F('free_websites_remaining')),
+    )
+
+
+def mark_failed(site_obj, timings: StageTimer = None):
+    """Save the site as failed, refund its owner and queue its webhook event with the status change"""
+    site_obj.status = "failed"
+    with transaction.atomic(), (timings or StageTimer()).stage('db_persist'):
+        refund_generation(site_obj)
+        site_obj.save()
+        enqueue_event(site_obj)
+
+
+def keep_draft(site_obj, timings: StageTimer = None):
+    """
+    Complete a progressive site whose final generation failed with the draft
+    it already serves, marked by finish_reason 'fallback' like any degraded
+    page. Its owner keeps a working site instead of a failed one.
+    """
+    site_obj.status = "completed"
+    site_obj.finish_reason = "fallback"
+    with transaction.atomic(), (timings or StageTimer()).stage('db_persist'):
+        site_obj.save()
+        enqueue_event(site_obj)
 
+
+def complete_generation(site_id: int, keep_sources: bool = None, started: float = None, stages: dict = None,
+                        queued: float = 0.0, multipage: bool = False):
+    """
+    Background half of a generation: replace the draft of a progressive
+    generation, or fill a pending site queued through the API, with the LLM
+    page. `stages` are the timings of the request that queued it.
+    """
+    site = GeneratedSite.objects.filter(id=site_id, status__in=("pending", "draft")).first()
+    if site is None:
+        return  # Deleted while queued
+    timings = StageTimer()
+    timings.stages.update(stages or {})
+    timings.add('queue_wait', queued)
     try:
-        # Define paths
-        zip_path = site_dir / f"site_{site_obj.id}.zip"
-        
-        # Try to extract CSS and JS from the HTML if they're embedded
-        html_content, css_content, js_content = extract_embedded_assets(code)
-        
-        # Create the zip file with proper structure
-        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-            # Add main HTML file
-            zipf.writestr("index.html", html_content)
-            
-            # Add CSS file if extracted
-            if css_content:
-                zipf.writestr("styles.css", css_content)
-                
-            # Add JS file if extracted  
-            if js_content:
-                zipf.writestr("script.js", js_content)
-                
-            # Add a README with instructions
-            readme_content = f"""# Generated Website
+        error = finish_generation(site, timings, keep_sources=keep_sources, started=started, multipage=multipage)
+    except GeneratedSite.DoesNotExist:
+        return  # Deleted while generating
+    except Exception:
+        with transaction.atomic():
+            # Not a save(): that would re-insert a site deleted meanwhile. A draft stays served, see keep_draft()
+            drafts = GeneratedSite.objects.filter(id=site_id, status="draft").exclude(generated_file="")
+            if drafts.update(status="completed", finish_reason="fallback"):
+                site.status, site.finish_reason = "completed", "fallback"
+                enqueue_event(site)
+            elif GeneratedSite.objects.filter(id=site_id, status__in=("pending", "draft")).update(status="failed"):
+                site.status = "failed"
+                refund_generation(site)
+                enqueue_event(site)
+        raise
+    if error and site.status == "completed":
+        print(f"⚠️  Final generation of site {site_id} failed, the draft stays available: {error}")
+    elif error:
+        print(f"⚠️  Generation of site {site_id} failed: {error}")
+
+
+def rebuild_archives(site_ids: list, queued: float = 0.0):
+    """
+    Re-package stored sites from their generated_code with the current packaging
+    settings (admin action). The task's time in the background queue and its
+    packaging stages, summed over the batch, are logged with the result; the
+    sites keep the stage timings of their generation.
+    """
+    rebuilt = 0
+    timings = StageTimer()
+    timings.add('queue_wait', queued)
+    sites = GeneratedSite.objects.filter(id__in=site_ids, status__in=("draft", "completed")).exclude(generated_code="")
+    for site in sites.iterator(chunk_size=50):
+        try:
+            save_website_as_zip(site, site.generated_code, timings=timings, status=site.status)
+        except GeneratedSite.DoesNotExist:
+            continue  # Deleted meanwhile
+        rebuilt += 1
+    stages = ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.as_dict().items())
+    print(f"📦 Rebuilt {rebuilt} of {len(site_ids)} site archives ({stages})")
+
+
+def save_website_as_zip(site_obj, code: str, timings: StageTimer = None, keep_sources: bool = None,
+                        status: str = "completed", pages: dict = None):
+    """
+    Save the generated HTML/CSS/JS code into a zip file and attach to GeneratedSite.
+    The archive is built by build_site_package() and stored content-addressed,
+    so identical output shares one file. `pages` replaces the other pages of a
+    multi-page site; None keeps the site's current ones (e.g. for an edit of the home page).
+    Records the extraction, minify, packaging, storage and db_persist stages in `timings`.
+    `status` is "draft" for the instant template page of a progressive generation.
+    Raises GeneratedSite.DoesNotExist if the site was deleted meanwhile.
+    """
+    if timings is None:
+        timings = StageTimer()
+    if pages is not None:
+        site_obj.pages = pages
+    result = build_site_package(code, timings=timings, keep_sources=keep_sources, pages=site_obj.pages)
+
+    # Store the archive once per unique content (sharded local dirs or S3) and
+    # commit the site's reference with it, see archives.py
+    archive = result['archive']
+    with transaction.atomic():
+        with timings.stage('storage'):
+            # Lock the row: a concurrent delete or regeneration must not release the previous archive twice
+            current = (GeneratedSite.objects.select_for_update().filter(pk=site_obj.pk)
+                       .values_list('generated_file', 'archive_sha256', 'downloads_count', 'status').first())
+            if current is None:
+                raise GeneratedSite.DoesNotExist(f"Site {site_obj.pk} was deleted")
+            site_obj.generated_file.name, site_obj.archive_sha256, site_obj.downloads_count, previous_status = current
+            store_archive(site_obj, archive, result['sha256'])
+
+        # Save file reference to DB
+        site_obj.generated_code = code
+        site_obj.status = status
+        with timings.stage('db_persist'):
+            site_obj.save()
+            if status != previous_status:
+                enqueue_event(site_obj)
+
+    original_size = len(code.encode('utf-8'))
+    print(f"📦 Packaged site {site_obj.id}: {original_size / 1024:.1f} KB generated, "
+          f"{result['served_size'] / 1024:.1f} KB minified, {len(archive) / 1024:.1f} KB archive")
+
+
+def build_site_package(code: str, timings: StageTimer = None, keep_sources: bool = None, pages: dict = None) -> dict:
+    """
+    Build the ZIP for generated code without storing it (see packaging.build_archive).
+    Creates a professional folder structure with separate files when possible;
+    the other `pages` of a multi-page site share one stylesheet and script,
+    plus a script of their own where they have page-specific code.
+    Files are minified and precompressed per the SITE_* settings; keep_sources
+    overrides SITE_KEEP_SOURCES for this site. The archive is built in the
+    packaging pool; the README is kept free of dates to keep the bytes reproducible.
+    """
+    if timings is None:
+        timings = StageTimer()
+    if keep_sources is None:
+        keep_sources = settings.SITE_KEEP_SOURCES
+
+    # Try to extract CSS and JS from the HTML if they're embedded
+    with timings.stage('extraction'):
+        if pages:
+            files, css_content, js_content = extract_shared_assets({"index.html": code, **pages})
+        else:
+            html_content, css_content, js_content = extract_embedded_assets(code)
+            files = {"index.html": html_content}
+
+    if css_content:
+        files["styles.css"] = css_content
+    if js_content:
+        files["script.js"] = js_content
+
+    # Add a README with instructions
+    page_list = ''.join(f"- {name}: {name[:-5].replace('-', ' ').title()} page\n" for name in pages or ())
+    readme_content = f"""# Generated Website
 
 This website was generated by AI Website Generator.
 
 ## Files:
 - index.html: Main HTML file
-{'- styles.css: Stylesheet' if css_content else ''}
+{page_list}{'- styles.css: Stylesheet' if css_content else ''}
 {'- script.js: JavaScript code' if js_content else ''}
+{'- <page>.js: JavaScript used by that page only' if any(name.endswith('.js') for name in files) else ''}
+{'- *.gz / *.br: Precompressed copies for servers with gzip_static / brotli_static' if settings.SITE_PRECOMPRESS else ''}
+{'- src/: Unminified sources' if keep_sources and settings.SITE_MINIFY else ''}
 
 ## Instructions:
 1. Extract all files to a folder
 2. Open index.html in a web browser
 3. Upload to any web hosting service
-
-## Generated on: {site_obj.created_at.strftime('%Y-%m-%d %H:%M:%S')}
 """
-            zipf.writestr("README.md", readme_content)
 
-        # Save file reference to DB
-        site_obj.generated_code = code
-        site_obj.generated_file.name = f"sites/site_{site_obj.id}.zip"
-        site_obj.status = "completed"
-        site_obj.save()
-        
-    finally:
-        # Clean up temp directory
-        if temp_dir.exists():
-            import shutil
-            shutil.rmtree(temp_dir, ignore_errors=True)
+    # Minify and zip in the packaging pool; the stages are timed inside the worker
+    result = package_site(
+        files,
+        readme_content,
+        minify=settings.SITE_MINIFY,
+        keep_sources=keep_sources,
+        compress=settings.SITE_PRECOMPRESS,
+    )
+    for stage, seconds in result['stages'].items():
+        timings.add(stage, seconds)
+    return result
 
 
 def extract_embedded_assets(html_code: str) -> tuple:
@@ -173,6 +479,53 @@ def extract_embedded_assets(html_code: str) -> tuple:
     return modified_html, css_content, js_content
 
 
+def extract_shared_assets(pages: dict) -> tuple:
+    """
+    extract_embedded_assets() for the pages of a multi-page site. The <style>
+    blocks of every page move to one shared stylesheet, each distinct block
+    once. Only scripts every page runs (the navigation script, or a block
+    inlined on all pages) go to the shared script.js; the rest of a page's
+    scripts go to <page>.js, linked from that page only, so code written for
+    one page never runs (and throws) on another.
+    Returns: ({name: html_without_embedded, page scripts...}, css_content, js_content)
+    """
+    import re
+
+    style = re.compile(r'<style[^>]*>([\s\S]*?)</style>', re.IGNORECASE)
+    script = re.compile(r'<script(?![^>]*src)[^>]*>([\s\S]*?)</script>', re.IGNORECASE)
+    css_blocks = {}  # Insertion-ordered set
+    page_scripts = {}
+    for name, html_code in pages.items():
+        css_blocks.update(dict.fromkeys(block.strip() for block in style.findall(html_code) if block.strip()))
+        page_scripts[name] = list(dict.fromkeys(block.strip() for block in script.findall(html_code) if block.strip()))
+    css_content = '\n\n'.join(css_blocks)
+
+    shared = {SHARED_SCRIPT.strip()} | set.intersection(*(set(blocks) for blocks in page_scripts.values()))
+    js_blocks = dict.fromkeys(block for blocks in page_scripts.values() for block in blocks if block in shared)
+    js_content = '\n\n'.join(js_blocks)
+
+    files = {}
+    for name, html_code in pages.items():
+        modified_html = script.sub('', style.sub('', html_code))
+        if css_content and not re.search(r'href=["\']styles\.css', modified_html, re.IGNORECASE):
+            modified_html = re.sub(r'</head>', '    <link rel="stylesheet" href="styles.css">\n</head>', modified_html,
+                                   count=1, flags=re.IGNORECASE)
+        tags = []
+        if js_content and not re.search(r'src=["\']script\.js', modified_html, re.IGNORECASE):
+            tags.append('<script src="script.js"></script>')
+        own = [block for block in page_scripts[name] if block not in shared]
+        if own:
+            # After script.js, so page code can use what the shared script sets up
+            script_name = name.rsplit('.', 1)[0] + ('-page.js' if name == 'script.html' else '.js')
+            files[script_name] = '\n\n'.join(own)
+            tags.append(f'<script src="{script_name}"></script>')
+        if tags:
+            modified_html = re.sub(r'</body>', ''.join(f'    {tag}\n' for tag in tags) + '</body>', modified_html,
+                                   count=1, flags=re.IGNORECASE)
+        files[name] = modified_html
+    return files, css_content, js_content
+
+
 def test_generate_simple_website():
     """
     Test function to generate a simple website for debugging.
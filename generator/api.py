@@ -0,0 +1,417 @@
+"""
+Versioned REST API (/api/v1/) for programmatic clients.
+
+Authentication is a signed, expiring token (POST /api/v1/token/ with a
+username and password, or from a logged-in session): the user id is read
+from the signature, so authenticated requests never touch the session
+table, and the user table only when the cached credentials key has expired
+(see authentication.py). Tokens stay valid until API_TOKEN_MAX_AGE_DAYS or
+until the user's password, active or staff flag changes; rotating SECRET_KEY
+revokes all of them. Token requests are throttled per client address.
+
+    POST /api/v1/sites/                   queue a generation (202; 402 past the quota)
+    GET  /api/v1/sites/                   own sites, newest first, cursor-paginated
+    GET  /api/v1/sites/<id>/              one site; ETag / If-None-Match
+    GET  /api/v1/sites/<id>/status/       status only; ETag / If-None-Match
+    GET  /api/v1/sites/status/?ids=1,2    status of many sites in one query
+    GET  /api/v1/sites/<id>/download/     the ZIP (Range supported)
+
+    GET  /api/v1/webhooks/                own webhook endpoints; POST registers one
+    GET  /api/v1/webhooks/<id>/           one endpoint; PATCH url/is_active, DELETE
+    GET  /api/v1/webhooks/<id>/deliveries/?status=dead
+                                          its deliveries, newest first, cursor-paginated
+    POST /api/v1/webhooks/<id>/deliveries/<delivery_id>/redeliver/
+
+?fields=id,status,... selects the fields of sites/ and sites/<id>/, and only
+the columns behind them are loaded. generated_code is only served by
+sites/<id>/, and only when asked for.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.db import transaction
+from django.db.models import F
+from django.urls import path, reverse
+from rest_framework import authentication, exceptions, generics, serializers, status
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.throttling import SimpleRateThrottle
+from rest_framework.views import APIView
+
+from . import background
+from .ai_service import complete_generation, extract_business_type
+from .authentication import issue_token
+from .models import GeneratedSite, UserProfile, Webhook, WebhookDelivery
+from .preview import preview_token
+from .storage import archive_storage
+from .webhooks import UnsafeWebhookURL, check_webhook_url, redeliver
+
+# Model columns each field needs; generated_code is never in a list
+FIELD_COLUMNS = {
+    'id': ['id'],
+    'status': ['status'],
+    'prompt': ['prompt'],
+    'business_type': ['business_type'],
+    'created_at': ['created_at'],
+    'generation_time': ['generation_time'],
+    'downloads_count': ['downloads_count'],
+    'archive_sha256': ['archive_sha256'],
+    'is_premium': ['is_premium'],
+    'max_tokens': ['max_tokens'],
+    'prompt_tokens': ['prompt_tokens'],
+    'completion_tokens': ['completion_tokens'],
+    'total_tokens': ['total_tokens'],
+    'finish_reason': ['finish_reason'],
+    'status_url': ['id'],
+    'download_url': ['id', 'status', 'generated_file'],
+    'preview_url': ['id', 'status', 'generated_file'],
+    'generated_code': ['generated_code'],
+}
+# preview_url checks the stored archive, generated_code is large: both are opt-in
+DEFAULT_FIELDS = [name for name in FIELD_COLUMNS if name not in ('preview_url', 'generated_code')]
+DETAIL_ONLY_FIELDS = {'generated_code'}
+# Everything a site's representation can change with, read before deciding on a 304
+VERSION_COLUMNS = ['id', 'status', 'archive_sha256', 'downloads_count', 'generation_time', 'total_tokens']
+
+
+class FirstRendererNegotiation(BaseContentNegotiation):
+    """Downloads answer with the file whatever the client's Accept header says"""
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class SiteCursorPagination(CursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+
+    def __init__(self):
+        # Read per request (one paginator per view instance) so settings overrides apply
+        self.page_size = settings.API_PAGE_SIZE
+        self.max_page_size = settings.API_MAX_PAGE_SIZE
+
+
+class SiteSerializer(serializers.ModelSerializer):
+    status_url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+    preview_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = GeneratedSite
+        fields = list(FIELD_COLUMNS)
+        read_only_fields = fields
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in set(self.fields) - set(fields or DEFAULT_FIELDS):
+            self.fields.pop(name)
+
+    def get_status_url(self, site):
+        return reverse('generator:api:site-status', args=[site.id])
+
+    def get_download_url(self, site):
+        if site.status in ('draft', 'completed') and site.generated_file:
+            return reverse('generator:api:site-download', args=[site.id])
+        return None
+
+    def get_preview_url(self, site):
+        if site.status in ('draft', 'completed') and site.generated_file:
+            try:
+                return reverse('generator:preview_site', args=[site.id, preview_token(site)])
+            except OSError:
+                pass
+        return None
+
+
+class WebhookSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Webhook
+        fields = ['id', 'url', 'is_active', 'created_at']
+        read_only_fields = ['id', 'created_at']
+        # Form-encoded requests would otherwise read a missing checkbox as False
+        extra_kwargs = {'is_active': {'default': True}}
+
+    def validate_url(self, url):
+        try:
+            check_webhook_url(url)
+        except UnsafeWebhookURL as e:
+            raise serializers.ValidationError(str(e))
+        return url
+
+
+class WebhookDeliverySerializer(serializers.ModelSerializer):
+    error = serializers.SerializerMethodField()
+
+    class Meta:
+        model = WebhookDelivery
+        fields = ['id', 'event', 'site', 'status', 'attempts', 'next_attempt_at', 'last_status_code', 'error',
+                  'created_at', 'delivered_at', 'payload']
+        read_only_fields = fields
+
+    def get_error(self, delivery):
+        # The raw last_error (resolver and socket messages) stays in the admin
+        if delivery.last_status_code:
+            return None if 200 <= delivery.last_status_code < 300 else f"HTTP {delivery.last_status_code}"
+        return 'Connection failed' if delivery.last_error else None
+
+
+class SiteCreateSerializer(serializers.Serializer):
+    prompt = serializers.CharField(min_length=10, max_length=1000, trim_whitespace=True)
+    keep_sources = serializers.BooleanField(required=False, allow_null=True, default=None)
+    multipage = serializers.BooleanField(required=False, default=False)
+
+
+def _requested_fields(request, detail: bool) -> list:
+    raw = request.query_params.get('fields')
+    if not raw:
+        return DEFAULT_FIELDS
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in FIELD_COLUMNS or (name in DETAIL_ONLY_FIELDS and not detail)]
+    if unknown:
+        raise exceptions.ValidationError({'fields': f"Unknown or unavailable fields: {', '.join(unknown)}"})
+    return fields
+
+
+def _columns(fields, extra=()) -> list:
+    return sorted({column for name in fields for column in FIELD_COLUMNS[name]} | set(extra))
+
+
+def _etag(*parts) -> str:
+    return '"' + hashlib.sha256(repr(parts).encode()).hexdigest()[:32] + '"'
+
+
+def _not_modified(request, etag: str) -> bool:
+    return etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]
+
+
+def _own_sites(request):
+    return GeneratedSite.objects.filter(user_id=request.user.id)
+
+
+class TokenRequestThrottle(SimpleRateThrottle):
+    """API_TOKEN_REQUESTS_PER_MINUTE token requests per client address, against password guessing"""
+    scope = 'api_token'
+
+    def get_rate(self):
+        return f'{settings.API_TOKEN_REQUESTS_PER_MINUTE}/min' if settings.API_TOKEN_REQUESTS_PER_MINUTE else None
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class ObtainToken(APIView):
+    """A token for the given username and password, or for the logged-in session"""
+    authentication_classes = [authentication.SessionAuthentication]
+    permission_classes = [AllowAny]
+    throttle_classes = [TokenRequestThrottle]
+
+    def post(self, request):
+        username, password = request.data.get('username'), request.data.get('password')
+        user = authenticate(request, username=username, password=password) if username and password else None
+        if user is None and not username and request.user.is_authenticated:
+            user = request.user
+        if user is None or not user.is_active:
+            raise exceptions.AuthenticationFailed('Invalid username or password.')
+        return Response({'token': issue_token(user), 'expires_in': settings.API_TOKEN_MAX_AGE_DAYS * 86400})
+
+
+class SiteList(generics.ListCreateAPIView):
+    """Own sites, newest first; POST queues a generation"""
+    permission_classes = [IsAuthenticated]
+    pagination_class = SiteCursorPagination
+
+    def get_queryset(self):
+        sites = _own_sites(self.request).only(*_columns(self.requested_fields, extra=('created_at',)))
+        if self.request.query_params.get('status'):
+            sites = sites.filter(status=self.request.query_params['status'])
+        return sites
+
+    def get_serializer(self, *args, **kwargs):
+        return SiteSerializer(*args, fields=self.requested_fields, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        self.requested_fields = _requested_fields(request, detail=False)
+        return super().list(request, *args, **kwargs)
+
+    def create(self, request, *args, **kwargs):
+        data = SiteCreateSerializer(data=request.data)
+        data.is_valid(raise_exception=True)
+        profile, created = UserProfile.objects.get_or_create(user_id=request.user.id)
+        multipage = data.validated_data['multipage']
+        if multipage and not profile.can_generate_multipage():
+            return Response({'error': "Multi-page websites are part of the Premium plan.", 'upgrade_required': True},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        prompt = data.validated_data['prompt']
+        with transaction.atomic():
+            # Charged now, not when the job finishes: queued jobs cannot overspend the quota
+            if not profile.reserve_generation():
+                return Response({'error': "You've reached your website generation limit.", 'upgrade_required': True},
+                                status=status.HTTP_402_PAYMENT_REQUIRED)
+            site = GeneratedSite.objects.create(user_id=request.user.id, prompt=prompt, status='pending',
+                                                business_type=extract_business_type(prompt), is_premium=multipage,
+                                                quota_charged=True)
+        # Always asynchronous: clients poll the status URL (or the batch status endpoint)
+        background.submit(complete_generation, site.id, keep_sources=data.validated_data['keep_sources'],
+                          multipage=multipage)
+        body = SiteSerializer(site, fields=['id', 'status', 'prompt', 'created_at', 'status_url']).data
+        return Response(body, status=status.HTTP_202_ACCEPTED, headers={'Location': body['status_url']})
+
+
+class SiteDetail(APIView):
+    """One site; answers 304 from the version columns before loading the rest"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, site_id):
+        fields = _requested_fields(request, detail=True)
+        site = _own_sites(request).only(*_columns(fields, extra=VERSION_COLUMNS)).filter(id=site_id).first()
+        if site is None:
+            raise exceptions.NotFound()
+        etag = _etag(fields, *(getattr(site, column) for column in VERSION_COLUMNS))
+        if _not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(SiteSerializer(site, fields=fields).data, headers={'ETag': etag})
+
+
+class SiteStatus(APIView):
+    """Status of one site, for polling"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, site_id):
+        row = _own_sites(request).filter(id=site_id).values('id', 'status', 'archive_sha256').first()
+        if row is None:
+            raise exceptions.NotFound()
+        etag = _etag(row['status'], row['archive_sha256'])
+        if _not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(_status_body(row), headers={'ETag': etag})
+
+
+class SiteStatusBatch(APIView):
+    """Status of up to API_STATUS_BATCH_SIZE sites (?ids=1,2,3) in one query"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            ids = {int(value) for value in request.query_params.get('ids', '').split(',') if value.strip()}
+        except ValueError:
+            raise exceptions.ValidationError({'ids': 'Comma-separated site ids expected.'})
+        if not ids or len(ids) > settings.API_STATUS_BATCH_SIZE:
+            raise exceptions.ValidationError({'ids': f'Between 1 and {settings.API_STATUS_BATCH_SIZE} ids expected.'})
+        rows = _own_sites(request).filter(id__in=ids).order_by('id').values('id', 'status', 'archive_sha256')
+        results = [_status_body(row) for row in rows]
+        etag = _etag(*((row['id'], row['status'], row['archive_sha256']) for row in results))
+        if _not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response({'results': results}, headers={'ETag': etag})
+
+
+def _status_body(row: dict) -> dict:
+    ready = row['status'] in ('draft', 'completed') and row['archive_sha256']
+    return {
+        'id': row['id'],
+        'status': row['status'],
+        'archive_sha256': row['archive_sha256'] or None,
+        'download_url': reverse('generator:api:site-download', args=[row['id']]) if ready else None,
+    }
+
+
+class SiteDownload(APIView):
+    """The site's ZIP, streamed or handed off per storage backend; Range/If-Range for resumes"""
+    permission_classes = [IsAuthenticated]
+    content_negotiation_class = FirstRendererNegotiation
+
+    def get(self, request, site_id):
+        site = _own_sites(request).only('id', 'generated_file').filter(id=site_id).first()
+        if site is None or not site.generated_file:
+            raise exceptions.NotFound()
+        # Resumed downloads count once
+        if 'Range' not in request.headers:
+            GeneratedSite.objects.filter(id=site.id).update(downloads_count=F('downloads_count') + 1)
+        return archive_storage.download_response(site.generated_file.name, f"website_{site.id}.zip",
+                                                 range_header=request.headers.get('Range'),
+                                                 if_range=request.headers.get('If-Range'))
+
+
+class DeliveryCursorPagination(SiteCursorPagination):
+    ordering = ('-id',)
+
+
+def _own_webhooks(request):
+    return Webhook.objects.filter(user_id=request.user.id)
+
+
+class WebhookList(generics.ListCreateAPIView):
+    """Own webhook endpoints; the signing secret is only returned when one is registered"""
+    permission_classes = [IsAuthenticated]
+    serializer_class = WebhookSerializer
+
+    def get_queryset(self):
+        return _own_webhooks(self.request)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if _own_webhooks(request).count() >= settings.WEBHOOK_MAX_PER_USER:
+            raise exceptions.ValidationError({'url': f'At most {settings.WEBHOOK_MAX_PER_USER} webhooks per account.'})
+        webhook = serializer.save(user_id=request.user.id)
+        return Response({**serializer.data, 'secret': webhook.secret}, status=status.HTTP_201_CREATED)
+
+
+class WebhookDetail(generics.RetrieveUpdateDestroyAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = WebhookSerializer
+    lookup_url_kwarg = 'webhook_id'
+
+    def get_queryset(self):
+        return _own_webhooks(self.request)
+
+
+class WebhookDeliveryList(generics.ListAPIView):
+    """Deliveries of one endpoint; ?status=dead is the dead letter log"""
+    permission_classes = [IsAuthenticated]
+    serializer_class = WebhookDeliverySerializer
+    pagination_class = DeliveryCursorPagination
+
+    def get_queryset(self):
+        deliveries = WebhookDelivery.objects.filter(webhook__user_id=self.request.user.id,
+                                                    webhook_id=self.kwargs['webhook_id'])
+        if self.request.query_params.get('status'):
+            deliveries = deliveries.filter(status=self.request.query_params['status'])
+        return deliveries
+
+
+class WebhookRedeliver(APIView):
+    """Queue a dead or delivered delivery again"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, webhook_id, delivery_id):
+        deliveries = WebhookDelivery.objects.filter(webhook__user_id=request.user.id, webhook_id=webhook_id,
+                                                    id=delivery_id)
+        if not deliveries.exists():
+            raise exceptions.NotFound()
+        if not redeliver(deliveries):
+            return Response({'error': 'The delivery is already pending.'}, status=status.HTTP_409_CONFLICT)
+        return Response({'id': delivery_id, 'status': 'pending'}, status=status.HTTP_202_ACCEPTED)
+
+
+urlpatterns = [
+    path('token/', ObtainToken.as_view(), name='token'),
+    path('sites/', SiteList.as_view(), name='site-list'),
+    path('sites/status/', SiteStatusBatch.as_view(), name='site-status-batch'),
+    path('sites/<int:site_id>/', SiteDetail.as_view(), name='site-detail'),
+    path('sites/<int:site_id>/status/', SiteStatus.as_view(), name='site-status'),
+    path('sites/<int:site_id>/download/', SiteDownload.as_view(), name='site-download'),
+    path('webhooks/', WebhookList.as_view(), name='webhook-list'),
+    path('webhooks/<int:webhook_id>/', WebhookDetail.as_view(), name='webhook-detail'),
+    path('webhooks/<int:webhook_id>/deliveries/', WebhookDeliveryList.as_view(), name='webhook-deliveries'),
+    path('webhooks/<int:webhook_id>/deliveries/<int:delivery_id>/redeliver/', WebhookRedeliver.as_view(),
+         name='webhook-redeliver'),
+]
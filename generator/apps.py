@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class GeneratorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'generator'
+
+    def ready(self):
+        from ai_webgen.database import configure_sqlite_connection
+        connection_created.connect(configure_sqlite_connection, dispatch_uid='generator.sqlite_pragmas')
+
+        # A changed password, active or staff flag revokes the user's API tokens
+        from django.contrib.auth import get_user_model
+        from django.db.models.signals import post_delete, post_save
+        from .authentication import forget_credentials
+        post_save.connect(forget_credentials, sender=get_user_model(), dispatch_uid='generator.api_token_saved')
+        post_delete.connect(forget_credentials, sender=get_user_model(), dispatch_uid='generator.api_token_deleted')
@@ -0,0 +1,148 @@
+"""
+Content-addressed, reference-counted site archives.
+
+Packaging is deterministic (fixed ZIP timestamps, no dates in the README), so
+identical generated code always yields the same bytes. Each distinct archive
+is written once as an ArchiveBlob keyed by its SHA-256; sites point their
+generated_file at the shared blob, and the blob's file is deleted when the
+last site referencing it lets go. Storage and write I/O therefore grow with
+unique content, not with the number of generations.
+
+Sites packaged before blobs existed keep their own per-site archive and are
+released by deleting that file directly.
+"""
+
+import zlib
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F
+
+from .models import ArchiveBlob, GeneratedSite
+from .storage import archive_storage, blob_name
+
+
+def store_archive(site, data: bytes, sha256: str):
+    """
+    Point a site at the blob for `data`, writing it only if this content has
+    never been stored. The caller saves the site, in the same transaction so
+    the sweeper never sees the reference counted but the site unsaved; the
+    previous archive is only released after that transaction commits.
+    """
+    name = blob_name(sha256)
+    previous = (site.generated_file.name, site.archive_sha256) if site.generated_file else None
+    if previous == (name, sha256):
+        return name
+
+    with transaction.atomic():
+        blob, created = ArchiveBlob.objects.select_for_update().get_or_create(
+            sha256=sha256, defaults={'size': len(data), 'crc32': zlib.crc32(data)})
+        # Also rewrite a blob whose file went missing (the sweeper repairs its count)
+        if created or not archive_storage.exists(name):
+            content = ContentFile(data)
+            content.sha256 = sha256
+            archive_storage.save(name, content)
+        ArchiveBlob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1)
+
+    if previous:
+        # Regenerated: let go of the old archive once the caller's transaction
+        # commits; on rollback the site still points at it
+        transaction.on_commit(lambda: release_archives([previous]), robust=True)
+    site.generated_file.name = name
+    site.archive_sha256 = sha256
+    return name
+
+
+def release_archives(references, dry_run=False) -> dict:
+    """
+    Drop one reference per (generated_file name, archive_sha256) pair and
+    delete the files nothing points at any more. Returns {name: size} of the
+    files deleted (that would be, with dry_run).
+    """
+    deleted = {}
+    released = {}
+    for name, sha256 in references:
+        if not name:
+            continue
+        if sha256 and name == blob_name(sha256):
+            released[sha256] = released.get(sha256, 0) + 1
+        else:
+            # Per-site archive from before blobs
+            try:
+                size = archive_storage.size(name)
+            except OSError:
+                continue
+            if not dry_run:
+                archive_storage.delete(name)
+            deleted[name] = size
+
+    for sha256, count in released.items():
+        with transaction.atomic():
+            blob = ArchiveBlob.objects.select_for_update().filter(sha256=sha256).first()
+            if blob is None:
+                continue
+            if blob.ref_count > count:
+                if not dry_run:
+                    ArchiveBlob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') - count)
+                continue
+            if not dry_run:
+                # Deleted under the row lock, so a concurrent store_archive of the same content recreates both
+                archive_storage.delete(blob_name(sha256))
+                blob.delete()
+            deleted[blob_name(sha256)] = blob.size
+    return deleted
+
+
+def _stored_size(name):
+    try:
+        return archive_storage.size(name)
+    except OSError:
+        return None
+
+
+def recount_blobs(batch_size, cutoff, dry_run=False) -> dict:
+    """
+    Repair reference counts from the sites that actually point at each blob.
+    Counts are only raised here; a blob is deleted only when, under its row
+    lock, no site references it (blobs created after `cutoff` are skipped).
+    Blob rows whose file is gone are dropped. Returns {name: size} of the
+    files deleted.
+    """
+    deleted = {}
+    last = ''
+    while True:
+        blobs = list(ArchiveBlob.objects.filter(sha256__gt=last).order_by('sha256')[:batch_size])
+        if not blobs:
+            return deleted
+        last = blobs[-1].sha256
+        counts = dict.fromkeys((blob.sha256 for blob in blobs), 0)
+        referencing = GeneratedSite.objects.filter(
+            archive_sha256__in=list(counts), generated_file__startswith='sites/blobs/',
+        ).values_list('archive_sha256', 'generated_file')
+        for sha256, name in referencing:
+            if name == blob_name(sha256):
+                counts[sha256] += 1
+
+        for blob in blobs:
+            name = blob_name(blob.sha256)
+            if counts[blob.sha256] > blob.ref_count:
+                if not dry_run:
+                    ArchiveBlob.objects.filter(sha256=blob.sha256).update(ref_count=counts[blob.sha256])
+                continue
+            if counts[blob.sha256] or blob.created_at >= cutoff:
+                continue
+            if dry_run:
+                size = _stored_size(name)
+                if size is not None:
+                    deleted[name] = size
+                continue
+            with transaction.atomic():
+                # A generation storing this content commits its site under the same lock
+                locked = ArchiveBlob.objects.select_for_update().filter(sha256=blob.sha256).first()
+                if locked is None or GeneratedSite.objects.filter(generated_file=name).exists():
+                    continue
+                size = _stored_size(name)
+                if size is not None:
+                    archive_storage.delete(name)
+                    deleted[name] = size
+                locked.delete()
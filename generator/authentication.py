@@ -0,0 +1,86 @@
+"""
+Signed API tokens.
+
+A token is the user id (and staff flag) signed with SECRET_KEY and a
+timestamp, so verifying one needs no session lookup. Kept out of api.py
+because REST_FRAMEWORK settings import the authentication class while
+rest_framework.views is being imported.
+
+Each token also carries a credentials key: an HMAC of the user's password
+hash, active flag and staff flag when it was issued. Changing the password,
+deactivating the account or changing its staff status changes the key and
+revokes every token issued before. The current key is cached per user for
+API_TOKEN_CHECK_SECONDS, so the user table is read at most once per user per
+period; saving a user drops the cached key at once (in every process with
+a shared cache, within that period otherwise).
+"""
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare, salted_hmac
+from rest_framework import authentication, exceptions
+
+TOKEN_SALT = 'generator.api.token'
+
+
+class TokenUser:
+    """The user of a verified API token, without a database lookup"""
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id: int, is_staff: bool = False):
+        self.id = self.pk = user_id
+        self.is_staff = is_staff
+
+
+def credentials_key(password: str, is_active: bool, is_staff: bool) -> str:
+    return salted_hmac(TOKEN_SALT, f'{password}|{int(is_active)}|{int(is_staff)}').hexdigest()[:16]
+
+
+def _cache_key(user_id) -> str:
+    return f'api-token-credentials:{user_id}'
+
+
+def current_credentials_key(user_id: int) -> str:
+    """The user's credentials key, '' for a deleted user; cached for API_TOKEN_CHECK_SECONDS"""
+    key = cache.get(_cache_key(user_id))
+    if key is None:
+        from django.contrib.auth import get_user_model
+        row = get_user_model().objects.filter(pk=user_id).values_list('password', 'is_active', 'is_staff').first()
+        key = credentials_key(*row) if row else ''
+        cache.set(_cache_key(user_id), key, settings.API_TOKEN_CHECK_SECONDS)
+    return key
+
+
+def forget_credentials(sender, instance, **kwargs):
+    """post_save/post_delete of a user: the next token it presents re-reads its credentials"""
+    cache.delete(_cache_key(instance.pk))
+
+
+def issue_token(user) -> str:
+    key = credentials_key(user.password, user.is_active, user.is_staff)
+    return signing.dumps({'u': user.id, 's': int(user.is_staff), 'k': key}, salt=TOKEN_SALT, compress=True)
+
+
+class SignedTokenAuthentication(authentication.BaseAuthentication):
+    """Authorization: Token <token> (or Bearer), verified by signature and the cached credentials key"""
+    keywords = ('token', 'bearer')
+
+    def authenticate(self, request):
+        header = authentication.get_authorization_header(request).split()
+        if not header or header[0].lower().decode() not in self.keywords:
+            return None
+        if len(header) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+        try:
+            payload = signing.loads(header[1].decode(), salt=TOKEN_SALT,
+                                    max_age=settings.API_TOKEN_MAX_AGE_DAYS * 86400)
+        except (signing.BadSignature, UnicodeDecodeError):
+            raise exceptions.AuthenticationFailed('Invalid or expired token.')
+        if not constant_time_compare(payload.get('k', ''), current_credentials_key(payload['u'])):
+            raise exceptions.AuthenticationFailed('Token revoked.')
+        return TokenUser(payload['u'], bool(payload.get('s'))), header[1]
+
+    def authenticate_header(self, request):
+        return 'Token'
@@ -0,0 +1,61 @@
+"""
+In-process background tasks.
+
+Work that should outlive the request that started it (the LLM half of a
+progressive generation) runs on a small thread pool of BACKGROUND_WORKERS
+threads per server process. Tasks are submitted after the surrounding
+transaction commits, so they always see the rows the request wrote, and
+each task gets fresh database connections. Tasks are lost if the process
+exits; the retention sweeper cleans up what they leave behind (see
+STUCK_PENDING_HOURS). With BACKGROUND_WORKERS=0 tasks run inline.
+"""
+
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.BACKGROUND_WORKERS, thread_name_prefix='background')
+        return _executor
+
+
+def _run(func, submitted, args, kwargs):
+    try:
+        func(*args, queued=time.perf_counter() - submitted, **kwargs)
+    except Exception:
+        print(f"❌ Background task {func.__name__} failed:\n{traceback.format_exc()}")
+
+
+def _run_in_thread(func, submitted, args, kwargs):
+    # Pool threads keep their connections between tasks; drop broken or expired ones like a request would
+    close_old_connections()
+    try:
+        _run(func, submitted, args, kwargs)
+    finally:
+        close_old_connections()
+
+
+def submit(func, *args, **kwargs):
+    """
+    Run func(*args, queued=<seconds spent waiting>, **kwargs) once the current
+    transaction commits: on the pool, or right away when BACKGROUND_WORKERS is 0.
+    """
+    def enqueue():
+        submitted = time.perf_counter()
+        if settings.BACKGROUND_WORKERS <= 0:
+            _run(func, submitted, args, kwargs)
+        else:
+            _get_executor().submit(_run_in_thread, func, submitted, args, kwargs)
+
+    transaction.on_commit(enqueue)
@@ -0,0 +1,140 @@
+"""
+Opt-in traffic capture for realistic benchmarking.
+
+When TRAFFIC_CAPTURE_ENABLED is set, every call to generate_website_code
+("upstream" events) and every generate_api request ("request" events) is
+appended to a size-rotated JSONL log with the prompt anonymized. The log
+is re-driven against the stub LLM by `python -m benchmarks.replay`.
+"""
+import functools
+import json
+import logging
+import re
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.conf import settings
+
+from .metrics import StageTimer
+
+_logger = None
+_logger_lock = threading.Lock()
+
+_ANONYMIZERS = [
+    (re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+'), '<email>'),
+    (re.compile(r'(?:https?://|www\.)\S+', re.IGNORECASE), '<url>'),
+    # API keys and other tokens: long runs mixing letters and digits (sk-..., ghp_..., hex digests)
+    (re.compile(r'\b(?=[\w-]*\d)(?=[\w-]*[A-Za-z])[\w-]{20,}'), '<secret>'),
+    (re.compile(r'\+?\d[\d\s().-]{6,}\d'), '<phone>'),
+    (re.compile(r'\d{4,}'), '<number>'),
+    # Business and person names: quoted text and capitalised words after "called"/"named"
+    (re.compile(r'"[^"]{1,80}"|\'[^\']{1,80}\''), '<name>'),
+    (re.compile(r'\b((?i:called|named|owned by|run by))\s+(?:[A-Z][\w&\'-]*\s*)+'), r'\1 <name> '),
+]
+
+
+def capture_enabled() -> bool:
+    return settings.TRAFFIC_CAPTURE_ENABLED
+
+
+def anonymize_prompt(prompt: str) -> str:
+    """Strip contact details, secrets, numbers and names while keeping the shape of the prompt"""
+    for pattern, replacement in _ANONYMIZERS:
+        prompt = pattern.sub(replacement, prompt)
+    return re.sub(r'[ \t]{2,}', ' ', prompt).strip()
+
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                path = Path(settings.TRAFFIC_CAPTURE_PATH)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                handler = RotatingFileHandler(
+                    path,
+                    maxBytes=settings.TRAFFIC_CAPTURE_MAX_BYTES,
+                    backupCount=settings.TRAFFIC_CAPTURE_BACKUPS,
+                    encoding='utf-8',
+                )
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                logger = logging.getLogger('generator.capture')
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                logger.addHandler(handler)
+                _logger = logger
+    return _logger
+
+
+def write_event(event: str, data: dict):
+    """Append one event to the capture log; never lets capture break a request"""
+    try:
+        record = {'event': event, 'ts': round(time.time(), 3)}
+        record.update(data)
+        _get_logger().info(json.dumps(record, separators=(',', ':'), default=str))
+    except Exception as e:
+        print(f"Warning: traffic capture failed: {e}")
+
+
+def capture_upstream(func):
+    """Record prompt, response size, timings and finish reason of each generate_website_code() call"""
+    @functools.wraps(func)
+    def wrapper(prompt, *args, usage=None, timings=None, **kwargs):
+        if not capture_enabled():
+            return func(prompt, *args, usage=usage, timings=timings, **kwargs)
+
+        usage = {} if usage is None else usage
+        timings = StageTimer() if timings is None else timings
+        started = time.perf_counter()
+        code = func(prompt, *args, usage=usage, timings=timings, **kwargs)
+        write_event('upstream', {
+            'prompt': anonymize_prompt(prompt),
+            'prompt_chars': len(prompt),
+            'response_chars': len(code),
+            'error': code.startswith('Error:'),
+            'duration': round(time.perf_counter() - started, 4),
+            'upstream_ttfb': round(timings.stages.get('upstream_ttfb', 0.0), 4),
+            'upstream_total': round(timings.stages.get('upstream_total', 0.0), 4),
+            **usage,
+        })
+        return code
+    return wrapper
+
+
+def capture_request(view):
+    """
+    Record each generate_api request: arrival time, anonymized prompt,
+    response status and size, and the generated site's usage and timings.
+    The view exposes the site it created as `request.generated_site`.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not capture_enabled():
+            return view(request, *args, **kwargs)
+
+        arrived = time.time()
+        started = time.perf_counter()
+        response = view(request, *args, **kwargs)
+        site = getattr(request, 'generated_site', None)
+        prompt = request.POST.get('prompt') or ''
+        write_event('request', {
+            'ts': round(arrived, 3),
+            'prompt': anonymize_prompt(prompt),
+            'prompt_chars': len(prompt),
+            'authenticated': request.user.is_authenticated,
+            'status_code': response.status_code,
+            'response_bytes': len(response.content) if not response.streaming else None,
+            'duration': round(time.perf_counter() - started, 4),
+            'site_status': site.status if site else None,
+            'business_type': site.business_type if site else None,
+            'code_chars': len(site.generated_code or '') if site else None,
+            'max_tokens': site.max_tokens if site else None,
+            'prompt_tokens': site.prompt_tokens if site else None,
+            'completion_tokens': site.completion_tokens if site else None,
+            'finish_reason': site.finish_reason if site else None,
+            'stage_timings': site.stage_timings if site else None,
+        })
+        return response
+    return wrapper
@@ -0,0 +1,186 @@
+"""
+Incremental edits of a generated site.
+
+Instead of regenerating a whole page for "change the colours" or "add a
+pricing section", the stored code and the instruction are sent upstream and
+the model answers with targeted SEARCH/REPLACE blocks:
+
+    <<<<<<< SEARCH
+    exact lines from the current page
+    =======
+    the lines that replace them
+    >>>>>>> REPLACE
+
+The blocks are applied locally. Every SEARCH must match the page exactly
+once (after an exact attempt, trailing whitespace and indentation are
+ignored line by line), and an edit may not unbalance the page's container
+tags. A reply that does not apply gets one repair round with the errors;
+otherwise nothing is changed. The output is a few hundred tokens instead of
+a full page, so edits take seconds and a fraction of the cost.
+"""
+
+import re
+from collections import Counter
+from html.parser import HTMLParser
+
+from django.conf import settings
+
+from .metrics import StageTimer
+
+EDIT_SYSTEM_PROMPT = """You edit an existing single-file website (HTML with embedded CSS and JavaScript).
+Reply ONLY with one or more edit blocks in exactly this format, and nothing else:
+
+<<<<<<< SEARCH
+lines copied exactly from the current page
+=======
+the new lines that replace them
+>>>>>>> REPLACE
+
+Rules:
+- SEARCH must be copied character for character from the current page and match exactly one place;
+  include just enough surrounding lines to make it unique.
+- Keep blocks small and targeted; never repeat the whole page.
+- To add something, SEARCH for the line it should follow and repeat that line in the replacement.
+- To delete something, leave the replacement empty.
+- Keep the page valid: close every tag you open, and keep styles in <style> and scripts in <script>."""
+
+_BLOCK = re.compile(
+    r'<{5,9} ?SEARCH[^\n]*\n(.*?)\n?={5,9}[^\n]*\n(.*?)\n?>{5,9} ?REPLACE', re.DOTALL)
+
+# Tags whose open/close balance an edit must preserve
+CONTAINER_TAGS = {
+    'html', 'head', 'body', 'style', 'script', 'header', 'footer', 'nav', 'main', 'section', 'article',
+    'aside', 'div', 'form', 'ul', 'ol', 'table', 'a', 'button', 'span', 'p',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+}
+
+
+class EditError(Exception):
+    """The model's reply could not be applied; the site is left unchanged"""
+
+
+class _TagBalance(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.balance = Counter()
+
+    def handle_starttag(self, tag, attrs):
+        if tag in CONTAINER_TAGS:
+            self.balance[tag] += 1
+
+    def handle_startendtag(self, tag, attrs):
+        pass
+
+    def handle_endtag(self, tag):
+        if tag in CONTAINER_TAGS:
+            self.balance[tag] -= 1
+
+
+def tag_balance(code: str) -> Counter:
+    """Open minus close count per container tag"""
+    parser = _TagBalance()
+    parser.feed(code)
+    parser.close()
+    return Counter({tag: count for tag, count in parser.balance.items() if count})
+
+
+def parse_blocks(reply: str) -> list:
+    """[(search, replace), ...] from a reply; code fences around the blocks are ignored"""
+    return [(search, replace) for search, replace in _BLOCK.findall(reply.replace('\r\n', '\n'))]
+
+
+def _find(code: str, search: str):
+    """(start, end) of the single match of `search` in `code`; raises EditError when absent or ambiguous"""
+    count = code.count(search)
+    if count == 1:
+        start = code.index(search)
+        return start, start + len(search)
+    if count > 1:
+        raise EditError(f"matches {count} places; include more surrounding lines")
+
+    # Tolerate indentation and trailing whitespace differences, line by line
+    wanted = [line.strip() for line in search.strip('\n').split('\n')]
+    if not any(wanted):
+        raise EditError("is empty")
+    lines = code.split('\n')
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line) + 1)
+    stripped = [line.strip() for line in lines]
+    matches = [index for index in range(len(lines) - len(wanted) + 1)
+               if stripped[index:index + len(wanted)] == wanted]
+    if len(matches) != 1:
+        raise EditError("was not found in the page" if not matches else
+                        f"matches {len(matches)} places; include more surrounding lines")
+    start = matches[0]
+    return offsets[start], offsets[start + len(wanted)] - 1
+
+
+def apply_blocks(code: str, blocks: list) -> str:
+    """Apply every block or none: raises EditError listing the blocks that do not apply"""
+    if not blocks:
+        raise EditError("The reply contained no edit blocks")
+    errors = []
+    spans = []
+    for number, (search, replace) in enumerate(blocks, 1):
+        try:
+            start, end = _find(code, search)
+        except EditError as e:
+            errors.append(f"SEARCH block {number} {e}")
+            continue
+        spans.append((start, end, replace))
+    spans.sort()
+    for (_, end, _), (next_start, _, _) in zip(spans, spans[1:]):
+        if next_start < end:
+            errors.append("Two SEARCH blocks overlap; merge them into one")
+            break
+    if errors:
+        raise EditError('; '.join(errors))
+
+    # Right to left, so earlier offsets stay valid
+    for start, end, replace in reversed(spans):
+        code = code[:start] + replace + code[end:]
+    return code
+
+
+def validate_edit(before: str, after: str):
+    """The edited page must still be a complete document with the same tag balance as before"""
+    if after.strip() == before.strip():
+        raise EditError("The edit did not change the page")
+    if '</html>' in before.lower() and '</html>' not in after.lower():
+        raise EditError("The edit removed the end of the document")
+    before_balance, after_balance = tag_balance(before), tag_balance(after)
+    if before_balance != after_balance:
+        changed = sorted(tag for tag in set(before_balance) | set(after_balance)
+                         if before_balance[tag] != after_balance[tag])
+        raise EditError(f"The edit leaves unclosed or extra tags: {', '.join('<' + tag + '>' for tag in changed)}")
+
+
+def edit_website_code(code: str, instruction: str, complete, usage: dict, timings: StageTimer = None) -> str:
+    """
+    Apply an edit instruction to a page with targeted patches. `complete` runs
+    one completion like ai_service._create_completion; token usage of every
+    call is summed into `usage`. Returns the new code or raises EditError.
+    """
+    timings = StageTimer() if timings is None else timings
+    messages = [
+        {"role": "system", "content": EDIT_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Current page:\n\n{code}\n\nEdit request: {instruction}"},
+    ]
+    for attempt in range(2):
+        reply, finish_reason = complete(messages, settings.EDIT_MAX_TOKENS, usage, timings)
+        try:
+            if finish_reason == 'length':
+                raise EditError("The reply was cut off; use fewer, smaller blocks")
+            edited = apply_blocks(code, parse_blocks(reply))
+            validate_edit(code, edited)
+            return edited
+        except EditError as e:
+            if attempt:
+                raise
+            # One repair round with the reasons, against the same page
+            messages += [
+                {"role": "assistant", "content": reply},
+                {"role": "user", "content": f"Those edits could not be applied: {e}. "
+                                            "Reply again with corrected edit blocks for the same request."},
+            ]
@@ -0,0 +1,208 @@
+"""
+"Export all my sites": one ZIP of a user's site archives, streamed.
+
+The export is a plain ZIP whose members are the stored site archives
+(website_<id>.zip), stored without recompression. Sizes and CRCs come from
+the ArchiveBlob rows, so the whole layout - every header, the central
+directory and the total length - is known before the first byte is sent:
+
+1. a first pass over the sites computes the length and an ETag,
+2. the members are streamed from storage in 64 KB chunks,
+3. a last pass writes the central directory.
+
+Each pass walks the queryset with .iterator() and nothing is buffered in
+memory or on disk. The only per-site state is the size and CRC of archives
+stored before blobs, which have no ArchiveBlob row: up to LEGACY_CACHE_SIZE
+of them are kept for the later passes, the others are re-read by each pass,
+so memory stays bounded however many sites a user has. Because
+the bytes are deterministic, Range/If-Range requests resume an interrupted
+download; members that end before the requested offset are never read.
+If the sites change while streaming, the ETag check at the end of each pass
+aborts the response instead of sending a corrupt archive.
+"""
+
+import hashlib
+import struct
+import zlib
+from itertools import islice
+
+from django.contrib.auth.decorators import login_required
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
+
+from .models import ArchiveBlob, GeneratedSite
+from .storage import archive_storage, blob_name, parse_range, read_range
+
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 500
+LEGACY_CACHE_SIZE = 1000  # Sizes and CRCs of pre-blob archives kept between passes
+ZIP64_LIMIT = 0xFFFFFFFF
+# 1980-01-01 00:00, like the site archives themselves
+DOS_DATE, DOS_TIME = (0 << 9) | (1 << 5) | 1, 0
+
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+_CENTRAL_HEADER = struct.Struct('<4s6H3L5H2L')
+_END_RECORD = struct.Struct('<4s4H2LH')
+_ZIP64_END_RECORD = struct.Struct('<4sQ2H2L4Q')
+_ZIP64_LOCATOR = struct.Struct('<4sLQL')
+
+
+class ExportChanged(Exception):
+    """The selected sites changed while the export was being streamed"""
+
+
+def _entry_name(site_id):
+    return f"website_{site_id}.zip"
+
+
+def _crc32(name):
+    crc = 0
+    with archive_storage.open(name, 'rb') as f:
+        for chunk in f.chunks(CHUNK_SIZE):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+class SiteExport:
+    """Byte layout of the export ZIP for a queryset of sites"""
+
+    def __init__(self, sites):
+        self.sites = sites.exclude(generated_file='').exclude(generated_file__isnull=True).order_by('id')
+        # Per-site archives from before blobs have no stored CRC; the first LEGACY_CACHE_SIZE are kept here
+        self._legacy = {}
+        self.count = 0
+        self.length = 0
+        self.etag = None
+
+    def entries(self):
+        """(site_id, storage name, size, crc32) per site, in id order, via .iterator()"""
+        rows = self.sites.values_list('id', 'generated_file', 'archive_sha256').iterator(chunk_size=BATCH_SIZE)
+        while True:
+            batch = list(islice(rows, BATCH_SIZE))
+            if not batch:
+                return
+            blobs = {blob.sha256: blob for blob in
+                     ArchiveBlob.objects.filter(sha256__in=[sha256 for _, _, sha256 in batch if sha256])}
+            for site_id, name, sha256 in batch:
+                blob = blobs.get(sha256)
+                if blob and name == blob_name(sha256):
+                    if blob.crc32 is None:
+                        blob.crc32 = _crc32(name)
+                        ArchiveBlob.objects.filter(sha256=sha256).update(crc32=blob.crc32)
+                    yield site_id, name, blob.size, blob.crc32
+                else:
+                    legacy = self._legacy.get(site_id)
+                    if legacy is None:
+                        legacy = (archive_storage.size(name), _crc32(name))
+                        if len(self._legacy) < LEGACY_CACHE_SIZE:
+                            self._legacy[site_id] = legacy
+                    yield (site_id, name) + legacy
+
+    def plan(self):
+        """First pass: total length, member count and ETag"""
+        digest = hashlib.sha256()
+        offset = cd_size = 0
+        for site_id, name, size, crc in self.entries():
+            digest.update(f"{site_id}:{name}:{size}:{crc:08x};".encode())
+            entry_length = len(_entry_name(site_id))
+            cd_size += _CENTRAL_HEADER.size + entry_length + (12 if offset >= ZIP64_LIMIT else 0)
+            offset += _LOCAL_HEADER.size + entry_length + size
+            self.count += 1
+        self.etag = f'"{digest.hexdigest()[:32]}"'
+        zip64 = self.count >= 0xFFFF or offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT
+        self.length = offset + cd_size + _END_RECORD.size + (
+            _ZIP64_END_RECORD.size + _ZIP64_LOCATOR.size if zip64 else 0)
+        return self
+
+    def parts(self):
+        """The archive as a sequence of bytes and (storage name, size) parts, checked against the ETag"""
+        digest = hashlib.sha256()
+        offset = 0
+        for site_id, name, size, crc in self.entries():
+            digest.update(f"{site_id}:{name}:{size}:{crc:08x};".encode())
+            entry = _entry_name(site_id).encode()
+            yield _LOCAL_HEADER.pack(b'PK\x03\x04', 20, 0, 0, DOS_TIME, DOS_DATE, crc, size, size, len(entry), 0) + entry
+            yield name, size
+            offset += _LOCAL_HEADER.size + len(entry) + size
+        if f'"{digest.hexdigest()[:32]}"' != self.etag:
+            raise ExportChanged()
+        members_end = offset
+
+        digest = hashlib.sha256()
+        offset = cd_size = 0
+        for site_id, name, size, crc in self.entries():
+            digest.update(f"{site_id}:{name}:{size}:{crc:08x};".encode())
+            entry = _entry_name(site_id).encode()
+            extra = struct.pack('<2HQ', 1, 8, offset) if offset >= ZIP64_LIMIT else b''
+            record = _CENTRAL_HEADER.pack(
+                b'PK\x01\x02', 45 if extra else 20, 45 if extra else 20, 0, 0, DOS_TIME, DOS_DATE, crc, size, size,
+                len(entry), len(extra), 0, 0, 0, 0, min(offset, ZIP64_LIMIT),
+            ) + entry + extra
+            cd_size += len(record)
+            yield record
+            offset += _LOCAL_HEADER.size + len(entry) + size
+        if f'"{digest.hexdigest()[:32]}"' != self.etag:
+            raise ExportChanged()
+
+        if self.count >= 0xFFFF or members_end >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT:
+            yield _ZIP64_END_RECORD.pack(b'PK\x06\x06', _ZIP64_END_RECORD.size - 12, 45, 45, 0, 0,
+                                         self.count, self.count, cd_size, members_end)
+            yield _ZIP64_LOCATOR.pack(b'PK\x06\x07', 0, members_end + cd_size, 1)
+            yield _END_RECORD.pack(b'PK\x05\x06', 0, 0, 0xFFFF, 0xFFFF, ZIP64_LIMIT, ZIP64_LIMIT, 0)
+        else:
+            yield _END_RECORD.pack(b'PK\x05\x06', 0, 0, self.count, self.count, cd_size, members_end, 0)
+
+    def stream(self, start=0, end=None):
+        """Bytes start..end (inclusive) of the archive; members outside the range are not opened"""
+        end = self.length - 1 if end is None else end
+        position = 0
+        for part in self.parts():
+            if position > end:
+                return
+            if isinstance(part, bytes):
+                size = len(part)
+                if position + size > start:
+                    yield part[max(start - position, 0):end - position + 1]
+            else:
+                name, size = part
+                if position + size > start:
+                    yield from read_range(archive_storage, name, max(start - position, 0), min(size, end - position + 1),
+                                          CHUNK_SIZE)
+            position += size
+
+
+@require_safe
+@login_required
+def export_sites(request):
+    """Stream a ZIP of the user's site archives, or of ?ids=1,2,3; resumable with Range"""
+    sites = GeneratedSite.objects.filter(user=request.user, status='completed')
+    ids = [int(value) for value in request.GET.get('ids', '').split(',') if value.strip().isdigit()]
+    if ids:
+        sites = sites.filter(id__in=ids)
+    export = SiteExport(sites).plan()
+
+    byte_range = None
+    if request.headers.get('Range') and request.headers.get('If-Range', export.etag) == export.etag:
+        byte_range = parse_range(request.headers['Range'], export.length)
+        if byte_range is None and export.length:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{export.length}'
+            return response
+
+    start, end = byte_range or (0, export.length - 1)
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type='application/zip')
+    else:
+        response = StreamingHttpResponse(export.stream(start, end), content_type='application/zip')
+        if start == 0:
+            export.sites.update(downloads_count=F('downloads_count') + 1)
+    if byte_range:
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{export.length}'
+    response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = export.etag
+    response['Cache-Control'] = 'private, no-cache'
+    response['Content-Disposition'] = 'attachment; filename="my-websites.zip"'
+    return response
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from generator.webhooks import dispatch
+
+
+class Command(BaseCommand):
+    help = "Deliver due webhook events (for cron, when the in-process dispatcher is off)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='deliveries per pass (default WEBHOOK_BATCH_SIZE)')
+
+    def handle(self, *args, limit=None, **options):
+        totals = {}
+        while True:
+            outcomes = dispatch(limit)
+            for outcome, count in outcomes.items():
+                totals[outcome] = totals.get(outcome, 0) + count
+            if not outcomes:
+                break
+        summary = ', '.join(f"{count} {outcome}" for outcome, count in sorted(totals.items())) or 'nothing due'
+        self.stdout.write(self.style.SUCCESS(f"✅ Webhooks: {summary}"))
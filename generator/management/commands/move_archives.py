@@ -0,0 +1,39 @@
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+
+from generator.models import GeneratedSite
+from generator.storage import archive_name, archive_storage
+
+
+class Command(BaseCommand):
+    help = "Move archives from the old flat media/sites/ layout into the configured archive storage"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', action='store_true', help='leave the source files in MEDIA_ROOT')
+        parser.add_argument('--dry-run', action='store_true', help='only report what would move')
+
+    def handle(self, *args, keep=False, dry_run=False, **options):
+        # Sources are always read from the local media directory the old code wrote to
+        source = FileSystemStorage()
+        moved = missing = 0
+        sites = GeneratedSite.objects.exclude(generated_file='').exclude(generated_file__isnull=True)
+        for site_id, name in sites.values_list('id', 'generated_file').iterator(chunk_size=2000):
+            target = archive_name(site_id)
+            if name == target:
+                continue
+            if not source.exists(name):
+                missing += 1
+                continue
+            if dry_run:
+                self.stdout.write(f"{name} -> {target}")
+                moved += 1
+                continue
+            with source.open(name, 'rb') as f:
+                archive_storage.save(target, f)
+            GeneratedSite.objects.filter(id=site_id).update(generated_file=target)
+            if not keep:
+                source.delete(name)
+            moved += 1
+
+        verb = 'Would move' if dry_run else 'Moved'
+        self.stdout.write(self.style.SUCCESS(f"✅ {verb} {moved} archives ({missing} missing on disk)"))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from generator.retention import sweep, sweep_lock
+
+
+class Command(BaseCommand):
+    help = "Delete expired, failed and stuck sites, leaked temp dirs and orphaned archives, enforce the disk quota and purge expired sessions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='only report what would be removed')
+        parser.add_argument('--verify', action='store_true', help='also re-hash every archive against its checksum')
+        parser.add_argument('--batch-size', type=int, help='rows per delete batch (default SWEEP_BATCH_SIZE)')
+
+    def handle(self, *args, dry_run=False, verify=False, batch_size=None, **options):
+        with sweep_lock() as acquired:
+            if not acquired:
+                raise CommandError("Another sweeper is already running")
+            report = sweep(dry_run=dry_run, batch_size=batch_size, verify=verify)
+
+        for line in report.lines():
+            self.stdout.write(line)
+        verb = 'Would reclaim' if dry_run else 'Reclaimed'
+        self.stdout.write(self.style.SUCCESS(f"✅ {verb} {report.reclaimed_bytes / (1024 * 1024):.1f} MB"))
@@ -0,0 +1,240 @@
+"""
+Lightweight in-process metrics with a Prometheus text exposition.
+
+Counters and histograms live in the memory of each worker process, so a
+scrape returns the numbers of the worker that served it; scrape every
+worker (or run a single worker per metrics port) for complete totals.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+GENERATION_STAGES = (
+    'queue_wait',
+    'draft',
+    'upstream_plan',
+    'upstream_ttfb',
+    'upstream_total',
+    'extraction',
+    'minify',
+    'packaging',
+    'storage',
+    'db_persist',
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in sorted(labels.items())
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, dict(key), value
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][index] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, dict(series, counts=list(series['counts']))) for key, series in self._series.items()]
+        for key, series in items:
+            labels = dict(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['counts']):
+                cumulative += count
+                yield self.name + '_bucket', dict(labels, le=_format_value(bound)), cumulative
+            yield self.name + '_sum', labels, series['sum']
+            yield self.name + '_count', labels, series['count']
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """Call `collector()` before every render, to refresh gauges whose value lives outside this process"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"Warning: metrics collector failed: {e}")
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests_total = registry.register(Counter(
+    'aiwebgen_http_requests_total', 'HTTP requests handled, by view, method and status code.'))
+http_request_errors_total = registry.register(Counter(
+    'aiwebgen_http_request_errors_total', 'HTTP requests that ended in a 5xx response or an unhandled exception.'))
+http_request_duration_seconds = registry.register(Histogram(
+    'aiwebgen_http_request_duration_seconds', 'Wall-clock time spent handling HTTP requests, by view.'))
+generations_total = registry.register(Counter(
+    'aiwebgen_generations_total', 'Website generations, by final status.'))
+generation_stage_seconds = registry.register(Histogram(
+    'aiwebgen_generation_stage_seconds', 'Time spent in each stage of a website generation.'))
+upstream_calls_total = registry.register(Counter(
+    'aiwebgen_upstream_calls_total', 'Upstream LLM call attempts, by outcome (success, retry, failure, rejected).'))
+upstream_fallbacks_total = registry.register(Counter(
+    'aiwebgen_upstream_fallbacks_total', 'Generations served by the template fallback, by reason.'))
+upstream_circuit_state = registry.register(Gauge(
+    'aiwebgen_upstream_circuit_state', 'Upstream circuit breaker state shared by all workers: 0 closed, 1 half-open, 2 open.'))
+site_edits_total = registry.register(Counter(
+    'aiwebgen_site_edits_total', 'Edit requests for existing sites, by outcome (applied, rejected, unavailable).'))
+webhook_deliveries_total = registry.register(Counter(
+    'aiwebgen_webhook_deliveries_total', 'Webhook delivery attempts, by outcome (delivered, retry, dead).'))
+sweep_deleted_total = registry.register(Counter(
+    'aiwebgen_sweep_deleted_total', 'Rows and files removed by the retention sweeper, by reason and kind.'))
+sweep_reclaimed_bytes_total = registry.register(Counter(
+    'aiwebgen_sweep_reclaimed_bytes_total', 'Storage reclaimed by the retention sweeper, by reason.'))
+
+
+class StageTimer:
+    """Collects per-stage durations (in seconds) for a single generation"""
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def as_dict(self) -> dict:
+        return {stage: round(seconds, 4) for stage, seconds in self.stages.items()}
+
+
+def record_generation(site, timings: StageTimer):
+    """Export one generation's stage timings and outcome, and store the timings on the site"""
+    generations_total.inc(status=site.status)
+    for stage, seconds in timings.stages.items():
+        generation_stage_seconds.observe(seconds, stage=stage)
+
+    # A narrow UPDATE so the final save's own db_persist time is included
+    site.stage_timings = timings.as_dict()
+    type(site).objects.filter(pk=site.pk).update(stage_timings=site.stage_timings)
+
+
+class MetricsMiddleware:
+    """Counts requests, errors and latency per resolved view"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.metrics_started_at = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        except Exception:
+            self._record(request, 500)
+            raise
+        self._record(request, response.status_code)
+        return response
+
+    def _record(self, request, status_code: int):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        http_requests_total.inc(view=view, method=request.method, status=status_code)
+        if status_code >= 500:
+            http_request_errors_total.inc(view=view)
+        http_request_duration_seconds.observe(time.perf_counter() - request.metrics_started_at, view=view)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; protected by METRICS_TOKEN when one is configured"""
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden('Forbidden')
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0005_add_otp_fields'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedsite',
+            name='business_type',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='generatedsite',
+            name='completion_tokens',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='generatedsite',
+            name='finish_reason',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='generatedsite',
+            name='max_tokens',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='generatedsite',
+            name='prompt_tokens',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='generatedsite',
+            name='total_tokens',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='generatedsite',
+            index=models.Index(fields=['business_type', 'status', '-created_at'], name='site_type_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0006_token_accounting'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedsite',
+            name='stage_timings',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
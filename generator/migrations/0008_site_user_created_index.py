@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0007_generation_stage_timings'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='generatedsite',
+            index=models.Index(fields=['user', '-created_at'], name='site_user_created_idx'),
+        ),
+    ]
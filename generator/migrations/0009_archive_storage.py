@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:05
+
+import generator.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0008_site_user_created_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='generatedsite',
+            name='generated_file',
+            field=models.FileField(blank=True, null=True, storage=generator.storage.get_archive_storage, upload_to='sites/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0009_archive_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedsite',
+            name='archive_sha256',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0011_archive_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archiveblob',
+            name='crc32',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0012_archive_blob_crc32'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='generatedsite',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('draft', 'Draft'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0013_site_draft_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('instruction', models.TextField(blank=True, default='')),
+                ('generated_code', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('prompt_tokens', models.IntegerField(blank=True, null=True)),
+                ('completion_tokens', models.IntegerField(blank=True, null=True)),
+                ('total_tokens', models.IntegerField(blank=True, null=True)),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='generator.generatedsite')),
+            ],
+            options={
+                'ordering': ['site', '-number'],
+                'constraints': [models.UniqueConstraint(fields=('site', 'number'), name='site_revision_number_unique')],
+            },
+        ),
+    ]
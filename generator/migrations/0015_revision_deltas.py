@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:58
+
+import hashlib
+import zlib
+
+from django.db import migrations, models
+
+
+def code_to_snapshots(apps, schema_editor):
+    SiteRevision = apps.get_model('generator', 'SiteRevision')
+    for revision in SiteRevision.objects.all().iterator():
+        code = revision.generated_code.encode('utf-8')
+        revision.is_snapshot = True
+        revision.data = zlib.compress(code, 9)
+        revision.code_size = len(code)
+        revision.code_sha256 = hashlib.sha256(code).hexdigest()
+        revision.save(update_fields=['is_snapshot', 'data', 'code_size', 'code_sha256'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0014_site_revisions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='siterevision',
+            name='is_snapshot',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='siterevision',
+            name='data',
+            field=models.BinaryField(default=b''),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='siterevision',
+            name='code_size',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='siterevision',
+            name='code_sha256',
+            field=models.CharField(default='', max_length=64),
+        ),
+        migrations.RunPython(code_to_snapshots, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='siterevision',
+            name='generated_code',
+        ),
+    ]
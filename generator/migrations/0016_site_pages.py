@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0015_revision_deltas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedsite',
+            name='pages',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0018_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedsite',
+            name='quota_charged',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,309 @@
+"""
+Post-processing for generated site packages.
+
+Conservative, dependency-free minifiers for the HTML, CSS and JavaScript the
+model produces, plus gzip/brotli siblings that static hosts (nginx
+gzip_static/brotli_static, Netlify, S3 + CloudFront) can serve as-is.
+
+The minifiers only remove what is provably dead: comments, whitespace that
+the grammar ignores and exact duplicate CSS rules. JavaScript keeps its line
+breaks so automatic semicolon insertion behaves exactly as before.
+"""
+
+import gzip
+import re
+
+try:
+    import brotli
+except ImportError:  # Optional: pip install brotli to also ship .br files
+    brotli = None
+
+# Files that get precompressed siblings
+COMPRESSIBLE_EXTENSIONS = ('.html', '.css', '.js')
+
+
+# ---------- CSS ----------
+
+# No whitespace is needed after these characters...
+_CSS_TIGHT_AFTER = set('{};,>~(:')
+# ...or before these. ':' and '(' are excluded: "a :hover" and "and (max-width)" need the space.
+_CSS_TIGHT_BEFORE = set('{};,>~)')
+
+
+def _css_tokens(css: str):
+    """Split CSS into (kind, text) tokens where kind is 'string', 'comment', 'space' or 'code'"""
+    i, n = 0, len(css)
+    while i < n:
+        char = css[i]
+        if char in '"\'':
+            j = i + 1
+            while j < n and css[j] != char:
+                j += 2 if css[j] == '\\' else 1
+            yield 'string', css[i:j + 1]
+            i = j + 1
+        elif css.startswith('/*', i):
+            end = css.find('*/', i + 2)
+            end = n if end < 0 else end + 2
+            if css.startswith('/*!', i):  # License comments are kept
+                yield 'comment', css[i:end]
+            i = end
+        elif char.isspace():
+            j = i
+            while j < n and css[j].isspace():
+                j += 1
+            yield 'space', ' '
+            i = j
+        else:
+            j = i
+            while j < n and not css[j].isspace() and css[j] not in '"\'' and not css.startswith('/*', j):
+                j += 1
+            yield 'code', css[i:j]
+            i = j
+
+
+def _css_statements(css: str):
+    """Split minified CSS into top-level statements: rules, @-blocks and @-statements"""
+    statements, depth, start, quote = [], 0, 0, None
+    i = 0
+    while i < len(css):
+        char = css[i]
+        if quote:
+            if char == '\\':
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                statements.append(css[start:i + 1])
+                start = i + 1
+        elif char == ';' and depth == 0:
+            statements.append(css[start:i + 1])
+            start = i + 1
+        i += 1
+    if css[start:].strip():
+        statements.append(css[start:])
+    return statements
+
+
+def dedupe_css_rules(css: str) -> str:
+    """Drop exact duplicate rules, keeping the last copy so the cascade is unchanged"""
+    statements = []
+    for statement in _css_statements(css):
+        # Recurse into conditional groups such as @media and @supports
+        if statement.startswith(('@media', '@supports')) and statement.endswith('}'):
+            head, body = statement.split('{', 1)
+            statement = head + '{' + dedupe_css_rules(body[:-1]) + '}'
+        statements.append(statement)
+
+    seen, kept = set(), []
+    for statement in reversed(statements):
+        # @import/@charset must keep their position
+        if statement in seen and not statement.startswith(('@import', '@charset')):
+            continue
+        seen.add(statement)
+        kept.append(statement)
+    return ''.join(reversed(kept))
+
+
+def minify_css(css: str) -> str:
+    """Strip comments and insignificant whitespace, then dedupe repeated rules"""
+    tokens = list(_css_tokens(css))
+    out = []  # (kind, text)
+    for index, (kind, text) in enumerate(tokens):
+        if kind == 'space':
+            before = out[-1][1][-1] if out else ''
+            after = tokens[index + 1][1][:1] if index + 1 < len(tokens) else ''
+            next_kind = tokens[index + 1][0] if index + 1 < len(tokens) else ''
+            if (not before or not after or before in _CSS_TIGHT_AFTER or after in _CSS_TIGHT_BEFORE
+                    or 'comment' in (out[-1][0], next_kind)):
+                continue
+        elif kind == 'code':
+            # The last declaration needs no ';', but only outside strings: content:";}" stays as is
+            text = text.replace(';}', '}')
+            if text.startswith('}') and out and out[-1][0] == 'code' and out[-1][1].endswith(';'):
+                out[-1] = ('code', out[-1][1][:-1])
+                if not out[-1][1]:
+                    out.pop()
+        out.append((kind, text))
+    return dedupe_css_rules(''.join(text for _, text in out))
+
+
+# ---------- JavaScript ----------
+
+# A '/' after one of these starts a regular expression literal, not a division
+_JS_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_JS_REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete', 'void', 'throw', 'yield', 'await'}
+# Spaces next to these are never significant ('+', '-', '/' and '.' are left alone: "a + +b", "1 .toString()")
+_JS_TIGHT = set('{}();,=:[]<>!&|?*%^~')
+
+
+def _js_tokens(js: str):
+    """Split JavaScript into (kind, text) tokens: 'literal', 'space', 'newline' or 'code'"""
+    i, n = 0, len(js)
+    last = ''  # Last significant code emitted, for regex detection
+    while i < n:
+        char = js[i]
+        if char in '"\'`':
+            j = i + 1
+            while j < n and js[j] != char:
+                j += 2 if js[j] == '\\' else 1
+            yield 'literal', js[i:j + 1]
+            last, i = 'a', j + 1
+        elif js.startswith('//', i):
+            end = js.find('\n', i)
+            i = n if end < 0 else end
+        elif js.startswith('/*', i):
+            end = js.find('*/', i + 2)
+            end = n if end < 0 else end + 2
+            comment = js[i:end]
+            if comment.startswith('/*!'):
+                yield 'code', comment
+            elif '\n' in comment:
+                yield 'newline', '\n'
+            else:
+                yield 'space', ' '
+            i = end
+        elif char == '/' and (not last or last[-1] in _JS_REGEX_PRECEDERS or last in _JS_REGEX_KEYWORDS):
+            j, in_class = i + 1, False
+            while j < n and js[j] != '\n':
+                if js[j] == '\\':
+                    j += 2
+                    continue
+                if js[j] == '[':
+                    in_class = True
+                elif js[j] == ']':
+                    in_class = False
+                elif js[j] == '/' and not in_class:
+                    break
+                j += 1
+            j += 1
+            while j < n and (js[j].isalnum() or js[j] == '_'):
+                j += 1
+            yield 'literal', js[i:j]
+            last, i = 'a', j
+        elif char.isspace():
+            j = i
+            while j < n and js[j].isspace():
+                j += 1
+            yield ('newline', '\n') if '\n' in js[i:j] else ('space', ' ')
+            i = j
+        elif char.isalnum() or char in '_$':
+            j = i
+            while j < n and (js[j].isalnum() or js[j] in '_$'):
+                j += 1
+            last = js[i:j]
+            yield 'code', last
+            i = j
+        else:
+            last = char
+            yield 'code', char
+            i += 1
+
+
+def minify_js(js: str) -> str:
+    """Strip comments, indentation and blank lines; line breaks are kept where ASI could need them"""
+    out = []
+    pending = None  # 'space' or 'newline' waiting to see the next token
+    for kind, text in _js_tokens(js):
+        if kind in ('space', 'newline'):
+            if pending != 'newline':
+                pending = kind
+            continue
+        if pending and out:
+            before, after = out[-1][-1], text[0]
+            if pending == 'newline':
+                if before not in '{;,(' and after not in '})':
+                    out.append('\n')
+            elif before not in _JS_TIGHT and after not in _JS_TIGHT:
+                out.append(' ')
+        pending = None
+        out.append(text)
+    return ''.join(out)
+
+
+# ---------- HTML ----------
+
+_HTML_RAW_BLOCK = re.compile(r'(<(pre|textarea|script|style)\b[^>]*>[\s\S]*?</\2\s*>)', re.IGNORECASE)
+_HTML_COMMENT = re.compile(r'<!--(?!\[if|<!)[\s\S]*?-->')
+# Whitespace around these block and metadata tags never renders. Inline-level elements (svg, select,
+# iframe, video, br, ...) and list items, often styled inline-block in navs, keep their collapsed space.
+_HTML_BLOCK_TAGS = (
+    'html|head|body|title|meta|link|base|script|style|noscript|div|section|article|aside|header|footer|'
+    'nav|main|p|h[1-6]|ul|ol|dl|dt|dd|table|thead|tbody|tfoot|tr|th|td|form|fieldset|legend|figure|'
+    'figcaption|blockquote|hr|!doctype'
+)
+_HTML_BLOCK_SPACE = re.compile(r'\s*(</?(?:%s)\b[^>]*>)\s*' % _HTML_BLOCK_TAGS, re.IGNORECASE)
+
+
+def _minify_raw_block(block: str) -> str:
+    """Minify inline <style> and plain <script> contents; <pre>/<textarea> are left untouched"""
+    match = re.match(r'(<(\w+)\b[^>]*>)([\s\S]*?)(</\2\s*>)$', block, re.IGNORECASE)
+    open_tag, tag, body, close_tag = match.group(1), match.group(2).lower(), match.group(3), match.group(4)
+    if tag == 'style':
+        return open_tag + minify_css(body) + close_tag
+    if tag == 'script':
+        script_type = re.search(r'type\s*=\s*["\']?([^"\'\s>]+)', open_tag, re.IGNORECASE)
+        if not script_type or script_type.group(1).lower() in ('text/javascript', 'module', 'application/javascript'):
+            return open_tag + minify_js(body).strip() + close_tag
+    return block
+
+
+def minify_html(html: str) -> str:
+    """
+    Remove comments and collapse whitespace runs to one space outside <pre>,
+    <textarea>, <script> and <style>; the space is dropped only next to block tags
+    """
+    parts = _HTML_RAW_BLOCK.split(html)
+    out = []
+    # split() yields: text, raw block, tag name, text, raw block, tag name, ...
+    for index in range(0, len(parts), 3):
+        text = re.sub(r'\s+', ' ', _HTML_COMMENT.sub('', parts[index]))
+        text = _HTML_BLOCK_SPACE.sub(r'\1', text)
+        # Whitespace next to a <script>, <style> or <pre> block never renders
+        if index > 0 and parts[index - 1].lower() != 'textarea':
+            text = text.lstrip()
+        if index + 2 < len(parts) and parts[index + 2].lower() != 'textarea':
+            text = text.rstrip()
+        out.append(text)
+        if index + 1 < len(parts):
+            out.append(_minify_raw_block(parts[index + 1]))
+    return ''.join(out).strip()
+
+
+# ---------- Precompression ----------
+
+def optimize_package(files: dict, minify: bool = True, keep_sources: bool = False, compress: bool = True) -> dict:
+    """
+    Turn {name: text} site files into the {name: bytes} entries of the package:
+    minified copies, their .gz/.br siblings and, with keep_sources, the
+    originals under src/.
+    """
+    minifiers = {'.html': minify_html, '.css': minify_css, '.js': minify_js}
+    package = {}
+    for name, text in files.items():
+        suffix = name[name.rfind('.'):]
+        if minify and suffix in minifiers:
+            package[name] = minifiers[suffix](text).encode('utf-8')
+            if keep_sources:
+                package[f'src/{name}'] = text.encode('utf-8')
+        else:
+            package[name] = text.encode('utf-8')
+    if compress:
+        for name, data in list(package.items()):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and not name.startswith('src/'):
+                for suffix, encoded in precompress(data).items():
+                    package[name + suffix] = encoded
+    return package
+
+
+def precompress(data: bytes) -> dict:
+    """Gzip (and brotli, when installed) encodings of `data`, keyed by file suffix; only smaller ones are returned"""
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    return {suffix: encoded for suffix, encoded in variants.items() if len(encoded) < len(data)}
@@ -1,7 +1,11 @@
+import secrets
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from .storage import get_archive_storage
+
 class UserProfile(models.Model):
     """Extended user profile for tracking usage and subscriptions"""
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -65,6 +69,30 @@ class UserProfile(models.Model):
             return 999  # Enterprise: virtually unlimited
         return 0
 
+    def can_generate_multipage(self):
+        """Multi-page sites are included in the MULTIPAGE_PLANS subscriptions while they are active"""
+        from django.conf import settings
+        return (self.subscription_plan in settings.MULTIPAGE_PLANS and self.subscription_expires is not None
+                and self.subscription_expires > timezone.now())
+
+    def reserve_generation(self):
+        """
+        Charge one generation before it is queued, in one conditional UPDATE so
+        concurrent requests cannot spend the same free credit twice. Returns
+        False when the quota is used up.
+        """
+        if not self.can_generate_website():
+            return False
+        profiles = UserProfile.objects.filter(pk=self.pk)
+        charge = {'websites_generated': models.F('websites_generated') + 1}
+        if self.subscription_plan == 'free':
+            profiles = profiles.filter(free_websites_remaining__gt=0)
+            charge['free_websites_remaining'] = models.F('free_websites_remaining') - 1
+        if not profiles.update(**charge):
+            return False
+        self.refresh_from_db(fields=['websites_generated', 'free_websites_remaining'])
+        return True
+
     def decrement_usage(self):
         """Decrement usage count when a website is generated"""
         if self.subscription_plan == 'free':
@@ -134,14 +162,28 @@ class GeneratedSite(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(
         max_length=20,
-        choices=[("pending", "Pending"), ("completed", "Completed"), ("failed", "Failed")],
+        # draft: the instant template page of a progressive generation, replaced by the LLM page when it is ready
+        choices=[("pending", "Pending"), ("draft", "Draft"), ("completed", "Completed"), ("failed", "Failed")],
         default="pending"
     )
-    generated_file = models.FileField(upload_to="sites/", null=True, blank=True)  # zip file of generated website
-    generated_code = models.TextField(null=True, blank=True)  # HTML code
-    is_premium = models.BooleanField(default=False)  # Track if this was a premium generation
+    generated_file = models.FileField(upload_to="sites/", storage=get_archive_storage, null=True, blank=True)  # zip file of generated website, see storage.blob_name
+    archive_sha256 = models.CharField(max_length=64, blank=True, default='', db_index=True)  # Checksum of generated_file; the ArchiveBlob key
+    generated_code = models.TextField(null=True, blank=True)  # HTML code (the home page of a multi-page site)
+    pages = models.JSONField(default=dict, blank=True)  # {file name: HTML} of the other pages of a multi-page site
+    is_premium = models.BooleanField(default=False)  # Track if this was a premium (multi-page) generation
     generation_time = models.FloatField(null=True, blank=True)  # Time taken to generate
     downloads_count = models.IntegerField(default=0)  # Track download count
+    quota_charged = models.BooleanField(default=False)  # The owner was charged when it was queued, refunded if it fails
+
+    # Token accounting (filled from the upstream usage block)
+    business_type = models.CharField(max_length=50, blank=True, default='')  # extract_business_type() category
+    max_tokens = models.IntegerField(null=True, blank=True)  # Completion budget requested upstream
+    prompt_tokens = models.IntegerField(null=True, blank=True)
+    completion_tokens = models.IntegerField(null=True, blank=True)
+    total_tokens = models.IntegerField(null=True, blank=True)
+    finish_reason = models.CharField(max_length=20, blank=True, default='')
+
+    stage_timings = models.JSONField(null=True, blank=True)  # Seconds per generation stage, see metrics.GENERATION_STAGES
 
     def __str__(self):
         username = self.user.username if self.user else "Anonymous"
@@ -149,6 +191,111 @@ class GeneratedSite(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Dashboard listing and monthly usage counts are per user, newest first
+            models.Index(fields=['user', '-created_at'], name='site_user_created_idx'),
+            # Used by the max_tokens predictor to sample recent completions per category
+            models.Index(fields=['business_type', 'status', '-created_at'], name='site_type_status_created_idx'),
+            # Admin changelist ordering (created_at, then pk) and date hierarchy
+            models.Index(fields=['-created_at', '-id'], name='site_created_idx'),
+        ]
+
+
+class ArchiveBlob(models.Model):
+    """A unique site archive, stored once and shared by every site whose package hashed to it"""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField()
+    crc32 = models.BigIntegerField(null=True, blank=True)  # For the ZIP headers of the streaming export
+    ref_count = models.PositiveIntegerField(default=0)  # Sites pointing at it; the file is deleted at zero
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} sites)"
+
+
+class SiteRevision(models.Model):
+    """
+    One version of a site's code: the original generation is number 1, every
+    edit adds the next. The code is stored compressed, as a full snapshot or
+    as a delta against the previous revision; see revisions.py.
+    """
+    site = models.ForeignKey(GeneratedSite, on_delete=models.CASCADE, related_name='revisions')
+    number = models.PositiveIntegerField()
+    instruction = models.TextField(blank=True, default='')  # The edit request; empty for the original
+    is_snapshot = models.BooleanField(default=True)
+    data = models.BinaryField()  # zlib: the full code for a snapshot, else the delta against number - 1
+    code_size = models.PositiveIntegerField(default=0)  # Bytes of the rebuilt code
+    code_sha256 = models.CharField(max_length=64, default='')  # Checked whenever the code is rebuilt
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Token accounting of the edit (of the generation, for number 1)
+    prompt_tokens = models.IntegerField(null=True, blank=True)
+    completion_tokens = models.IntegerField(null=True, blank=True)
+    total_tokens = models.IntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Site {self.site_id} revision {self.number}"
+
+    class Meta:
+        ordering = ['site', '-number']
+        constraints = [
+            # Also rejects the second of two concurrent edits of the same revision
+            models.UniqueConstraint(fields=['site', 'number'], name='site_revision_number_unique'),
+        ]
+
+
+def _webhook_secret():
+    return secrets.token_hex(32)
+
+
+class Webhook(models.Model):
+    """An account's endpoint, POSTed a signed event when one of its sites completes or fails; see webhooks.py"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='webhooks')
+    url = models.URLField(max_length=500)
+    secret = models.CharField(max_length=64, default=_webhook_secret)  # HMAC key of the X-Webhook-Signature header
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.url}"
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+class WebhookDelivery(models.Model):
+    """
+    One event for one webhook: written in the transaction that changed the
+    site's status (an outbox), then delivered and retried by the dispatcher.
+    Deliveries that exhaust WEBHOOK_MAX_ATTEMPTS are kept as 'dead'.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('delivered', 'Delivered'),
+        ('dead', 'Dead'),
+    ]
+
+    webhook = models.ForeignKey(Webhook, on_delete=models.CASCADE, related_name='deliveries')
+    site = models.ForeignKey(GeneratedSite, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    event = models.CharField(max_length=40)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)  # Also the lease of a claimed delivery
+    last_status_code = models.PositiveIntegerField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.event} for site {self.site_id} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # The dispatcher's due-work scan
+            models.Index(fields=['status', 'next_attempt_at'], name='webhook_delivery_due_idx'),
+        ]
 
 
 class Suggestion(models.Model):
@@ -231,3 +378,7 @@ class Payment(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Admin changelist ordering (created_at, then pk) and date hierarchy
+            models.Index(fields=['-created_at', '-id'], name='payment_created_idx'),
+        ]
@@ -0,0 +1,258 @@
+"""
+Multi-page site generation (premium plans).
+
+A short planning call returns a site map: the site title, shared design
+tokens and up to MULTIPAGE_MAX_PAGES pages. The shared stylesheet and the
+main content of every page are then generated as separate completions,
+concurrently on SECTION_WORKERS threads like sections.py. The header
+navigation and the footer are rendered locally from the site map, so
+every page links the others by their relative file names and the model
+never writes (or bills for) them more than once. Each page completion only
+carries that page's own content, so the cost per page stays flat as the
+page count grows.
+
+The pages come back as {file name: HTML}. index.html embeds the shared
+stylesheet and script inline; it becomes the site's generated_code, so
+edits, revisions and previews treat it like a single-page site. The other
+pages link styles.css and script.js. At packaging, extract_shared_assets()
+moves the <style> blocks of all pages into one styles.css, keeping each
+distinct block only once. script.js holds SHARED_SCRIPT (and any block every
+page inlines); scripts written for one page go to that page's own <page>.js.
+"""
+
+import html
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .metrics import StageTimer
+from .sections import (clean_css, clean_fragment, complete_part, default_title, describe_tokens, parse_design_tokens,
+                       parse_json_reply)
+
+DEFAULT_PAGES = [
+    {'slug': 'index', 'title': 'Home', 'brief': 'Hero with the pitch and a call to action, highlights and testimonials'},
+    {'slug': 'about', 'title': 'About', 'brief': 'The story, values and team of the business'},
+    {'slug': 'services', 'title': 'Services', 'brief': 'The menu, products or services with descriptions and prices'},
+    {'slug': 'contact', 'title': 'Contact', 'brief': 'Contact details, opening hours, a map placeholder and a contact form'},
+]
+
+SITE_MAP_SYSTEM_PROMPT = """You are a web designer planning a multi-page website.
+Reply with JSON only, no explanations and no code fences."""
+
+PAGE_SYSTEM_PROMPT = """You are an expert web developer building one page of a multi-page website.
+Reply with the page's main content only: no DOCTYPE, <html>, <head>, <body>, header, navigation or footer, no code fences.
+Put the styles of this page in one <style> block and any JavaScript in one <script> block.
+Use the site's CSS custom properties for colours, fonts, radii and spacing instead of hard-coded values.
+Make it mobile responsive, professional and complete. Do not truncate the response."""
+
+# Styles of the locally rendered header, navigation and footer; the generated stylesheet builds on them
+CHROME_CSS = """.site-header { position: sticky; top: 0; z-index: 10; background: var(--color-background); box-shadow: 0 1px 4px rgba(0,0,0,.08); }
+.site-header .container { display: flex; align-items: center; justify-content: space-between; padding-top: var(--space); padding-bottom: var(--space); }
+.site-logo { font-family: var(--font-heading); font-weight: 700; font-size: 1.25rem; color: var(--color-primary); text-decoration: none; }
+.site-nav a { margin-left: 1.25rem; color: var(--color-text); text-decoration: none; }
+.site-nav a.active { color: var(--color-primary); font-weight: 600; }
+.nav-toggle { display: none; background: none; border: 0; font-size: 1.5rem; cursor: pointer; }
+.site-footer { padding: 2rem 0; background: var(--color-surface); color: var(--color-muted); text-align: center; }
+.site-footer nav a { margin: 0 .5rem; color: var(--color-muted); }
+@media (max-width: 768px) {
+  .nav-toggle { display: block; }
+  .site-nav { display: none; position: absolute; top: 100%; left: 0; right: 0; background: var(--color-background); padding: var(--space); }
+  .site-nav.open { display: flex; flex-direction: column; }
+  .site-nav a { margin: .5rem 0; }
+}"""
+
+SHARED_SCRIPT = """document.querySelectorAll('.nav-toggle').forEach(function (button) {
+  button.addEventListener('click', function () {
+    var nav = document.querySelector('.site-nav');
+    var open = nav.classList.toggle('open');
+    button.setAttribute('aria-expanded', open ? 'true' : 'false');
+  });
+});"""
+
+_HREF = re.compile(r'href=(["\'])([^"\']*)\1', re.IGNORECASE)
+
+
+def generate_multipage(prompt: str, complete, usage: dict, timings: StageTimer) -> dict:
+    """
+    Plan a site map, then generate the stylesheet and the pages concurrently.
+    `complete` runs one completion like ai_service._create_completion; token
+    usage of every call is summed into `usage`, and `timings` gets
+    upstream_plan plus upstream_ttfb/upstream_total for the whole fan-out.
+    Returns {file name: HTML}, index.html first.
+    """
+    started = time.perf_counter()
+    plan_usage, plan_timings = {}, StageTimer()
+    site_map = plan_site(prompt, complete, plan_usage, plan_timings)
+    timings.add('upstream_plan', plan_timings.stages.get('upstream_total', 0.0))
+    timings.add('upstream_ttfb', plan_timings.stages.get('upstream_ttfb', 0.0))
+
+    pages = site_map['pages']
+    parts = len(pages) + 1
+    jobs = [_stylesheet_messages(prompt, site_map, parts)]
+    jobs += [_page_messages(prompt, site_map, index, parts) for index in range(len(pages))]
+    workers = max(1, min(settings.SECTION_WORKERS, len(jobs)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='page') as pool:
+        results = list(pool.map(lambda messages: complete_part(complete, messages, settings.SECTION_MAX_TOKENS), jobs))
+    timings.add('upstream_total', time.perf_counter() - started)
+
+    call_usages = [plan_usage] + [part_usage for _, _, part_usage in results]
+    for key in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+        usage[key] = usage.get(key, 0) + sum(call_usage.get(key, 0) for call_usage in call_usages)
+    usage['max_tokens'] = sum(call_usage.get('max_tokens', 0) for call_usage in call_usages)
+    truncated = [pages[index - 1]['slug'] if index else 'stylesheet'
+                 for index, (_, finish_reason, _) in enumerate(results) if finish_reason == 'length']
+    usage['finish_reason'] = 'length' if truncated else 'stop'
+    if truncated:
+        print(f"Warning: Pages truncated due to token limit: {', '.join(truncated)}")
+
+    stylesheet = CHROME_CSS + '\n' + clean_css(results[0][0])
+    slugs = [page['slug'] for page in pages]
+    return {
+        f"{page['slug']}.html": render_page(site_map, page, fix_links(clean_fragment(content), slugs), stylesheet)
+        for page, (content, _, _) in zip(pages, results[1:])
+    }
+
+
+def plan_site(prompt: str, complete, usage: dict, timings: StageTimer) -> dict:
+    """
+    Ask for the site map: {"title", "tokens": {--name: value}, "pages": [{"slug", "title", "brief"}]}.
+    A reply that cannot be parsed falls back to the default pages.
+    """
+    messages = [
+        {"role": "system", "content": SITE_MAP_SYSTEM_PROMPT},
+        {"role": "user", "content": f"""Plan a multi-page website for: {prompt}
+
+Return a JSON site map of this shape:
+{{"title": "Site name", "tokens": {{"--color-primary": "#hex", "--font-body": "font stack", ...}}, "pages": [{{"slug": "index", "title": "Home", "brief": "what this page contains"}}, ...]}}
+
+- tokens: the shared design tokens as CSS custom properties (colours, fonts, radius, spacing)
+- pages: 2 to {settings.MULTIPAGE_MAX_PAGES} pages with lowercase-hyphenated slugs, the home page first with slug "index", typically {', '.join(page['slug'] for page in DEFAULT_PAGES)}
+- brief: one sentence with the concrete content of the page for this business"""},
+    ]
+    content, _ = complete(messages, settings.PLAN_MAX_TOKENS, usage, timings)
+    try:
+        return _parse_site_map(content, prompt)
+    except (ValueError, TypeError, AttributeError, KeyError) as e:
+        print(f"Warning: Unusable site map ({e}), using the default pages")
+        return {'title': default_title(prompt), 'tokens': parse_design_tokens(None),
+                'pages': [dict(page) for page in DEFAULT_PAGES]}
+
+
+def render_page(site_map: dict, page: dict, content: str, stylesheet: str) -> str:
+    """A complete page: shared header and footer around the content; index.html also carries the shared assets"""
+    title = html.escape(site_map['title'])
+    links = []
+    for other in site_map['pages']:
+        current = ' class="active" aria-current="page"' if other['slug'] == page['slug'] else ''
+        links.append(f'<a href="{other["slug"]}.html"{current}>{html.escape(other["title"])}</a>')
+    if page['slug'] == 'index':
+        root = ''.join(f"    {name}: {value};\n" for name, value in site_map['tokens'].items())
+        assets = f"<style>\n:root {{\n{root}}}\n{stylesheet}\n</style>"
+        script = f"<script>\n{SHARED_SCRIPT}\n</script>"
+    else:
+        assets = '<link rel="stylesheet" href="styles.css">'
+        script = '<script src="script.js"></script>'
+    page_title = title if page['slug'] == 'index' else f"{html.escape(page['title'])} - {title}"
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>{page_title}</title>
+{assets}
+</head>
+<body>
+<header class="site-header">
+<div class="container">
+<a class="site-logo" href="index.html">{title}</a>
+<button class="nav-toggle" aria-label="Menu" aria-expanded="false">&#9776;</button>
+<nav class="site-nav">{''.join(links)}</nav>
+</div>
+</header>
+<main id="{page['slug']}">
+{content}
+</main>
+<footer class="site-footer">
+<div class="container">
+<nav>{''.join(links)}</nav>
+<p>&copy; {title}</p>
+</div>
+</footer>
+{script}
+</body>
+</html>"""
+
+
+def fix_links(content: str, slugs: list) -> str:
+    """Point links at sibling pages ("/about", "about/", "#contact", "/") to their relative .html file names"""
+    def relative(match):
+        quote, href = match.groups()
+        path, hash_mark, fragment = href.partition('#')
+        target = path.strip().lstrip('./').rstrip('/').lower()
+        if target.endswith('.html'):
+            target = target[:-5]
+        if not path and fragment in slugs:
+            target, fragment, hash_mark = fragment, '', ''  # An anchor named after another page
+        elif not path or '://' in path or path.startswith(('mailto:', 'tel:', 'javascript:')):
+            return match.group(0)
+        if target in ('', 'home'):
+            target = 'index'
+        if target not in slugs:
+            return match.group(0)
+        return f'href={quote}{target}.html{hash_mark}{fragment}{quote}'
+    return _HREF.sub(relative, content)
+
+
+def _parse_site_map(content: str, prompt: str) -> dict:
+    data = parse_json_reply(content)
+
+    pages, seen = [], set()
+    for page in data['pages']:
+        slug = re.sub(r'[^a-z0-9]+', '-', str(page['slug']).lower()).strip('-')
+        slug = 'index' if slug in ('home', 'index-html') else slug
+        if slug and slug not in seen:
+            seen.add(slug)
+            pages.append({'slug': slug, 'title': str(page.get('title') or slug.title())[:40],
+                          'brief': str(page.get('brief') or slug)[:300]})
+    if 'index' not in seen:
+        pages.insert(0, dict(DEFAULT_PAGES[0]))
+    else:
+        pages.sort(key=lambda page: page['slug'] != 'index')
+    pages = pages[:settings.MULTIPAGE_MAX_PAGES]
+    if len(pages) < 2:
+        raise ValueError("fewer than two pages")
+    return {'title': str(data.get('title') or default_title(prompt))[:100],
+            'tokens': parse_design_tokens(data.get('tokens')), 'pages': pages}
+
+
+def _stylesheet_messages(prompt: str, site_map: dict, parts: int) -> list:
+    return [
+        {"role": "system", "content": "You are an expert web developer writing the shared stylesheet of a website.\n"
+                                      "Reply with CSS only, no <style> tags and no code fences."},
+        {"role": "user", "content": f"""Write the shared stylesheet of a multi-page website for: {prompt}
+This is part 1 of {parts} of the site; the pages ({', '.join(page['slug'] for page in site_map['pages'])}) are written separately and bring their own styles.
+
+The site already defines these CSS custom properties on :root: {describe_tokens(site_map)}
+The header (.site-header, .site-logo, .site-nav, .nav-toggle) and footer (.site-footer) already have basic styles; refine them to match the design.
+Write a reset, base typography, links, a .container class, button styles (.btn, .btn-primary), section spacing and responsive breakpoints, all using var(--...) for the design tokens."""},
+    ]
+
+
+def _page_messages(prompt: str, site_map: dict, index: int, parts: int) -> list:
+    page = site_map['pages'][index]
+    others = ', '.join(f"{other['slug']}.html ({other['title']})" for other in site_map['pages'] if other is not page)
+    return [
+        {"role": "system", "content": PAGE_SYSTEM_PROMPT},
+        {"role": "user", "content": f"""Build one page of a multi-page website for: {prompt}
+Site name: {site_map['title']}
+This is part {index + 2} of {parts} of the site.
+
+Write the main content of the "{page['title']}" page ({page['slug']}.html): {page['brief']}
+- The shared header with navigation and the footer are added around your content; do not write them
+- Design tokens on :root: {describe_tokens(site_map)}
+- Shared classes available: .container, .btn, .btn-primary
+- Prefix your own class names with "{page['slug']}-" so they do not clash with other pages
+- Link to the other pages by their file names: {others}"""},
+    ]
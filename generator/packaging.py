@@ -0,0 +1,92 @@
+"""
+Site packaging off the request thread.
+
+Minifying, precompressing and zipping a site is pure CPU work, so it runs in
+a pool of PACKAGING_WORKERS processes: concurrent generations package on
+separate cores instead of queueing behind the GIL. `build_archive` only
+touches its arguments, so workers never need Django set up; it returns the
+archive with its SHA-256, which the storage layer verifies after writing.
+The same files always give byte-identical archives, which is what lets
+archives.py store each distinct one only once.
+"""
+
+import hashlib
+import io
+import multiprocessing
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from .minify import optimize_package
+
+# Timestamp of every ZIP entry (the earliest the format allows), for reproducible archives
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def build_archive(files: dict, readme: str, minify: bool, keep_sources: bool, compress: bool) -> dict:
+    """
+    Build the ZIP for {name: text} site files. Returns the archive bytes, its
+    sha256, the minified size of the served files and the minify/packaging
+    stage durations.
+    """
+    started = time.perf_counter()
+    package = optimize_package(files, minify=minify, keep_sources=keep_sources, compress=compress)
+    minified = time.perf_counter()
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for name, data in [*package.items(), ("README.md", readme.encode('utf-8'))]:
+            # Fixed timestamps and modes: the same files always produce the same archive
+            info = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+            info.external_attr = 0o644 << 16
+            # Precompressed siblings would not shrink any further
+            info.compress_type = zipfile.ZIP_STORED if name.endswith(('.gz', '.br')) else zipfile.ZIP_DEFLATED
+            zipf.writestr(info, data)
+    archive = buffer.getvalue()
+
+    return {
+        'archive': archive,
+        'sha256': hashlib.sha256(archive).hexdigest(),
+        'served_size': sum(len(data) for name, data in package.items() if name in files),
+        'stages': {'minify': minified - started, 'packaging': time.perf_counter() - minified},
+    }
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver children start clean instead of forking a threaded server
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pool = ProcessPoolExecutor(max_workers=settings.PACKAGING_WORKERS,
+                                        mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def package_site(files: dict, readme: str, minify: bool, keep_sources: bool, compress: bool) -> dict:
+    """build_archive() in the packaging pool, or inline when PACKAGING_WORKERS is 0"""
+    args = (files, readme, minify, keep_sources, compress)
+    if settings.PACKAGING_WORKERS <= 0:
+        return build_archive(*args)
+    try:
+        return _get_pool().submit(build_archive, *args).result(timeout=settings.PACKAGING_TIMEOUT)
+    except BrokenProcessPool:
+        # A worker died (OOM kill, segfault); start a fresh pool next time and finish this one here
+        print("⚠️ Packaging pool broke, packaging inline")
+        _reset_pool()
+        return build_archive(*args)
@@ -0,0 +1,181 @@
+"""
+Live previews served straight out of the stored site archives.
+
+Each archive is memory-mapped once (held in memory when it lives in object
+storage) and its central directory indexed; an LRU keeps the most recently
+previewed archives open. Stored entries (the precompressed .gz/.br siblings)
+are sliced straight out of the buffer, deflated entries are inflated in
+memory. Nothing is ever extracted to disk.
+
+Preview URLs carry the archive version and an HMAC of it, so responses can
+be cached for a year (a regenerated archive gets a new URL) and so the
+sandboxed page, which runs in an opaque origin without the session cookie,
+can still load its own styles.css and script.js.
+"""
+
+import io
+import mimetypes
+import mmap
+import struct
+import threading
+import zipfile
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import patch_vary_headers
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.views.decorators.clickjacking import xframe_options_sameorigin
+from django.views.decorators.http import require_GET
+
+from .models import GeneratedSite
+from .storage import archive_storage
+
+# Local file header: signature .. extra field length, see APPNOTE.TXT 4.3.7
+_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+# Preferred order when the browser accepts several encodings
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# Generated pages may run their own scripts, but in an opaque origin that cannot
+# read this site's cookies or call its endpoints as the user
+PREVIEW_CSP = "sandbox allow-scripts allow-forms allow-popups allow-modals"
+
+
+class ArchiveReader:
+    """Random access to the members of one ZIP held in a read-only memory map or bytes buffer"""
+
+    def __init__(self, buffer, entries, signature):
+        self._map = buffer
+        self.entries = entries
+        self.signature = signature
+
+    @classmethod
+    def open(cls, name, signature):
+        """Memory-map a local archive, or load a remote one into memory"""
+        try:
+            path = archive_storage.path(name)
+        except NotImplementedError:
+            with archive_storage.open(name, 'rb') as f:
+                data = f.read()
+            return cls(data, cls._index(io.BytesIO(data)), signature)
+        with open(path, 'rb') as f:
+            entries = cls._index(f)
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), entries, signature)
+
+    @staticmethod
+    def _index(f):
+        # zipfile only parses the central directory; member data is read from the buffer
+        with zipfile.ZipFile(f) as archive:
+            return {info.filename: info for info in archive.infolist() if not info.is_dir()}
+
+    def read(self, name):
+        """Member contents, sliced (stored) or inflated (deflated) straight from the map"""
+        info = self.entries[name]
+        header = _LOCAL_HEADER.unpack_from(self._map, info.header_offset)
+        start = info.header_offset + _LOCAL_HEADER.size + header[10] + header[11]
+        data = self._map[start:start + info.compress_size]
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -zlib.MAX_WBITS)
+        elif info.compress_type != zipfile.ZIP_STORED:
+            raise zipfile.BadZipFile(f"Unsupported compression for {name}")
+        return data
+
+
+class ArchiveCache:
+    """LRU of open ArchiveReaders, reopened when the stored archive changes"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._readers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name, signature):
+        with self._lock:
+            reader = self._readers.get(name)
+            if reader and reader.signature == signature:
+                self._readers.move_to_end(name)
+                return reader
+        reader = ArchiveReader.open(name, signature)
+        with self._lock:
+            self._readers[name] = reader
+            self._readers.move_to_end(name)
+            while len(self._readers) > self.capacity:
+                # Evicted maps close once in-flight responses drop their reference
+                self._readers.popitem(last=False)
+        return reader
+
+    def clear(self):
+        with self._lock:
+            self._readers.clear()
+
+
+archives = ArchiveCache(settings.PREVIEW_ARCHIVE_CACHE_SIZE)
+
+
+def preview_version(site):
+    """Identifies the current archive of a site"""
+    return archive_storage.signature(site.generated_file.name)
+
+
+def _sign(site_id, version):
+    return salted_hmac('generator.preview', f"{site_id}:{version}").hexdigest()[:32]
+
+
+def preview_token(site):
+    """Versioned capability for the preview URLs of a site; only hand it to users allowed to see the site"""
+    version = preview_version(site)
+    return f"{version}-{_sign(site.id, version)}"
+
+
+def _negotiate(reader, path, accept_encoding):
+    """Pick the precompressed sibling the client accepts, if the archive has one"""
+    accepted = {token.split(';')[0].strip() for token in accept_encoding.split(',')}
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and path + suffix in reader.entries:
+            return path + suffix, encoding
+    return path, None
+
+
+@require_GET
+@xframe_options_sameorigin
+def preview_site(request, site_id, token, path=''):
+    """Serve one file of a generated site from its ZIP"""
+    version, _, signature = token.partition('-')
+    if not constant_time_compare(signature, _sign(site_id, version)):
+        raise Http404("Site not found")
+    site = get_object_or_404(GeneratedSite.objects.only('id', 'generated_file'), id=site_id)
+    if not site.generated_file:
+        raise Http404("File not found")
+
+    try:
+        current = preview_version(site)
+        reader = archives.get(site.generated_file.name, current)
+    except (OSError, zipfile.BadZipFile):
+        raise Http404("File not found")
+    if version != current:
+        # Stale link to a regenerated site
+        return redirect('generator:preview_site_file', site_id=site.id, token=preview_token(site), path=path or 'index.html')
+
+    path = path or 'index.html'
+    if path not in reader.entries or path.endswith(('.gz', '.br')):
+        raise Http404("File not found")
+    member, encoding = _negotiate(reader, path, request.headers.get('Accept-Encoding', ''))
+    info = reader.entries[member]
+    etag = f'"{current}-{info.CRC:08x}{"-" + encoding if encoding else ""}"'
+
+    if etag in (tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')):
+        response = HttpResponseNotModified()
+    else:
+        content_type, _ = mimetypes.guess_type(path)
+        if content_type and (content_type.startswith('text/') or content_type == 'application/javascript'):
+            content_type += '; charset=utf-8'
+        response = HttpResponse(reader.read(member), content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Cache-Control'] = f'private, max-age={settings.PREVIEW_CACHE_SECONDS}, immutable'
+    response['Content-Security-Policy'] = PREVIEW_CSP
+    response['X-Content-Type-Options'] = 'nosniff'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -0,0 +1,151 @@
+"""
+Retries and a circuit breaker around the upstream LLM.
+
+Every completion goes through call_upstream():
+
+- transient failures (connection errors, timeouts, 429 and 5xx responses)
+  are retried UPSTREAM_RETRIES times with full-jitter exponential backoff,
+  honouring Retry-After;
+- each attempt feeds a circuit breaker whose state lives in the Django
+  cache, so all workers share it (Redis via REDIS_URL; the default local
+  memory cache is per process). Once CIRCUIT_FAILURE_RATE of the calls in
+  the last CIRCUIT_WINDOW_SECONDS failed (and there were at least
+  CIRCUIT_MIN_CALLS), the circuit opens and calls fail fast with
+  CircuitOpenError for CIRCUIT_OPEN_SECONDS. Then one probe call across all
+  workers is let through (half-open): success closes the circuit, failure
+  opens it again.
+
+generate_website_code() serves the template fallback when the circuit is
+open or the retries run out, so an upstream outage degrades generations
+instead of failing each one after a full client timeout.
+"""
+
+import random
+import time
+
+import openai
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import registry, upstream_calls_total, upstream_circuit_state
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Errors worth retrying; anything else (bad request, auth) is returned to the caller at once
+TRANSIENT_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+# The failure-rate window is kept as this many cache counters per outcome
+WINDOW_BUCKETS = 6
+
+
+class CircuitOpenError(Exception):
+    """The upstream circuit is open; the call was not attempted"""
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker with its state in the shared cache"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.prefix = f"generator:circuit:{name}"
+
+    def state(self) -> str:
+        open_until = cache.get(self.prefix + ':open_until')
+        if open_until is None:
+            return CLOSED
+        return OPEN if time.time() < open_until else HALF_OPEN
+
+    def allow(self):
+        """'call' or 'probe' when a call may go ahead, None to fail fast"""
+        state = self.state()
+        if state == CLOSED:
+            return 'call'
+        # Half-open: exactly one worker wins the probe; it expires in case that worker dies mid-call
+        if state == HALF_OPEN and cache.add(self.prefix + ':probe', 1, timeout=settings.UPSTREAM_TIMEOUT + 10):
+            return 'probe'
+        return None
+
+    def record_success(self, permit: str):
+        self._count('calls')
+        if permit == 'probe':
+            cache.delete_many([self.prefix + ':open_until', self.prefix + ':probe'] + self._window_keys())
+            print(f"✅ Upstream circuit '{self.name}' closed")
+
+    def record_failure(self, permit: str):
+        if permit == 'probe':
+            self._open("probe failed")
+            return
+        self._count('calls')
+        self._count('failures')
+        counts = cache.get_many(self._window_keys())
+        calls = sum(value for key, value in counts.items() if ':calls:' in key)
+        failures = sum(value for key, value in counts.items() if ':failures:' in key)
+        if calls >= settings.CIRCUIT_MIN_CALLS and failures / calls >= settings.CIRCUIT_FAILURE_RATE \
+                and self.state() == CLOSED:
+            self._open(f"{failures}/{calls} calls failed")
+
+    def _open(self, reason: str):
+        cache.set(self.prefix + ':open_until', time.time() + settings.CIRCUIT_OPEN_SECONDS, timeout=None)
+        cache.delete(self.prefix + ':probe')
+        print(f"⚠️  Upstream circuit '{self.name}' opened for {settings.CIRCUIT_OPEN_SECONDS}s: {reason}")
+
+    def _bucket_seconds(self) -> int:
+        return max(1, settings.CIRCUIT_WINDOW_SECONDS // WINDOW_BUCKETS)
+
+    def _window_keys(self) -> list:
+        current = int(time.time() // self._bucket_seconds())
+        return [f"{self.prefix}:{kind}:{bucket}"
+                for kind in ('calls', 'failures') for bucket in range(current - WINDOW_BUCKETS + 1, current + 1)]
+
+    def _count(self, kind: str):
+        key = f"{self.prefix}:{kind}:{int(time.time() // self._bucket_seconds())}"
+        cache.add(key, 0, timeout=settings.CIRCUIT_WINDOW_SECONDS + self._bucket_seconds())
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=settings.CIRCUIT_WINDOW_SECONDS + self._bucket_seconds())  # Expired in between
+
+
+upstream_breaker = CircuitBreaker('openai')
+registry.add_collector(lambda: upstream_circuit_state.set(STATE_VALUES[upstream_breaker.state()],
+                                                          upstream=upstream_breaker.name))
+
+
+def backoff_delay(attempt: int, error: Exception = None) -> float:
+    """Retry-After when the upstream sent one, else full jitter over an exponential ceiling"""
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), settings.UPSTREAM_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(settings.UPSTREAM_BACKOFF_MAX, settings.UPSTREAM_BACKOFF_BASE * 2 ** attempt))
+
+
+def call_upstream(func, *args, **kwargs):
+    """func(*args, **kwargs) behind the upstream circuit breaker, retrying transient errors"""
+    for attempt in range(settings.UPSTREAM_RETRIES + 1):
+        permit = upstream_breaker.allow()
+        if permit is None:
+            upstream_calls_total.inc(outcome='rejected')
+            raise CircuitOpenError(f"Upstream circuit '{upstream_breaker.name}' is open")
+        try:
+            result = func(*args, **kwargs)
+        except TRANSIENT_ERRORS as e:
+            upstream_breaker.record_failure(permit)
+            if attempt == settings.UPSTREAM_RETRIES:
+                upstream_calls_total.inc(outcome='failure')
+                raise
+            upstream_calls_total.inc(outcome='retry')
+            time.sleep(backoff_delay(attempt, e))
+        except Exception:
+            # Not the upstream's fault; hand the probe to the next caller
+            if permit == 'probe':
+                cache.delete(upstream_breaker.prefix + ':probe')
+            raise
+        else:
+            upstream_breaker.record_success(permit)
+            upstream_calls_total.inc(outcome='success')
+            return result
@@ -0,0 +1,390 @@
+"""
+Retention and garbage collection for generated sites.
+
+`sweep()` runs these passes in order, each in batches of SWEEP_BATCH_SIZE:
+
+- expired: completed sites older than their owner's plan allows
+  (SITE_RETENTION_DAYS); the row goes, and its archive once no other site
+  shares it
+- failed / stuck: failed rows, and pending rows nobody will ever finish
+  that have no code to show
+- stale drafts: progressive drafts whose final generation never came back
+  are completed with the draft their owner already saw, like
+  ai_service.keep_draft() (kept, not counted as removed)
+- temp_dirs: temp_<id> work dirs leaked by older versions of packaging
+- missing_file: rows whose archive is gone get their generated_file cleared
+- orphaned: stored archives no row points at, including the temp files of
+  atomic writes that never reached their rename
+- unreferenced: shared blobs whose reference count drifted; counts are
+  repaired and blobs no site uses are deleted (see archives.recount_blobs)
+- corrupt (only with verify=True): archives that no longer match their
+  recorded SHA-256 are deleted and their references cleared
+- quota: oldest anonymous/free archives, while storage is over
+  ARCHIVE_DISK_QUOTA_MB (the rows, and their generated_code, are kept)
+- sessions: expired rows of django_session (what `clearsessions` does, in
+  batches), including rows left behind after a switch to cache or cookie
+  sessions
+
+Run it from cron with `python manage.py sweep_sites`, or let each web process
+start the in-process scheduler (SWEEP_INTERVAL_SECONDS); a lock file keeps it
+to one sweeper per host.
+"""
+
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Collate
+from django.utils import timezone
+
+from .metrics import sweep_deleted_total, sweep_reclaimed_bytes_total
+from .archives import recount_blobs, release_archives
+from .models import ArchiveBlob, GeneratedSite
+from .storage import archive_storage, blob_name, verify_archive
+from .webhooks import enqueue_event
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, run a single sweeper
+    fcntl = None
+
+# Plans whose archives are evicted first when storage is over quota
+QUOTA_EVICTABLE_PLANS = ('anonymous', 'free')
+
+# Byte-order collation per database, so rows sort like the storage listing;
+# elsewhere the merge still works, it only confirms more names with exists()
+_BINARY_COLLATIONS = {'postgresql': 'C', 'sqlite': 'BINARY', 'mysql': 'utf8mb4_bin'}
+
+
+class SweepReport:
+    """Rows, files and bytes removed by one sweep, per reason"""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.reasons = {}
+        self.kept_drafts = 0
+
+    def record(self, reason, rows=0, files=0, size=0):
+        totals = self.reasons.setdefault(reason, {'rows': 0, 'files': 0, 'bytes': 0})
+        totals['rows'] += rows
+        totals['files'] += files
+        totals['bytes'] += size
+        if not self.dry_run:
+            if rows:
+                sweep_deleted_total.inc(rows, reason=reason, kind='row')
+            if files:
+                sweep_deleted_total.inc(files, reason=reason, kind='file')
+            if size:
+                sweep_reclaimed_bytes_total.inc(size, reason=reason)
+
+    @property
+    def reclaimed_bytes(self):
+        return sum(totals['bytes'] for totals in self.reasons.values())
+
+    def lines(self):
+        for reason, totals in self.reasons.items():
+            yield (f"{reason}: {totals['rows']} rows, {totals['files']} files, "
+                   f"{totals['bytes'] / (1024 * 1024):.1f} MB")
+        if self.kept_drafts:
+            yield f"stale drafts: {self.kept_drafts} sites completed with their draft"
+
+
+def _plan_filter(plan):
+    """Sites belonging to a plan; users without a profile count as free"""
+    if plan == 'anonymous':
+        return Q(user__isnull=True)
+    if plan == 'free':
+        return Q(user__isnull=False) & (
+            Q(user__userprofile__subscription_plan='free') | Q(user__userprofile__isnull=True))
+    return Q(user__userprofile__subscription_plan=plan)
+
+
+def _no_code():
+    return Q(generated_code__isnull=True) | Q(generated_code='')
+
+
+def _batches(queryset, batch_size):
+    """(id, generated_file, archive_sha256) batches in id order; the id cursor survives rows being deleted underneath it"""
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).order_by('id')
+                     .values_list('id', 'generated_file', 'archive_sha256')[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1][0]
+
+
+def delete_sites(queryset, reason, report, batch_size):
+    """Delete matching sites, releasing archives first so a failure leaves a row the reconciler can fix"""
+    for batch in _batches(queryset, batch_size):
+        deleted = release_archives([(name, sha256) for _, name, sha256 in batch], dry_run=report.dry_run)
+        if not report.dry_run:
+            GeneratedSite.objects.filter(id__in=[site_id for site_id, _, _ in batch]).delete()
+        report.record(reason, rows=len(batch), files=len(deleted), size=sum(deleted.values()))
+
+
+def keep_stale_drafts(report, batch_size, cutoff):
+    """Complete drafts left behind by a lost final generation with the draft page, marked finish_reason 'fallback'"""
+    stale = GeneratedSite.objects.filter(status='draft', created_at__lt=cutoff).exclude(_no_code())
+    for batch in _batches(stale, batch_size):
+        ids = [site_id for site_id, _, _ in batch]
+        if not report.dry_run:
+            with transaction.atomic():
+                sites = list(GeneratedSite.objects.select_for_update().filter(id__in=ids, status='draft')
+                             .defer('generated_code', 'pages', 'stage_timings'))
+                GeneratedSite.objects.filter(id__in=[site.id for site in sites]).update(
+                    status='completed', finish_reason='fallback')
+                for site in sites:
+                    site.status, site.finish_reason = 'completed', 'fallback'
+                    enqueue_event(site)
+        report.kept_drafts += len(ids)
+
+
+def expire_sites(report, batch_size, now):
+    for plan, days in settings.SITE_RETENTION_DAYS.items():
+        if days <= 0:
+            continue
+        expired = GeneratedSite.objects.filter(_plan_filter(plan), status='completed',
+                                               created_at__lt=now - timedelta(days=days))
+        delete_sites(expired, 'expired', report, batch_size)
+
+
+def remove_temp_dirs(report, now):
+    """Remove temp_<id> work dirs a crashed save_website_as_zip never cleaned up"""
+    site_dir = Path(settings.MEDIA_ROOT) / 'sites'
+    if not site_dir.is_dir():
+        return
+    cutoff = (now - timedelta(hours=settings.ORPHAN_GRACE_HOURS)).timestamp()
+    for path in site_dir.glob('temp_*'):
+        if not path.is_dir() or path.stat().st_mtime > cutoff:
+            continue
+        size = sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+        if not report.dry_run:
+            shutil.rmtree(path, ignore_errors=True)
+        report.record('temp_dirs', files=1, size=size)
+
+
+def _rows_by_name(queryset, batch_size):
+    """(generated_file, id) of the rows in the byte order of generated_file, fetched in keyset batches"""
+    collation = _BINARY_COLLATIONS.get(connections[queryset.db].vendor)
+    rows = queryset.alias(name_key=Collate('generated_file', collation) if collation else F('generated_file'))
+    rows = rows.order_by('name_key', 'id')
+    last = None
+    while True:
+        page = rows if last is None else rows.filter(Q(name_key__gt=last[0]) | Q(name_key=last[0], id__gt=last[1]))
+        batch = list(page.values_list('generated_file', 'id')[:batch_size])
+        if not batch:
+            return
+        yield from batch
+        last = batch[-1]
+
+
+def _clear_missing(report, missing):
+    """Clear the references of rows whose archive is gone; confirmed one by one, as missing files are rare"""
+    gone = {name for name in {name for name, _ in missing} if not archive_storage.exists(name)}
+    site_ids = [site_id for name, site_id in missing if name in gone]
+    if site_ids and not report.dry_run:
+        GeneratedSite.objects.filter(id__in=site_ids).update(generated_file='', archive_sha256='')
+    if site_ids:
+        report.record('missing_file', rows=len(site_ids))
+
+
+def reconcile(report, batch_size, now):
+    """
+    Match stored archives against rows in both directions, then repair blob
+    reference counts. Anything touched within ORPHAN_GRACE_HOURS is skipped:
+    its save may still be in flight. The storage listing is streamed in name
+    order, batch_size archives at a time, and merged with the rows sorted the
+    same way, so memory does not grow with the number of archives. Returns the
+    total size of the archives that remain.
+    """
+    cutoff = now - timedelta(hours=settings.ORPHAN_GRACE_HOURS)
+    with_file = GeneratedSite.objects.exclude(generated_file='').exclude(generated_file__isnull=True)
+    rows = _rows_by_name(with_file.filter(created_at__lt=cutoff), batch_size)
+    row = next(rows, None)
+    missing = []
+    total = 0
+
+    listing = archive_storage.iter_archives()
+    while True:
+        chunk = list(islice(listing, batch_size))
+        if not chunk:
+            break
+        names = {name for name, _, _ in chunk}
+
+        # Rows -> files: every row sorting up to this chunk's last name must point at one of its archives
+        while row is not None and row[0] <= chunk[-1][0]:
+            if row[0] not in names:
+                missing.append(row)
+            row = next(rows, None)
+        if len(missing) >= batch_size:
+            _clear_missing(report, missing)
+            missing = []
+
+        # Files -> rows: delete archives neither a site nor a blob row accounts for
+        referenced = set(GeneratedSite.objects.filter(generated_file__in=names).values_list('generated_file', flat=True))
+        digests = [name.rsplit('/', 1)[-1][:-len('.zip')] for name in names if name.startswith('sites/blobs/')]
+        referenced.update(blob_name(sha256) for sha256 in
+                          ArchiveBlob.objects.filter(sha256__in=digests).values_list('sha256', flat=True))
+        for name, size, modified in chunk:
+            if name in referenced or modified >= cutoff.timestamp():
+                total += size
+                continue
+            if not report.dry_run:
+                archive_storage.delete(name)
+            report.record('orphaned', files=1, size=size)
+
+    # Rows sorting after the last archive
+    while row is not None:
+        missing.append(row)
+        row = next(rows, None)
+        if len(missing) >= batch_size:
+            _clear_missing(report, missing)
+            missing = []
+    if missing:
+        _clear_missing(report, missing)
+
+    deleted = recount_blobs(batch_size, cutoff, dry_run=report.dry_run)
+    if deleted:
+        report.record('unreferenced', files=len(deleted), size=sum(deleted.values()))
+    return total - sum(deleted.values())
+
+
+def enforce_quota(report, batch_size, total):
+    """Evict the oldest anonymous/free archives until storage (`total` bytes) fits ARCHIVE_DISK_QUOTA_MB"""
+    quota = settings.ARCHIVE_DISK_QUOTA_MB * 1024 * 1024
+    if not quota or total <= quota:
+        return
+    evictable = Q()
+    for plan in QUOTA_EVICTABLE_PLANS:
+        evictable |= _plan_filter(plan)
+    candidates = GeneratedSite.objects.filter(evictable).exclude(generated_file='').exclude(generated_file__isnull=True)
+    for batch in _batches(candidates, batch_size):  # Ids grow with created_at, so oldest first
+        evicted = []
+        for site_id, name, sha256 in batch:
+            if total <= quota:
+                break
+            # A blob shared with other sites only loses this reference
+            deleted = release_archives([(name, sha256)], dry_run=report.dry_run)
+            total -= sum(deleted.values())
+            report.record('quota', files=len(deleted), size=sum(deleted.values()))
+            evicted.append(site_id)
+        if evicted and not report.dry_run:
+            GeneratedSite.objects.filter(id__in=evicted).update(generated_file='', archive_sha256='')
+        if total <= quota:
+            return
+    print(f"⚠️ Archive storage is {total / (1024 * 1024):.0f} MB, over the {settings.ARCHIVE_DISK_QUOTA_MB} MB quota "
+          f"with nothing left to evict from {', '.join(QUOTA_EVICTABLE_PLANS)} sites")
+
+
+def verify_checksums(report, batch_size) -> int:
+    """Drop archives whose contents no longer match the checksum recorded when they were written; returns the bytes dropped"""
+    with_checksum = GeneratedSite.objects.exclude(generated_file='').exclude(archive_sha256='')
+    reported = set()  # A shared blob is seen once per site until the dry run's rows are cleared
+    dropped = 0
+    for batch in _batches(with_checksum, batch_size):
+        corrupt = {(name, sha256) for _, name, sha256 in batch
+                   if name not in reported and archive_storage.exists(name) and not verify_archive(name, sha256)}
+        for name, sha256 in corrupt:
+            size = archive_storage.size(name)
+            if not report.dry_run:
+                archive_storage.delete(name)
+                # Every site sharing the blob loses it
+                GeneratedSite.objects.filter(generated_file=name).update(generated_file='', archive_sha256='')
+                ArchiveBlob.objects.filter(sha256=sha256).delete()
+            reported.add(name)
+            report.record('corrupt', files=1, size=size)
+            dropped += size
+    return dropped
+
+
+def purge_sessions(report, batch_size, now):
+    """Delete expired sessions in session_key order, batch by batch"""
+    last_key = ''
+    while True:
+        keys = list(Session.objects.filter(expire_date__lt=now, session_key__gt=last_key).order_by('session_key')
+                    .values_list('session_key', flat=True)[:batch_size])
+        if not keys:
+            return
+        if not report.dry_run:
+            Session.objects.filter(session_key__in=keys).delete()
+        report.record('sessions', rows=len(keys))
+        last_key = keys[-1]
+
+
+def sweep(dry_run=False, batch_size=None, verify=False):
+    """Run every retention pass once and return the SweepReport; verify also re-hashes every archive"""
+    batch_size = batch_size or settings.SWEEP_BATCH_SIZE
+    report = SweepReport(dry_run=dry_run)
+    now = timezone.now()
+
+    expire_sites(report, batch_size, now)
+    delete_sites(GeneratedSite.objects.filter(status='failed',
+                                              created_at__lt=now - timedelta(days=settings.FAILED_SITE_RETENTION_DAYS)),
+                 'failed', report, batch_size)
+    stuck_cutoff = now - timedelta(hours=settings.STUCK_PENDING_HOURS)
+    # A draft has already been shown and downloaded: keep it. Only rows with no code at all go
+    keep_stale_drafts(report, batch_size, stuck_cutoff)
+    delete_sites(GeneratedSite.objects.filter(_no_code(), status__in=('pending', 'draft'), created_at__lt=stuck_cutoff),
+                 'stuck', report, batch_size)
+    remove_temp_dirs(report, now)
+    total = reconcile(report, batch_size, now)
+    if verify:
+        total -= verify_checksums(report, batch_size)
+    enforce_quota(report, batch_size, total)
+    purge_sessions(report, batch_size, now)
+    return report
+
+
+@contextmanager
+def sweep_lock():
+    """Yields True if this process holds the sweeper lock, False if another sweeper is running"""
+    if fcntl is None:
+        yield True
+        return
+    with open(settings.SWEEP_LOCK_FILE, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _run_scheduler(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            with sweep_lock() as acquired:
+                if acquired:
+                    report = sweep()
+                    print(f"🧹 Sweep reclaimed {report.reclaimed_bytes / (1024 * 1024):.1f} MB")
+        except Exception as e:
+            print(f"⚠️ Sweep failed: {e}")
+        finally:
+            close_old_connections()
+
+
+_scheduler = None
+
+
+def start_scheduler():
+    """Start the background sweeper thread once per process, when SWEEP_INTERVAL_SECONDS is set"""
+    global _scheduler
+    interval = settings.SWEEP_INTERVAL_SECONDS
+    if interval <= 0 or _scheduler is not None:
+        return
+    _scheduler = threading.Thread(target=_run_scheduler, args=(interval,), name='site-sweeper', daemon=True)
+    _scheduler.start()
@@ -0,0 +1,126 @@
+"""
+Delta-compressed revision history of a site.
+
+Every version of a site's code is a SiteRevision. Most are stored as a
+zlib-compressed line delta against the previous revision, a JSON list of
+
+    [start, end]   copy lines start..end of the parent
+    "text"         insert this text
+
+so an edit costs storage in proportion to what it changed, not to the page.
+Revision 1, every REVISION_SNAPSHOT_INTERVAL-th revision and any revision
+whose delta would not be smaller than the page itself are stored as a full
+(compressed) snapshot instead. Rebuilding a revision reads the chain from
+the nearest snapshot in one query and applies at most
+REVISION_SNAPSHOT_INTERVAL - 1 deltas; each rebuilt revision is checked
+against its stored SHA-256.
+"""
+
+import difflib
+import hashlib
+import json
+import zlib
+
+from django.conf import settings
+from django.db.models import Max
+
+from .models import SiteRevision
+
+
+def _lines(code: str) -> list:
+    return code.splitlines(keepends=True)
+
+
+def encode_snapshot(code: str) -> bytes:
+    return zlib.compress(code.encode('utf-8'), 9)
+
+
+def encode_delta(parent: str, code: str) -> bytes:
+    """Line delta turning `parent` into `code`"""
+    old, new = _lines(parent), _lines(code)
+    ops = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:  # replace or insert; a delete is just not copying
+            ops.append(''.join(new[j1:j2]))
+    return zlib.compress(json.dumps(ops, separators=(',', ':')).encode('utf-8'), 9)
+
+
+def apply_delta(parent: str, data: bytes) -> str:
+    old = _lines(parent)
+    return ''.join(''.join(old[op[0]:op[1]]) if isinstance(op, list) else op
+                   for op in json.loads(zlib.decompress(data)))
+
+
+def create_revision(site, number: int, code: str, parent_code: str = None, instruction: str = '',
+                    usage: dict = None) -> SiteRevision:
+    """
+    Store `code` as revision `number` of `site`, as a delta against
+    `parent_code` (the code of revision number - 1) unless a snapshot is due.
+    Raises IntegrityError if that revision number exists already.
+    """
+    usage = usage or {}
+    snapshot = encode_snapshot(code)
+    data, is_snapshot = snapshot, True
+    interval = max(1, settings.REVISION_SNAPSHOT_INTERVAL)  # 1 or less: every revision is a snapshot
+    if parent_code is not None and (number - 1) % interval:
+        delta = encode_delta(parent_code, code)
+        if len(delta) < len(snapshot):
+            data, is_snapshot = delta, False
+    return SiteRevision.objects.create(
+        site=site,
+        number=number,
+        instruction=instruction,
+        is_snapshot=is_snapshot,
+        data=data,
+        code_size=len(code.encode('utf-8')),
+        code_sha256=hashlib.sha256(code.encode('utf-8')).hexdigest(),
+        prompt_tokens=usage.get('prompt_tokens'),
+        completion_tokens=usage.get('completion_tokens'),
+        total_tokens=usage.get('total_tokens'),
+    )
+
+
+def latest_revision_number(site) -> int:
+    """The original generation counts as revision 1 until the first edit stores it"""
+    return site.revisions.aggregate(number=Max('number'))['number'] or 1
+
+
+def revision_codes(site, numbers) -> dict:
+    """
+    {number: code} for the given revision numbers, rebuilt from the nearest
+    snapshot. Raises SiteRevision.DoesNotExist for an unknown number.
+    """
+    numbers = set(numbers)
+    start = (site.revisions.filter(is_snapshot=True, number__lte=min(numbers))
+             .aggregate(number=Max('number'))['number'])
+    if start is None:
+        if numbers == {1} and not site.revisions.exists():
+            return {1: site.generated_code}
+        raise SiteRevision.DoesNotExist(f"Site {site.id} has no revision {min(numbers)}")
+
+    codes = {}
+    code = None
+    chain = (site.revisions.filter(number__gte=start, number__lte=max(numbers)).order_by('number')
+             .only('number', 'is_snapshot', 'data', 'code_sha256'))
+    for revision in chain:
+        data = bytes(revision.data)
+        code = zlib.decompress(data).decode('utf-8') if revision.is_snapshot else apply_delta(code, data)
+        if revision.number in numbers:
+            if hashlib.sha256(code.encode('utf-8')).hexdigest() != revision.code_sha256:
+                raise ValueError(f"Revision {revision.number} of site {site.id} does not match its checksum")
+            codes[revision.number] = code
+    missing = numbers - set(codes)
+    if missing:
+        raise SiteRevision.DoesNotExist(f"Site {site.id} has no revision {min(missing)}")
+    return codes
+
+
+def diff_lines(old: str, new: str, context: int = 3) -> list:
+    """Unified diff as [(kind, line)] with kind 'hunk', 'add', 'del' or 'same', for the history page"""
+    lines = []
+    for line in list(difflib.unified_diff(_lines(old), _lines(new), n=context))[2:]:
+        kind = {'@': 'hunk', '+': 'add', '-': 'del'}.get(line[:1], 'same')
+        lines.append((kind, line.rstrip('\n')))
+    return lines
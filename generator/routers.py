@@ -0,0 +1,123 @@
+"""
+Read-replica routing.
+
+Reads go to the primary unless they run inside `read_from_replica()` (or a
+view wrapped with `replica_reads`), in which case they are spread across the
+aliases in settings.REPLICA_DATABASES. Writes always go to the primary.
+
+Read-your-writes: ReplicaPinMiddleware notices when a request wrote to the
+primary (a generation, a payment, a profile change) and sets a short-lived
+cookie; while it is present that browser's reads stay on the primary, so it
+never sees a replica that has not caught up with its own changes yet. Only SQL
+that actually writes counts: get_or_create() asks the router for the write
+database even when the row already exists.
+"""
+
+import contextvars
+import random
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+
+_read_from_replica = contextvars.ContextVar('read_from_replica', default=False)
+
+# Apps whose reads must always see the latest write (logins, CSRF-bound sessions)
+PRIMARY_ONLY_APPS = {'sessions', 'contenttypes'}
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+@contextmanager
+def read_from_replica():
+    """Route the reads issued inside this block to a replica"""
+    token = _read_from_replica.set(True)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+def is_pinned(request) -> bool:
+    """Whether this client wrote recently and must read from the primary"""
+    return settings.REPLICA_PIN_COOKIE in request.COOKIES
+
+
+def replica_reads(view_func):
+    """Serve safe requests of a read-only view from a replica, unless the client is pinned"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or is_pinned(request) or not settings.REPLICA_DATABASES:
+            return view_func(request, *args, **kwargs)
+        with read_from_replica():
+            return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaReadsAdminMixin:
+    """Serve ModelAdmin changelists from a replica"""
+
+    def changelist_view(self, request, extra_context=None):
+        return replica_reads(super().changelist_view)(request, extra_context)
+
+
+class ReplicaRouter:
+    """Sends flagged reads to a random replica and every write to the primary"""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY_APPS or not _read_from_replica.get():
+            return 'default'
+        replicas = settings.REPLICA_DATABASES
+        return random.choice(replicas) if replicas else 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        return db == 'default'
+
+
+@lru_cache(maxsize=None)
+def _primary_only_tables() -> tuple:
+    return tuple(model._meta.db_table for label in PRIMARY_ONLY_APPS if apps.is_installed(f'django.contrib.{label}')
+                 for model in apps.get_app_config(label).get_models())
+
+
+def is_write(sql: str) -> bool:
+    """Whether a statement changes rows that replicas must catch up with"""
+    words = sql.split(None, 1)
+    if not words or words[0].upper() not in WRITE_STATEMENTS:
+        return False
+    return not any(table in sql for table in _primary_only_tables())
+
+
+class ReplicaPinMiddleware:
+    """Pins a client to the primary for REPLICA_PIN_SECONDS after any request that wrote data"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        wrote = []
+
+        def track_writes(execute, sql, params, many, context):
+            if is_write(sql):
+                wrote.append(sql)
+            return execute(sql, params, many, context)
+
+        with connections['default'].execute_wrapper(track_writes):
+            response = self.get_response(request)
+        if wrote and settings.REPLICA_DATABASES:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
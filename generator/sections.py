@@ -0,0 +1,249 @@
+"""
+Section-parallel generation.
+
+A single completion streams at the upstream's per-stream token rate, so a
+long page takes as long as all of its tokens in a row. In the "sections"
+GENERATION_MODE a short planning call first returns an outline - the page
+title, shared design tokens (CSS custom properties) and the sections in
+page order - and then the shared stylesheet and every section are
+generated as separate completions, concurrently on SECTION_WORKERS threads.
+The fragments are stitched in outline order into one HTML document with
+inline <style> and <script> blocks, so extract_embedded_assets() and
+packaging handle it like a single-call page. Wall-clock time becomes the
+planning call plus the slowest section.
+"""
+
+import html
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .metrics import StageTimer
+
+MAX_SECTIONS = 8
+
+DEFAULT_TOKENS = {
+    '--color-primary': '#667eea',
+    '--color-accent': '#764ba2',
+    '--color-text': '#333333',
+    '--color-muted': '#666666',
+    '--color-background': '#ffffff',
+    '--color-surface': '#f8f9fa',
+    '--font-body': "'Segoe UI', Tahoma, Geneva, Verdana, sans-serif",
+    '--font-heading': "'Segoe UI', Tahoma, Geneva, Verdana, sans-serif",
+    '--radius': '12px',
+    '--space': '1rem',
+}
+
+DEFAULT_SECTIONS = [
+    {'id': 'header', 'brief': 'Sticky header with the business name and navigation links to the other sections'},
+    {'id': 'hero', 'brief': 'Hero with a headline, a short pitch and a call-to-action button'},
+    {'id': 'services', 'brief': 'The menu, products or services as a grid of cards with short descriptions'},
+    {'id': 'contact', 'brief': 'Contact details, opening hours and a simple contact form'},
+    {'id': 'footer', 'brief': 'Footer with copyright, secondary links and social icons'},
+]
+
+PLAN_SYSTEM_PROMPT = """You are a web designer planning a single-page website.
+Reply with JSON only, no explanations and no code fences."""
+
+SECTION_SYSTEM_PROMPT = """You are an expert web developer building one part of a larger single-page website.
+Reply with an HTML fragment only: no DOCTYPE, <html>, <head> or <body> tags, no code fences.
+Put the styles of this part in one <style> block and any JavaScript in one <script> block.
+Use the page's CSS custom properties for colours, fonts, radii and spacing instead of hard-coded values.
+Make it mobile responsive, professional and complete. Do not truncate the response."""
+
+STYLESHEET_SYSTEM_PROMPT = """You are an expert web developer writing the shared stylesheet of a website.
+Reply with CSS only, no <style> tags and no code fences."""
+
+_FENCE = re.compile(r'^\s*```[\w-]*\s*\n?|\n?\s*```\s*$')
+_BODY = re.compile(r'<body[^>]*>([\s\S]*?)(?:</body>|$)', re.IGNORECASE)
+_HEAD_STYLES = re.compile(r'<style[^>]*>[\s\S]*?</style>', re.IGNORECASE)
+_DOCUMENT_TAGS = re.compile(r'<!DOCTYPE[^>]*>|</?html[^>]*>|</?body[^>]*>', re.IGNORECASE)
+_STYLE_BLOCK = re.compile(r'<style[^>]*>([\s\S]*?)(?:</style>|$)', re.IGNORECASE)
+
+
+def generate_in_sections(prompt: str, complete, max_tokens: int, usage: dict, timings: StageTimer) -> str:
+    """
+    Plan, then generate the stylesheet and sections concurrently and stitch
+    them into one page. `complete(messages, max_tokens, usage, timings)`
+    runs one completion and returns (content, finish_reason), like
+    ai_service._create_completion. Token usage of every call is summed into
+    `usage`; `timings` gets upstream_plan, and upstream_ttfb/upstream_total
+    for the whole fan-out.
+    """
+    started = time.perf_counter()
+    plan_usage, plan_timings = {}, StageTimer()
+    outline = plan_sections(prompt, complete, plan_usage, plan_timings)
+    timings.add('upstream_plan', plan_timings.stages.get('upstream_total', 0.0))
+    timings.add('upstream_ttfb', plan_timings.stages.get('upstream_ttfb', 0.0))
+
+    parts = len(outline['sections']) + 1
+    budget = min(settings.SECTION_MAX_TOKENS, max_tokens)
+    jobs = [_stylesheet_messages(prompt, outline, parts)]
+    jobs += [_section_messages(prompt, outline, index, parts) for index in range(len(outline['sections']))]
+    workers = max(1, min(settings.SECTION_WORKERS, len(jobs)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='section') as pool:
+        results = list(pool.map(lambda messages: complete_part(complete, messages, budget), jobs))
+    timings.add('upstream_total', time.perf_counter() - started)
+
+    call_usages = [plan_usage] + [part_usage for _, _, part_usage in results]
+    for key in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+        usage[key] = usage.get(key, 0) + sum(call_usage.get(key, 0) for call_usage in call_usages)
+    usage['max_tokens'] = sum(call_usage.get('max_tokens', 0) for call_usage in call_usages)
+    truncated = [outline['sections'][index - 1]['id'] if index else 'stylesheet'
+                 for index, (_, finish_reason, _) in enumerate(results) if finish_reason == 'length']
+    usage['finish_reason'] = 'length' if truncated else 'stop'
+    if truncated:
+        print(f"Warning: Sections truncated due to token limit: {', '.join(truncated)}")
+
+    stylesheet = clean_css(results[0][0])
+    fragments = [clean_fragment(content) for content, _, _ in results[1:]]
+    return stitch_page(outline['title'], outline['tokens'], stylesheet, fragments)
+
+
+def plan_sections(prompt: str, complete, usage: dict, timings: StageTimer) -> dict:
+    """
+    Ask for the page outline: {"title", "tokens": {--name: value}, "sections": [{"id", "brief"}]}.
+    A reply that cannot be parsed falls back to the default outline.
+    """
+    default_ids = ', '.join(section['id'] for section in DEFAULT_SECTIONS)
+    messages = [
+        {"role": "system", "content": PLAN_SYSTEM_PROMPT},
+        {"role": "user", "content": f"""Plan a website for: {prompt}
+
+Return a JSON outline of this shape:
+{{"title": "Page title", "tokens": {{"--color-primary": "#hex", "--font-body": "font stack", ...}}, "sections": [{{"id": "header", "brief": "what this section contains"}}, ...]}}
+
+- tokens: the shared design tokens as CSS custom properties (colours, fonts, radius, spacing), at least {', '.join(list(DEFAULT_TOKENS)[:4])}
+- sections: 4 to {MAX_SECTIONS} sections in page order with lowercase-hyphenated ids, typically {default_ids}
+- brief: one sentence with the concrete content of the section for this business"""},
+    ]
+    content, _ = complete(messages, settings.PLAN_MAX_TOKENS, usage, timings)
+    try:
+        return _parse_outline(content, prompt)
+    except (ValueError, TypeError, AttributeError, KeyError) as e:
+        print(f"Warning: Unusable section outline ({e}), using the default sections")
+        return {'title': default_title(prompt), 'tokens': dict(DEFAULT_TOKENS),
+                'sections': [dict(section) for section in DEFAULT_SECTIONS]}
+
+
+def stitch_page(title: str, tokens: dict, stylesheet: str, fragments: list) -> str:
+    """One HTML document from the design tokens, shared stylesheet and section fragments"""
+    root = ''.join(f"    {name}: {value};\n" for name, value in tokens.items())
+    body = '\n'.join(fragment for fragment in fragments if fragment)
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>{html.escape(title)}</title>
+<style>
+:root {{
+{root}}}
+{stylesheet}
+</style>
+</head>
+<body>
+{body}
+</body>
+</html>"""
+
+
+def parse_json_reply(content: str) -> dict:
+    """The JSON object in a planner reply, ignoring code fences and chatter around it"""
+    text = _FENCE.sub('', content.strip())
+    return json.loads(text[text.index('{'):text.rindex('}') + 1])
+
+
+def _parse_outline(content: str, prompt: str) -> dict:
+    data = parse_json_reply(content)
+
+    sections, seen = [], set()
+    for section in data['sections'][:MAX_SECTIONS]:
+        section_id = re.sub(r'[^a-z0-9]+', '-', str(section['id']).lower()).strip('-')
+        if section_id and section_id not in seen:
+            seen.add(section_id)
+            sections.append({'id': section_id, 'brief': str(section.get('brief') or section_id)[:300]})
+    if not sections:
+        raise ValueError("no sections")
+
+    return {'title': str(data.get('title') or default_title(prompt))[:100],
+            'tokens': parse_design_tokens(data.get('tokens')), 'sections': sections}
+
+
+def parse_design_tokens(raw) -> dict:
+    """The defaults overridden by the usable CSS custom properties of a planner reply"""
+    tokens = dict(DEFAULT_TOKENS)
+    for name, value in (raw or {}).items():
+        name = '--' + re.sub(r'[^a-z0-9-]+', '-', str(name).lower()).lstrip('-')
+        value = str(value)
+        # Values land inside the stylesheet; anything that could close the rule or the block is dropped
+        if len(name) > 2 and value and not re.search(r'[;{}<>]', value):
+            tokens[name] = value[:100]
+    return tokens
+
+
+def default_title(prompt: str) -> str:
+    from .ai_service import extract_business_name
+    return extract_business_name(prompt)
+
+
+def describe_tokens(outline: dict) -> str:
+    return '; '.join(f"{name}: {value}" for name, value in outline['tokens'].items())
+
+
+def _stylesheet_messages(prompt: str, outline: dict, parts: int) -> list:
+    return [
+        {"role": "system", "content": STYLESHEET_SYSTEM_PROMPT},
+        {"role": "user", "content": f"""Write the shared stylesheet of a website for: {prompt}
+This is part 1 of {parts} of the page; the sections ({', '.join(s['id'] for s in outline['sections'])}) are written separately and bring their own styles.
+
+The page already defines these CSS custom properties on :root: {describe_tokens(outline)}
+Write a reset, base typography, links, a .container class, button styles (.btn, .btn-primary), section spacing and responsive breakpoints, all using var(--...) for the design tokens."""},
+    ]
+
+
+def _section_messages(prompt: str, outline: dict, index: int, parts: int) -> list:
+    section = outline['sections'][index]
+    tag = section['id'] if section['id'] in ('header', 'footer') else 'section'
+    others = ', '.join(f"#{s['id']}" for s in outline['sections'] if s['id'] != section['id'])
+    return [
+        {"role": "system", "content": SECTION_SYSTEM_PROMPT},
+        {"role": "user", "content": f"""Build one section of a website for: {prompt}
+Page title: {outline['title']}
+This is part {index + 2} of {parts} of the page. Sections in page order: {', '.join(s['id'] for s in outline['sections'])}
+
+Write the "{section['id']}" section: {section['brief']}
+- Wrap it in <{tag} id="{section['id']}">...</{tag}>
+- Design tokens on :root: {describe_tokens(outline)}
+- Shared classes available: .container, .btn, .btn-primary
+- Prefix your own class names with "{section['id']}-" so they do not clash with other sections
+- Link navigation to the other sections' anchors: {others}"""},
+    ]
+
+
+def complete_part(complete, messages: list, budget: int):
+    """One stylesheet or section completion, retried once with the full section budget if truncated"""
+    part_usage = {}
+    content, finish_reason = complete(messages, budget, part_usage, StageTimer())
+    if finish_reason == 'length' and budget < settings.SECTION_MAX_TOKENS:
+        content, finish_reason = complete(messages, settings.SECTION_MAX_TOKENS, part_usage, StageTimer())
+    return content, finish_reason, part_usage
+
+
+def clean_fragment(content: str) -> str:
+    """Strip code fences and, when a whole document came back, keep its head styles and body"""
+    text = _FENCE.sub('', content.strip())
+    body = _BODY.search(text)
+    if body:
+        text = ''.join(_HEAD_STYLES.findall(text[:body.start()])) + body.group(1)
+    return _DOCUMENT_TAGS.sub('', text).strip()
+
+
+def clean_css(content: str) -> str:
+    text = _FENCE.sub('', content.strip())
+    styles = _STYLE_BLOCK.findall(text)
+    return '\n'.join(styles).strip() if styles else text
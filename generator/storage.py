@@ -0,0 +1,295 @@
+"""
+Storage backends for generated site archives.
+
+Archives are content-addressed: sites/blobs/<aa>/<bb>/<sha256>.zip, stored
+once however many sites produced the same package (see archives.py). Sites
+from before that use sites/<aa>/<bb>/site_<id>.zip. Either way aa/bb come from
+a hash, so no directory (or S3 key prefix) grows past a few thousand
+entries. ARCHIVE_STORAGE selects the backend:
+
+- "local": ShardedFileSystemStorage under MEDIA_ROOT. Downloads are streamed
+  by Django, or handed to the web server when ARCHIVE_ACCEL_REDIRECT_PREFIX
+  names an nginx internal location (X-Accel-Redirect).
+- "s3": S3ArchiveStorage on any S3-compatible service (AWS, MinIO, or
+  `python -m benchmarks.stub_s3` locally). Downloads redirect to a presigned
+  URL, or to ARCHIVE_S3_PUBLIC_URL when the bucket sits behind a CDN.
+
+Both backends overwrite on save, so regenerating a site replaces its archive.
+Saves are atomic: local archives are written to a temp file in the same
+directory, checked against their SHA-256 and renamed over the old one, and
+S3 PUTs only become visible once complete. Readers see the old archive or the
+new one, never half of one.
+"""
+
+import base64
+import hashlib
+import os
+import re
+import tempfile
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, Storage
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import LazyObject
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # Only needed for ARCHIVE_STORAGE=s3
+    boto3 = None
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def archive_name(site_id) -> str:
+    """Per-site storage name used before archives were content-addressed"""
+    digest = hashlib.md5(str(site_id).encode()).hexdigest()
+    return f"sites/{digest[:2]}/{digest[2:4]}/site_{site_id}.zip"
+
+
+def blob_name(sha256) -> str:
+    """Content-addressed storage name of an archive"""
+    return f"sites/blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}.zip"
+
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_range(header, length):
+    """(start, end) of a single satisfiable `bytes=` range, or None to send everything"""
+    match = _RANGE.match(header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = min(int(match.group(2)), length - 1) if match.group(2) else length - 1
+    else:
+        start, end = max(length - int(match.group(2)), 0), length - 1
+    return (start, end) if start <= end else None
+
+
+def read_range(storage, name, first, stop, chunk_size=64 * 1024):
+    """Chunks of a stored file from byte `first` up to `stop`"""
+    with storage.open(name, 'rb') as f:
+        f.seek(first)
+        remaining = stop - first
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                raise OSError(f"{name} is shorter than expected")
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _attachment(filename: str) -> str:
+    return f"attachment; filename=\"{filename}\"; filename*=UTF-8''{quote(filename)}"
+
+
+@deconstructible
+class ShardedFileSystemStorage(FileSystemStorage):
+    """Local archive storage; atomically replaces on save"""
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        expected = getattr(content, 'sha256', None)
+        # Same directory as the target so os.replace() stays a rename; leftovers are
+        # swept as orphans (see retention.reconcile)
+        fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            if expected and file_sha256(temp_path) != expected:
+                raise OSError(f"Checksum mismatch writing {name}")
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return name
+
+    def signature(self, name) -> str:
+        """Changes whenever the stored archive changes"""
+        stat = os.stat(self.path(name))
+        return f"{stat.st_mtime_ns:x}{stat.st_size:x}"
+
+    def iter_archives(self, prefix='sites/'):
+        """(name, size, modified timestamp) of every stored archive, in name order; temp_<id> work dirs are skipped"""
+        yield from self._iter_sorted(self.path(prefix))
+
+    def _iter_sorted(self, directory):
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return
+        # A directory sorts as "name/", so names come out in the byte order of the full path, like an S3 listing
+        entries.sort(key=lambda entry: entry.name + '/' if entry.is_dir(follow_symlinks=False) else entry.name)
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not entry.name.startswith('temp_'):
+                    yield from self._iter_sorted(entry.path)
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            name = os.path.relpath(entry.path, self.location).replace(os.sep, '/')
+            yield name, stat.st_size, stat.st_mtime
+
+    def download_response(self, name, filename, range_header=None, if_range=None):
+        prefix = settings.ARCHIVE_ACCEL_REDIRECT_PREFIX
+        if prefix:
+            # nginx serves the file (and any Range) from an internal location; Django only authorizes
+            response = HttpResponse(content_type='application/zip')
+            response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(name)
+            response['Content-Disposition'] = _attachment(filename)
+            return response
+        etag = f'"{self.signature(name)}"'
+        length = self.size(name)
+        byte_range = parse_range(range_header, length) if range_header and if_range in (None, etag) else None
+        if byte_range:
+            # Resumed download
+            start, end = byte_range
+            response = StreamingHttpResponse(read_range(self, name, start, end + 1), status=206,
+                                             content_type='application/zip')
+            response['Content-Range'] = f'bytes {start}-{end}/{length}'
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Disposition'] = _attachment(filename)
+        else:
+            response = FileResponse(self.open(name, 'rb'), as_attachment=True, filename=filename,
+                                    content_type='application/zip')
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        return response
+
+
+@deconstructible
+class S3ArchiveStorage(Storage):
+    """Archives in an S3-compatible bucket, downloaded through presigned URLs"""
+
+    def __init__(self, bucket=None, endpoint_url=None, region=None, access_key=None, secret_key=None,
+                 url_expiry=None, public_url=None):
+        if boto3 is None:
+            raise ImportError("ARCHIVE_STORAGE=s3 requires boto3 (pip install boto3)")
+        self.bucket = bucket or settings.ARCHIVE_S3_BUCKET
+        self.url_expiry = url_expiry or settings.ARCHIVE_S3_URL_EXPIRY
+        self.public_url = public_url if public_url is not None else settings.ARCHIVE_S3_PUBLIC_URL
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url or settings.ARCHIVE_S3_ENDPOINT_URL,
+            region_name=region or settings.ARCHIVE_S3_REGION,
+            aws_access_key_id=access_key or settings.ARCHIVE_S3_ACCESS_KEY_ID,
+            aws_secret_access_key=secret_key or settings.ARCHIVE_S3_SECRET_ACCESS_KEY,
+            # Path-style addressing works with MinIO and other stand-ins
+            config=BotoConfig(signature_version='s3v4', s3={'addressing_style': 'path'}),
+        )
+
+    def _open(self, name, mode='rb'):
+        body = self.client.get_object(Bucket=self.bucket, Key=name)['Body'].read()
+        return ContentFile(body, name=name)
+
+    def _save(self, name, content):
+        content.seek(0)
+        extra = {}
+        expected = getattr(content, 'sha256', None)
+        if expected:
+            # The service rejects the PUT if the body does not hash to this
+            extra['ChecksumSHA256'] = base64.b64encode(bytes.fromhex(expected)).decode()
+        self.client.put_object(Bucket=self.bucket, Key=name, Body=content.read(), ContentType='application/zip', **extra)
+        return name
+
+    def _head(self, name):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=name)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def exists(self, name):
+        return self._head(name) is not None
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=name)
+
+    def size(self, name):
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head['ContentLength']
+
+    def signature(self, name) -> str:
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head['ETag'].strip('"')[:16] + f"{head['ContentLength']:x}"
+
+    def iter_archives(self, prefix='sites/'):
+        """(name, size, modified timestamp) of every stored archive, in name order (S3 lists keys in byte order)"""
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get('Contents', []):
+                yield item['Key'], item['Size'], item['LastModified'].timestamp()
+
+    def url(self, name, filename=None):
+        if self.public_url:
+            return f"{self.public_url.rstrip('/')}/{quote(name)}"
+        params = {'Bucket': self.bucket, 'Key': name}
+        if filename:
+            params['ResponseContentDisposition'] = _attachment(filename)
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.url_expiry)
+
+    def download_response(self, name, filename, range_header=None, if_range=None):
+        # The client fetches the bytes (and any Range) from the bucket; Django never touches them
+        return HttpResponseRedirect(self.url(name, filename=filename))
+
+
+class ArchiveStorage(LazyObject):
+    """The configured archive backend, built on first use"""
+
+    def _setup(self):
+        backend = settings.ARCHIVE_STORAGE
+        if backend == 's3':
+            self._wrapped = S3ArchiveStorage()
+        elif backend == 'local':
+            self._wrapped = ShardedFileSystemStorage()
+        else:
+            raise ValueError(f"Unknown ARCHIVE_STORAGE: {backend}")
+
+
+archive_storage = ArchiveStorage()
+
+
+def get_archive_storage():
+    """FileField storage callable, so migrations do not depend on the configured backend"""
+    return archive_storage
+
+
+def verify_archive(name, sha256) -> bool:
+    """Whether the stored archive still hashes to its recorded checksum"""
+    digest = hashlib.sha256()
+    with archive_storage.open(name, 'rb') as f:
+        for chunk in f.chunks():
+            digest.update(chunk)
+    return digest.hexdigest() == sha256
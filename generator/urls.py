@@ -1,5 +1,8 @@
-from django.urls import path
-from . import views
+from django.urls import include, path
+from . import api, views
+from .metrics import metrics_view
+from .export import export_sites
+from .preview import preview_site
 
 app_name = 'generator'
 
@@ -13,6 +16,11 @@ urlpatterns = [
     path('generator/generate/', views.generate_api, name='generate_api'),
     path('download/<int:site_id>/', views.download_site, name='download_site'),
     path('delete/<int:site_id>/', views.delete_site, name='delete_site'),
+    path('status/<int:site_id>/', views.site_status, name='site_status'),
+    path('edit/<int:site_id>/', views.edit_site, name='edit_site'),
+    path('history/<int:site_id>/', views.site_history, name='site_history'),
+    path('history/<int:site_id>/<int:number>/download/', views.download_revision, name='download_revision'),
+    path('export/', export_sites, name='export_sites'),
     
     # New pages
     path('help/', views.help_center, name='help_center'),
@@ -27,6 +35,14 @@ urlpatterns = [
     path('about/', views.about_us, name='about_us'),
     path('faq/', views.faq, name='faq'),
     path('generation-result/<int:site_id>/', views.generation_result, name='generation_result'),
+    path('preview/<int:site_id>/<str:token>/', preview_site, name='preview_site'),
+    path('preview/<int:site_id>/<str:token>/<path:path>', preview_site, name='preview_site_file'),
     path('subscription/', views.subscription_management, name='subscription_management'),
     path('subscription/cancel/', views.cancel_subscription, name='cancel_subscription'),
+    
+    # REST API
+    path('api/v1/', include((api.urlpatterns, 'api'))),
+
+    # Monitoring
+    path('metrics', metrics_view, name='metrics'),
 ]
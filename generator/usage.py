@@ -0,0 +1,110 @@
+"""
+Token accounting for website generation.
+
+Predicts the ``max_tokens`` budget for a prompt from the completion sizes
+previously observed for the same business category, and aggregates token
+usage per user and per subscription plan for the UserProfile admin (the
+dashboard sums a user's own usage in its stats query).
+"""
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from .models import GeneratedSite
+
+USAGE_FIELDS = ('max_tokens', 'prompt_tokens', 'completion_tokens', 'total_tokens', 'finish_reason')
+
+# Number of recent completions sampled per category, and how many we need
+# before trusting the history over the default budget.
+HISTORY_SAMPLE_SIZE = 200
+MIN_HISTORY_SAMPLES = 20
+
+# If more than this share of the sampled completions were cut off by the
+# budget, the history under-reports the real size and we use the full budget.
+MAX_TRUNCATED_SHARE = 0.05
+
+PREDICTION_CACHE_SECONDS = 300
+
+# The per-plan totals scan every site; the admin summary reuses them this long
+PLAN_USAGE_CACHE_SECONDS = 300
+
+
+def predict_max_tokens(business_type: str) -> int:
+    """Return the completion budget to request for a prompt of this category"""
+    cache_key = "generator:max_tokens:" + (business_type or 'business').replace(' ', '_')
+    predicted = cache.get(cache_key)
+    if predicted is None:
+        predicted = _predict_from_history(business_type)
+        cache.set(cache_key, predicted, PREDICTION_CACHE_SECONDS)
+    return predicted
+
+
+def _predict_from_history(business_type: str) -> int:
+    ceiling = settings.MAX_COMPLETION_TOKENS
+    history = list(
+        GeneratedSite.objects.filter(
+            business_type=business_type,
+            status='completed',
+            completion_tokens__isnull=False,
+            is_premium=False,  # Multi-page sites are billed per page, see multipage.py
+        ).exclude(finish_reason='fallback').order_by('-created_at').values_list('completion_tokens', 'finish_reason')[:HISTORY_SAMPLE_SIZE]
+    )
+    if len(history) < MIN_HISTORY_SAMPLES:
+        return ceiling
+
+    truncated = sum(1 for _, finish_reason in history if finish_reason == 'length')
+    if truncated / len(history) > MAX_TRUNCATED_SHARE:
+        return ceiling
+
+    sizes = sorted(tokens for tokens, _ in history)
+    p95 = sizes[min(len(sizes) - 1, math.ceil(0.95 * len(sizes)) - 1)]
+    budget = int(p95 * settings.MAX_TOKENS_HEADROOM)
+    # Round up to a multiple of 256 so the cached value is stable between samples
+    budget = int(math.ceil(budget / 256.0) * 256)
+    return max(settings.MIN_COMPLETION_TOKENS, min(budget, ceiling))
+
+
+def apply_usage(site, usage: dict):
+    """Copy the usage block returned by generate_website_code() onto a site"""
+    for field in USAGE_FIELDS:
+        if field in usage:
+            setattr(site, field, usage[field])
+
+
+def _usage_totals():
+    return {
+        'sites': Count('id'),
+        'prompt_tokens': Sum('prompt_tokens'),
+        'completion_tokens': Sum('completion_tokens'),
+        'total_tokens': Sum('total_tokens'),
+    }
+
+
+def token_usage_for_user(user_id: int) -> dict:
+    """Token usage summed over all of a user's generated sites"""
+    totals = GeneratedSite.objects.filter(user_id=user_id).aggregate(**_usage_totals())
+    return {key: value or 0 for key, value in totals.items()}
+
+
+def token_usage_by_plan() -> dict:
+    """
+    Token usage summed per subscription plan; anonymous sites are reported as
+    'anonymous'. Cached for PLAN_USAGE_CACHE_SECONDS.
+    """
+    usage = cache.get("generator:token_usage_by_plan")
+    if usage is not None:
+        return usage
+    rows = (
+        GeneratedSite.objects
+        .values('user__userprofile__subscription_plan')
+        .annotate(**_usage_totals())
+        .order_by()
+    )
+    usage = {}
+    for row in rows:
+        plan = row.pop('user__userprofile__subscription_plan') or 'anonymous'
+        usage[plan] = {key: value or 0 for key, value in row.items()}
+    cache.set("generator:token_usage_by_plan", usage, PLAN_USAGE_CACHE_SECONDS)
+    return usage
@@ -1,14 +1,27 @@
 from django.views.decorators.csrf import csrf_exempt
-import os, zipfile, time, uuid, qrcode, io, base64
+import os, zipfile, time, uuid, qrcode, io, base64, hashlib, json
 from decimal import Decimal
 from django.shortcuts import get_object_or_404, render, redirect
+from django.urls import reverse
 from django.http import JsonResponse, Http404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Count, Sum, Q
-from .models import GeneratedSite, UserProfile, Suggestion, Payment
-from .ai_service import generate_website_code, save_website_as_zip
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Sum, Q, F, Max
+from .models import GeneratedSite, UserProfile, Suggestion, Payment, SiteRevision
+from .ai_service import (build_site_package, complete_generation, edit_website, extract_business_type, finish_generation,
+                         generate_fallback_website, mark_failed, save_website_as_zip)
+from .revisions import create_revision, diff_lines, latest_revision_number, revision_codes
+from .edits import EditError
+from .metrics import StageTimer, record_generation, site_edits_total
+from .resilience import TRANSIENT_ERRORS, CircuitOpenError
+from . import background
+from .capture import capture_request
+from .routers import replica_reads
+from .preview import preview_token
+from .storage import archive_storage
+from .archives import release_archives
 from django.conf import settings
 from django.utils import timezone
 from django.http import HttpResponse
@@ -36,12 +49,14 @@ def generate_page(request):
             'profile': profile,
             'remaining_websites': profile.get_remaining_websites(),
             'can_generate': profile.can_generate_website(),
+            'can_generate_multipage': profile.can_generate_multipage(),
         })
     
     return render(request, 'generator/generate.html', context)
 
 
 @csrf_exempt
+@capture_request
 def generate_api(request):
     """API endpoint for website generation"""
     if request.method != "POST":
@@ -54,56 +69,75 @@ def generate_api(request):
     if len(prompt.strip()) < 10:
         return JsonResponse({"error": "Prompt too short. Please provide more details."}, status=400)
     
-    # Check user limits
+    # Check user limits; anonymous users can still generate but won't save to their account
+    profile = None
     if request.user.is_authenticated:
         profile, created = UserProfile.objects.get_or_create(user=request.user)
-        
-        if not profile.can_generate_website():
-            return JsonResponse({
-                "error": "You've reached your free website generation limit. Please upgrade to continue creating amazing websites!",
-                "upgrade_required": True,
-                "redirect_url": "/pricing/",
-                "subscription_plans_url": "/pricing/"
-            }, status=403)
-    else:
-        # For anonymous users, we can still generate but won't save to their account
-        pass
+
+    multipage = request.POST.get('multipage') in ('true', 'on', '1')
+    if multipage and not (profile and profile.can_generate_multipage()):
+        return JsonResponse({
+            "error": "Multi-page websites are part of the Premium plan. Upgrade to add about, services and contact pages!",
+            "upgrade_required": True,
+            "redirect_url": "/pricing/",
+            "subscription_plans_url": "/pricing/"
+        }, status=403)
+    
+    timings = StageTimer()
+    timings.add('queue_wait', time.perf_counter() - getattr(request, 'metrics_started_at', time.perf_counter()))
     
     try:
         start_time = time.time()
         
         # Create pending record
-        site = GeneratedSite.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            prompt=prompt,
-            status="pending"
-        )
-        
-        # Call OpenAI
-        code = generate_website_code(prompt)
-        
-        generation_time = time.time() - start_time
-        
-        if code.startswith("Error:"):
-            site.status = "failed"
-            site.save()
-            return JsonResponse({"error": code}, status=500)
-        
-        # Save as professional .zip file with proper structure
-        site.generation_time = generation_time
-        save_website_as_zip(site, code)
-        
-        # Decrement user usage if authenticated
-        if request.user.is_authenticated:
-            profile.decrement_usage()
+        business_type = extract_business_type(prompt)
+        with timings.stage('db_persist'), transaction.atomic():
+            # Charged now, not when the background job finishes: queued jobs cannot overspend the quota
+            if profile and not profile.reserve_generation():
+                return JsonResponse({
+                    "error": "You've reached your free website generation limit. Please upgrade to continue creating amazing websites!",
+                    "upgrade_required": True,
+                    "redirect_url": "/pricing/",
+                    "subscription_plans_url": "/pricing/"
+                }, status=402)
+            site = GeneratedSite.objects.create(
+                user=request.user if request.user.is_authenticated else None,
+                prompt=prompt,
+                status="pending",
+                business_type=business_type,
+                is_premium=multipage,
+                quota_charged=profile is not None
+            )
+        request.generated_site = site
+        keep_sources = request.POST.get('keep_sources')
+        keep_sources = keep_sources in ('true', 'on', '1') if keep_sources else None
+
+        if settings.PROGRESSIVE_GENERATION:
+            # Instant draft from the template engine; the LLM page replaces it in the background
+            draft_started = time.perf_counter()
+            save_website_as_zip(site, generate_fallback_website(prompt), keep_sources=keep_sources, status="draft")
+            timings.add('draft', time.perf_counter() - draft_started)
+            background.submit(complete_generation, site.id, keep_sources=keep_sources, started=start_time,
+                              stages=timings.stages, multipage=multipage)
+            message = "Draft ready! The AI version replaces it in a moment."
+        else:
+            # Call OpenAI with a completion budget sized from past sites of the same type
+            error = finish_generation(site, timings, keep_sources=keep_sources, started=start_time,
+                                      multipage=multipage)
+            if error:
+                return JsonResponse({"error": error}, status=500)
+            message = "Website generated successfully!"
+        generation_time = site.generation_time or time.time() - start_time
         
         # Return JSON for API calls or redirect for web interface
         if request.headers.get('Content-Type') == 'application/json' or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({
                 "site_id": site.id,
-                "download_url": site.generated_file.url,
+                "status": site.status,
+                "status_url": reverse('generator:site_status', args=[site.id]),
+                "download_url": reverse('generator:download_site', args=[site.id]),
                 "generation_time": round(generation_time, 2),
-                "message": "Website generated successfully!",
+                "message": message,
                 "redirect_url": f"/generation-result/{site.id}/"
             })
         else:
@@ -113,19 +147,20 @@ def generate_api(request):
     except Exception as e:
         # Update site status to failed
         if 'site' in locals():
-            site.status = "failed"
-            site.save()
+            mark_failed(site)
+            record_generation(site, timings)
         
         return JsonResponse({"error": f"Generation failed: {str(e)}"}, status=500)
 
 
 @login_required
+@replica_reads
 def dashboard(request):
     """User dashboard view"""
     profile, created = UserProfile.objects.get_or_create(user=request.user)
     
-    # Get user's generated sites
-    sites_list = GeneratedSite.objects.filter(user=request.user)
+    # Get user's generated sites (the listing never shows the stored code)
+    sites_list = GeneratedSite.objects.filter(user=request.user).defer('generated_code', 'pages', 'stage_timings')
     
     # Filter by status if requested
     status_filter = request.GET.get('status')
@@ -139,29 +174,32 @@ def dashboard(request):
             Q(prompt__icontains=search_query)
         )
     
-    # Pagination
+    # Calculate statistics in a single query
+    stats = sites_list.aggregate(
+        total_sites=Count('id'),
+        completed_sites=Count('id', filter=Q(status='completed')),
+        total_downloads=Sum('downloads_count'),
+        total_tokens=Sum('total_tokens'),
+    )
+    
+    # Pagination (reuses the count above instead of running its own COUNT query)
     paginator = Paginator(sites_list, 12)  # 12 sites per page
+    paginator.count = stats['total_sites']
     page_number = request.GET.get('page')
     sites = paginator.get_page(page_number)
     
-    # Calculate statistics
-    total_sites = sites_list.count()
-    completed_sites = sites_list.filter(status='completed').count()
-    total_downloads = sites_list.aggregate(
-        downloads=Sum('downloads_count')
-    )['downloads'] or 0
-    
     days_since_joined = (timezone.now() - request.user.date_joined).days
     
     context = {
         'profile': profile,
         'sites': sites,
-        'total_sites': total_sites,
-        'completed_sites': completed_sites,
-        'total_downloads': total_downloads,
+        'total_sites': stats['total_sites'],
+        'completed_sites': stats['completed_sites'],
+        'total_downloads': stats['total_downloads'] or 0,
         'days_since_joined': days_since_joined,
         'remaining_websites': profile.get_remaining_websites(),
         'can_generate': profile.can_generate_website(),
+        'total_tokens': stats['total_tokens'] or 0,
     }
     
     return render(request, 'generator/dashboard.html', context)
@@ -174,20 +212,18 @@ def download_site(request, site_id):
         site = get_object_or_404(GeneratedSite, id=site_id)
         
         # Check if user has permission to download
-        if site.user and site.user != request.user and not request.user.is_staff:
+        if site.user_id and site.user_id != request.user.id and not request.user.is_staff:
             raise Http404("Site not found")
         
-        # Increment download count
-        site.downloads_count += 1
-        site.save()
+        # Increment download count without rewriting the whole row (resumed downloads count once)
+        if 'Range' not in request.headers:
+            GeneratedSite.objects.filter(id=site.id).update(downloads_count=F('downloads_count') + 1)
         
         if site.generated_file:
-            response = HttpResponse(
-                site.generated_file.read(),
-                content_type='application/zip'
-            )
-            response['Content-Disposition'] = f'attachment; filename="website_{site.id}.zip"'
-            return response
+            # Streamed, handed to the web server or redirected to object storage, per backend
+            return archive_storage.download_response(site.generated_file.name, f"website_{site.id}.zip",
+                                                     range_header=request.headers.get('Range'),
+                                                     if_range=request.headers.get('If-Range'))
         else:
             raise Http404("File not found")
             
@@ -195,21 +231,46 @@ def download_site(request, site_id):
         raise Http404("Site not found")
 
 
+def site_status(request, site_id):
+    """JSON status of a generation, polled by API clients until it completes"""
+    site = get_object_or_404(
+        GeneratedSite.objects.only('id', 'user_id', 'status', 'generated_file', 'archive_sha256', 'generation_time'),
+        id=site_id,
+    )
+    if site.user_id and site.user_id != request.user.id and not request.user.is_staff:
+        raise Http404("Site not found")
+
+    data = {"site_id": site.id, "status": site.status}
+    if site.status == 'completed' and site.generated_file:
+        data.update({
+            "download_url": reverse('generator:download_site', args=[site.id]),
+            "archive_sha256": site.archive_sha256,
+            "generation_time": round(site.generation_time, 2) if site.generation_time else None,
+        })
+    if site.status in ('draft', 'completed') and site.generated_file:
+        # Versioned, so the result page can swap its preview when the final page replaces the draft
+        try:
+            data["preview_url"] = reverse('generator:preview_site', args=[site.id, preview_token(site)])
+        except OSError:
+            pass
+    return JsonResponse(data)
+
+
 @login_required
 def delete_site(request, site_id):
     """Delete a generated website"""
     if request.method == 'POST':
-        site = get_object_or_404(GeneratedSite, id=site_id, user=request.user)
-        
-        # Delete the file if it exists
-        if site.generated_file:
-            try:
-                site.generated_file.delete()
-            except:
-                pass
-        
-        # Delete the database record
-        site.delete()
+        # Locked, so a background generation finishing right now cannot also release the draft's archive
+        with transaction.atomic():
+            site = get_object_or_404(GeneratedSite.objects.select_for_update(), id=site_id, user=request.user)
+            
+            # Drop this site's reference once the delete commits; the archive goes once no other site shares it
+            if site.generated_file:
+                reference = (site.generated_file.name, site.archive_sha256)
+                transaction.on_commit(lambda: release_archives([reference]), robust=True)
+            
+            # Delete the database record
+            site.delete()
         
         messages.success(request, 'Website deleted successfully.')
         
@@ -221,6 +282,138 @@ def delete_site(request, site_id):
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
 
+@login_required
+def edit_site(request, site_id):
+    """Apply an edit instruction to a completed site as a new revision, without regenerating it"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    wants_json = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+    def failure(error, status):
+        if wants_json:
+            return JsonResponse({'error': error}, status=status)
+        messages.error(request, error)
+        return redirect('generator:generation_result', site_id=site_id)
+
+    site = get_object_or_404(GeneratedSite, id=site_id, user=request.user)
+    instruction = (request.POST.get('instruction') or '').strip()
+    if len(instruction) < 5:
+        return failure("Please describe the change you want.", 400)
+    if site.status != 'completed' or not site.generated_code:
+        return failure("Only completed websites can be edited.", 409)
+
+    base = latest_revision_number(site)
+    start_time = time.time()
+    usage = {}
+    try:
+        code = edit_website(site.generated_code, instruction, usage=usage)
+    except EditError as e:
+        site_edits_total.inc(outcome='rejected')
+        return failure(f"That edit could not be applied ({e}). Try describing it differently.", 422)
+    except (CircuitOpenError, *TRANSIENT_ERRORS):
+        site_edits_total.inc(outcome='unavailable')
+        return failure("The AI service is busy right now. Please try again in a moment.", 503)
+    except Exception as e:
+        return failure(f"Edit failed: {str(e)}", 500)
+
+    try:
+        with transaction.atomic():
+            if base == 1 and not site.revisions.exists():
+                create_revision(site, 1, site.generated_code,
+                                usage={'prompt_tokens': site.prompt_tokens, 'completion_tokens': site.completion_tokens,
+                                       'total_tokens': site.total_tokens})
+            # Unique per site: a concurrent edit of the same revision fails here instead of being lost
+            revision = create_revision(site, base + 1, code, parent_code=site.generated_code,
+                                       instruction=instruction, usage=usage)
+            save_website_as_zip(site, code)
+    except IntegrityError:
+        return failure("The website was changed by another edit meanwhile. Reload and try again.", 409)
+    except GeneratedSite.DoesNotExist:
+        raise Http404("Site not found")
+    site_edits_total.inc(outcome='applied')
+
+    if wants_json:
+        try:
+            preview_url = reverse('generator:preview_site', args=[site.id, preview_token(site)])
+        except OSError:
+            preview_url = None
+        return JsonResponse({
+            'site_id': site.id,
+            'revision': revision.number,
+            'preview_url': preview_url,
+            'download_url': reverse('generator:download_site', args=[site.id]),
+            'edit_time': round(time.time() - start_time, 2),
+            'total_tokens': usage.get('total_tokens'),
+            'message': f"Revision {revision.number} saved.",
+        })
+    messages.success(request, f"Revision {revision.number} saved.")
+    return redirect('generator:generation_result', site_id=site.id)
+
+
+@login_required
+@replica_reads
+def site_history(request, site_id):
+    """A site's revisions, with the diff between two of them (by default the latest edit)"""
+    site = get_object_or_404(GeneratedSite, id=site_id, user=request.user)
+    revisions = list(site.revisions.defer('data'))
+    latest = revisions[0].number if revisions else 1
+    try:
+        new = int(request.GET.get('to', latest))
+        old = int(request.GET.get('from', new - 1))
+    except ValueError:
+        raise Http404("Revision not found")
+
+    diff = None
+    if 1 <= old < new <= latest:
+        try:
+            codes = revision_codes(site, {old, new})
+        except SiteRevision.DoesNotExist:
+            raise Http404("Revision not found")
+        diff = diff_lines(codes[old], codes[new])
+
+    context = {
+        'site': site,
+        'revisions': revisions,
+        'latest': latest,
+        'diff_from': old,
+        'diff_to': new,
+        'diff': diff,
+        'added': sum(1 for kind, line in diff or () if kind == 'add'),
+        'removed': sum(1 for kind, line in diff or () if kind == 'del'),
+        'page_title': 'Revision History',
+    }
+    return render(request, 'generator/site_history.html', context)
+
+
+@login_required
+@replica_reads
+def download_revision(request, site_id, number):
+    """ZIP of one revision of a site, built on demand (the latest is the site's stored archive)"""
+    site = get_object_or_404(GeneratedSite, id=site_id, user=request.user)
+    if number == latest_revision_number(site):
+        return redirect('generator:download_site', site_id=site.id)
+    code_sha256 = site.revisions.filter(number=number).values_list('code_sha256', flat=True).first()
+    if code_sha256 is None:
+        raise Http404("Revision not found")
+
+    # The other pages of a multi-page site are not versioned; the current ones are packaged with it.
+    # The ETag is known from the inputs of the deterministic packaging, so a revalidation builds nothing
+    etag = 'W/"{}"'.format(hashlib.sha256(json.dumps(
+        [code_sha256, site.pages, settings.SITE_MINIFY, settings.SITE_PRECOMPRESS, settings.SITE_KEEP_SOURCES],
+        sort_keys=True).encode()).hexdigest())
+    if request.headers.get('If-None-Match') == etag:
+        return HttpResponse(status=304)
+    try:
+        code = revision_codes(site, {number})[number]
+    except SiteRevision.DoesNotExist:
+        raise Http404("Revision not found")
+    result = build_site_package(code, pages=site.pages)
+    response = HttpResponse(result['archive'], content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="website_{site.id}_r{number}.zip"'
+    response['ETag'] = etag
+    return response
+
+
 # ============== NEW PAGES ==============
 
 def help_center(request):
@@ -257,6 +450,7 @@ def contact_us(request):
     return render(request, 'pages/contact_us.html', context)
 
 
+@replica_reads
 def suggestion_box(request):
     """Suggestion box for user feedback"""
     if request.method == 'POST':
@@ -516,6 +710,7 @@ def privacy_policy(request):
     return render(request, 'pages/privacy_policy.html', context)
 
 
+@replica_reads
 def about_us(request):
     """About Us page"""
     context = {
@@ -565,6 +760,7 @@ def faq(request):
 
 
 @login_required
+@replica_reads
 def subscription_management(request):
     """Subscription management page for users to view and manage their subscription"""
     profile, created = UserProfile.objects.get_or_create(user=request.user)
@@ -611,16 +807,24 @@ def cancel_subscription(request):
 def generation_result(request, site_id):
     """Enhanced website generation result page with animations"""
     try:
-        site = get_object_or_404(GeneratedSite, id=site_id)
+        # The latest revision number comes with the site row instead of a query of its own
+        site = get_object_or_404(GeneratedSite.objects.annotate(revision_number=Max('revisions__number')), id=site_id)
         
         # Check if user has permission to view this result
-        if site.user and site.user != request.user and not request.user.is_staff:
+        if site.user_id and site.user_id != request.user.id and not request.user.is_staff:
             raise Http404("Site not found")
         
+        try:
+            preview_url = reverse('generator:preview_site', args=[site.id, preview_token(site)]) if site.generated_file else None
+        except OSError:
+            preview_url = None
+        
         context = {
             'site': site,
             'site_id': site.id,
             'generation_time': site.generation_time,
+            'preview_url': preview_url,
+            'revision_number': site.revision_number or 1,
             'page_title': 'Website Generated Successfully',
         }
         
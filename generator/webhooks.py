@@ -0,0 +1,309 @@
+"""
+Webhook callbacks when a site finishes.
+
+Accounts register endpoints (POST /api/v1/webhooks/) instead of polling.
+When a site reaches 'completed' or 'failed', enqueue_event() writes one
+WebhookDelivery per active endpoint of the owner in the transaction that
+changed the status (an outbox). An event therefore exists exactly when the
+status change committed, and it survives a crash before delivery.
+
+The dispatcher delivers due rows:
+
+- it leases a batch by moving each row's next_attempt_at past the delivery
+  timeout (SELECT ... SKIP LOCKED where the database has it, else a
+  compare-and-set UPDATE per row), so concurrent dispatchers never send
+  the same attempt twice and the lease of a crashed one simply expires;
+- it POSTs the JSON payloads on WEBHOOK_WORKERS threads, each signed with
+  the endpoint's secret:
+  X-Webhook-Signature: t=<unix time>,v1=<hex HMAC-SHA256 of "<t>.<body>">;
+- a 2xx answer marks the row delivered. Anything else (redirects included)
+  is retried after an exponential, jittered backoff, until
+  WEBHOOK_MAX_ATTEMPTS; the row is then kept as 'dead', the dead letter log
+  owners and admins can inspect and redeliver.
+
+Each web process runs the dispatcher on a daemon thread. The thread is
+woken when a commit enqueues events, and polls every WEBHOOK_POLL_SECONDS
+for retries and for events enqueued by other processes.
+`python manage.py deliver_webhooks` does one pass from cron instead.
+Delivery is at least once: receivers should dedupe on the payload's id.
+
+Endpoints are user-supplied URLs the server connects to, so they are
+checked twice. At registration the URL must be https (http too with
+WEBHOOK_ALLOW_HTTP), and its host must resolve only to public addresses.
+At connect time the host is resolved again and the socket goes to the
+vetted address, so a DNS record rebound to 127.0.0.1 or 169.254.169.254
+after registration is refused. Redirects and proxies are not followed.
+Owners only see the HTTP status of an attempt, never the connection
+error text.
+"""
+
+import hashlib
+import hmac
+import http.client
+import ipaddress
+import json
+import random
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from .metrics import webhook_deliveries_total
+from .models import Webhook, WebhookDelivery
+
+# Site status -> event name
+EVENTS = {'completed': 'site.completed', 'failed': 'site.failed'}
+# Added to WEBHOOK_TIMEOUT for the lease of a claimed delivery
+LEASE_MARGIN_SECONDS = 60
+
+
+def site_payload(site, event: str) -> dict:
+    ready = site.status == 'completed' and site.generated_file
+    return {
+        'id': uuid.uuid4().hex,
+        'event': event,
+        'created_at': timezone.now().isoformat(),
+        'site': {
+            'id': site.id,
+            'status': site.status,
+            'prompt': site.prompt,
+            'business_type': site.business_type,
+            'archive_sha256': site.archive_sha256 or None,
+            'generation_time': site.generation_time,
+            'total_tokens': site.total_tokens,
+            'status_url': reverse('generator:api:site-status', args=[site.id]),
+            'download_url': reverse('generator:api:site-download', args=[site.id]) if ready else None,
+        },
+    }
+
+
+def enqueue_event(site) -> int:
+    """
+    Queue the event for the site's current status to every active endpoint
+    of its owner. Call it inside the transaction that saved the status.
+    Returns the number of deliveries queued.
+    """
+    event = EVENTS.get(site.status)
+    if event is None or not site.user_id:
+        return 0
+    webhook_ids = list(Webhook.objects.filter(user_id=site.user_id, is_active=True).values_list('id', flat=True))
+    if not webhook_ids:
+        return 0
+    payload = site_payload(site, event)
+    WebhookDelivery.objects.bulk_create([
+        WebhookDelivery(webhook_id=webhook_id, site_id=site.id, event=event, payload=payload)
+        for webhook_id in webhook_ids
+    ])
+    transaction.on_commit(wake_dispatcher)
+    return len(webhook_ids)
+
+
+def sign(secret: str, timestamp: int, body: bytes) -> str:
+    digest = hmac.new(secret.encode('utf-8'), f"{timestamp}.".encode('utf-8') + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds before attempt attempts + 1: doubling from WEBHOOK_BACKOFF_SECONDS, capped, +-20% jitter"""
+    delay = min(settings.WEBHOOK_MAX_BACKOFF_SECONDS, settings.WEBHOOK_BACKOFF_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_due(limit: int = None) -> list:
+    """Lease up to `limit` due deliveries to this process, with their webhooks"""
+    limit = limit or settings.WEBHOOK_BATCH_SIZE
+    now = timezone.now()
+    lease = now + timedelta(seconds=settings.WEBHOOK_TIMEOUT + LEASE_MARGIN_SECONDS)
+    due = WebhookDelivery.objects.filter(status='pending', next_attempt_at__lte=now).order_by('next_attempt_at')
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(due.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            WebhookDelivery.objects.filter(id__in=ids).update(next_attempt_at=lease)
+    else:
+        # Of two dispatchers racing for a row, only the first moves its next_attempt_at
+        ids = [pk for pk, due_at in due.values_list('id', 'next_attempt_at')[:limit]
+               if WebhookDelivery.objects.filter(id=pk, next_attempt_at=due_at).update(next_attempt_at=lease)]
+    return list(WebhookDelivery.objects.filter(id__in=ids).select_related('webhook').order_by('id'))
+
+
+class UnsafeWebhookURL(ValueError):
+    """The URL's scheme or resolved address is not allowed as a webhook target"""
+
+
+def check_scheme(url: str):
+    scheme = urllib.parse.urlsplit(url).scheme.lower()
+    if scheme != 'https' and not (scheme == 'http' and settings.WEBHOOK_ALLOW_HTTP):
+        raise UnsafeWebhookURL("Webhook URLs must use https.")
+
+
+def vetted_address(host: str, port: int) -> str:
+    """An address of `host` to connect to; raises UnsafeWebhookURL unless every address it resolves to is public"""
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        raise UnsafeWebhookURL(f"{host} does not resolve.")
+    addresses = [info[4][0] for info in infos]
+    if not settings.WEBHOOK_ALLOW_PRIVATE_ADDRESSES:
+        for address in addresses:
+            ip = ipaddress.ip_address(address.split('%')[0])
+            if not ip.is_global or ip.is_multicast:
+                raise UnsafeWebhookURL("Webhook URLs must resolve to public addresses.")
+    return addresses[0]
+
+
+def check_webhook_url(url: str):
+    """Registration-time check of a webhook target: scheme, then every resolved address"""
+    check_scheme(url)
+    parts = urllib.parse.urlsplit(url)
+    if not parts.hostname:
+        raise UnsafeWebhookURL("Webhook URLs need a host.")
+    vetted_address(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+
+
+class _VettedHTTPConnection(http.client.HTTPConnection):
+    """Resolves and checks the host again when connecting: the DNS answer may have changed since registration"""
+
+    def connect(self):
+        self.sock = socket.create_connection((vetted_address(self.host, self.port), self.port), self.timeout,
+                                             self.source_address)
+
+
+class _VettedHTTPSConnection(http.client.HTTPSConnection):
+    def connect(self):
+        sock = socket.create_connection((vetted_address(self.host, self.port), self.port), self.timeout,
+                                        self.source_address)
+        # The certificate is still checked against the host name
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+class _VettedHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_VettedHTTPConnection, req)
+
+
+class _VettedHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_VettedHTTPSConnection, req, context=self._context)
+
+
+class _NoRedirects(urllib.request.HTTPRedirectHandler):
+    """A redirect would turn the POST into a GET and could point anywhere: report it as a failed attempt instead"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+# No proxies: the connection must go to the vetted address itself
+_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}), _VettedHTTPHandler, _VettedHTTPSHandler,
+                                      _NoRedirects)
+
+
+def post_delivery(delivery) -> tuple:
+    """POST one delivery; returns (HTTP status or None, error message)"""
+    try:
+        check_scheme(delivery.webhook.url)
+    except UnsafeWebhookURL as e:
+        return None, str(e)
+    body = json.dumps(delivery.payload, separators=(',', ':')).encode('utf-8')
+    request = urllib.request.Request(delivery.webhook.url, data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'User-Agent': 'ai-webgen-webhooks/1',
+        'X-Webhook-Event': delivery.event,
+        'X-Webhook-Delivery': str(delivery.id),
+        'X-Webhook-Signature': sign(delivery.webhook.secret, int(time.time()), body),
+    })
+    try:
+        with _opener.open(request, timeout=settings.WEBHOOK_TIMEOUT) as response:
+            return response.status, ''
+    except urllib.error.HTTPError as e:
+        return e.code, f"HTTP {e.code}"
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        return None, str(getattr(e, 'reason', e))[:500]
+
+
+def record_attempt(delivery, status_code, error: str) -> str:
+    """Store the outcome of one attempt: 'delivered', 'retry' or 'dead'"""
+    now = timezone.now()
+    delivery.attempts += 1
+    delivery.last_status_code = status_code
+    delivery.last_error = error
+    if status_code is not None and 200 <= status_code < 300:
+        outcome = delivery.status = 'delivered'
+        delivery.delivered_at = now
+    elif delivery.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+        outcome = delivery.status = 'dead'
+        print(f"⚠️  Webhook delivery {delivery.id} to {delivery.webhook.url} is dead after "
+              f"{delivery.attempts} attempts: {error}")
+    else:
+        outcome = 'retry'
+        delivery.next_attempt_at = now + timedelta(seconds=retry_delay(delivery.attempts))
+    delivery.save(update_fields=['status', 'attempts', 'last_status_code', 'last_error', 'next_attempt_at',
+                                 'delivered_at'])
+    webhook_deliveries_total.inc(outcome=outcome)
+    return outcome
+
+
+def dispatch(limit: int = None) -> dict:
+    """One dispatcher pass over the due deliveries; returns {outcome: count}"""
+    deliveries = claim_due(limit)
+    if not deliveries:
+        return {}
+    # Only the HTTP calls run on the pool; their outcomes are written from this thread
+    with ThreadPoolExecutor(max_workers=min(settings.WEBHOOK_WORKERS, len(deliveries)),
+                            thread_name_prefix='webhook') as pool:
+        results = list(pool.map(post_delivery, deliveries))
+    outcomes = {}
+    for delivery, (status_code, error) in zip(deliveries, results):
+        outcome = record_attempt(delivery, status_code, error)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return outcomes
+
+
+def redeliver(deliveries) -> int:
+    """Queue dead (or delivered) deliveries again, with a fresh set of attempts"""
+    count = deliveries.exclude(status='pending').update(status='pending', attempts=0, next_attempt_at=timezone.now())
+    if count:
+        transaction.on_commit(wake_dispatcher)
+    return count
+
+
+_wakeup = threading.Event()
+_dispatcher = None
+
+
+def wake_dispatcher():
+    _wakeup.set()
+
+
+def _run_dispatcher(interval):
+    while True:
+        _wakeup.wait(interval)
+        _wakeup.clear()
+        try:
+            # Keep going while passes come back full
+            while sum(dispatch().values()) >= settings.WEBHOOK_BATCH_SIZE:
+                pass
+        except Exception as e:
+            print(f"⚠️ Webhook dispatch failed: {e}")
+        finally:
+            close_old_connections()
+
+
+def start_dispatcher():
+    """Start the webhook dispatcher thread once per process, when WEBHOOK_POLL_SECONDS is set"""
+    global _dispatcher
+    interval = settings.WEBHOOK_POLL_SECONDS
+    if interval <= 0 or _dispatcher is not None:
+        return
+    _dispatcher = threading.Thread(target=_run_dispatcher, args=(interval,), name='webhook-dispatcher', daemon=True)
+    _dispatcher.start()